@@ -0,0 +1,526 @@
+# api_server.py
+# Standalone HTTP API over the same generator, batching scheduler and output
+# pipeline as the Streamlit app. Standard library asyncio only.
+#
+#   python api_server.py                     # pipeline from config/model_config.json
+#   python api_server.py --stub --port 8000  # stub generator, no torch needed
+#
+#   POST   /v1/jobs                              submit; 202, or 429 when the queue is full
+#   GET    /v1/jobs/<id>                         status, progress and result links
+#   GET    /v1/jobs/<id>/images/<n>?format=png   image bytes (deferred formats made on demand)
+#   DELETE /v1/jobs/<id>                         cancel
+#   GET    /healthz                              200 once the model is ready, 503 before
+#   GET    /metrics                              Prometheus text
+#
+#   curl -s localhost:8000/v1/jobs -d '{"prompt": "a lighthouse at dawn", "num_inference_steps": 20}'
+#
+# "deadline_s" asks for the job to finish within that many seconds of being
+# submitted; steps are cut to fit (the result's "steps_used") or the job
+# fails if even a few steps won't make it.
+import re
+import json
+import time
+import uuid
+import asyncio
+import argparse
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+from batching import scheduler_from_config
+from catalog import get_catalog
+from output_formats import FORMATS, OutputPolicy
+from postprocess import OutputPipeline
+from schedulers import SCHEDULERS
+from storage import get_output_store, migration_enabled, storage_config
+from telemetry import MetricsRegistry
+from utils import is_prompt_allowed, load_config, make_seeds
+
+MAX_BODY_BYTES = 64 * 1024
+MAX_HEADERS = 100
+READ_TIMEOUT_S = 10
+
+FINISHED = ("done", "failed", "cancelled")
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: dict = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class Job:
+    def __init__(self, request: dict):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.status = "queued"
+        self.error = None
+        self.progress = {}
+        self.results = []  # ProcessedImage per image
+        self.future = None  # the BatchingScheduler future once submitted
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def finish(self, status: str, error: str = None):
+        if not self.finished:
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+
+    def to_dict(self) -> dict:
+        result = {
+            "id": self.id,
+            "status": self.status,
+            "request": self.request,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress,
+            "error": self.error,
+            "images": []
+        }
+        for index, processed in enumerate(self.results):
+            result["images"].append({
+                "index": index,
+                "seed": processed.metadata["parameters"].get("seed"),
+                "formats": {
+                    fmt: f"/v1/jobs/{self.id}/images/{index}?format={fmt}" for fmt in processed.policy.formats
+                }
+            })
+        return result
+
+
+class Backend:
+    # The generator the jobs run on: a ModelLoader that loads the configured
+    # pipeline pool in the background, or a ready generator (the stub)
+    def __init__(self, config: dict, loader=None, generator=None):
+        self.config = config
+        self.loader = loader
+        self.generator = generator
+        self._scheduler = None
+
+    @property
+    def ready(self) -> bool:
+        return self.generator is not None or self.loader.ready
+
+    @property
+    def failed(self) -> bool:
+        return self.loader is not None and self.loader.failed
+
+    @property
+    def status(self) -> str:
+        return "ready" if self.generator is not None else self.loader.status
+
+    @property
+    def scheduler(self):
+        if self._scheduler is None:
+            self._scheduler = scheduler_from_config(self.loader.pool if self.loader else self.generator, self.config)
+        return self._scheduler
+
+
+class JobManager:
+    # Owns the jobs: admission against a bounded queue, running them on the
+    # batching scheduler, watermarking/saving results, cancellation and
+    # expiry of finished jobs.
+
+    def __init__(self, backend: Backend, output_pipeline: OutputPipeline, metrics: MetricsRegistry,
+                 models: dict = None, max_queue: int = 16, max_images: int = 4,
+                 output_dir: str = "outputs/api", job_ttl_s: float = 3600):
+        self.backend = backend
+        self.output_pipeline = output_pipeline
+        self.metrics = metrics
+        self.models = models
+        self.max_queue = max_queue
+        self.max_images = max_images
+        self.output_dir = output_dir
+        self.job_ttl_s = job_ttl_s
+        self.jobs = {}
+        self.counts = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0, "cancelled": 0}
+        self._tasks = set()
+
+    def active(self) -> list:
+        return [job for job in self.jobs.values() if not job.finished]
+
+    def validate(self, payload) -> dict:
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "Expected a JSON object")
+        prompt = payload.get("prompt")
+        if not isinstance(prompt, str) or not prompt.strip():
+            raise HTTPError(400, "'prompt' must be a non-empty string")
+        if not is_prompt_allowed(prompt):
+            raise HTTPError(400, "Prompt contains blocked terms")
+
+        def number(name, default, kind, low, high):
+            value = payload.get(name, default)
+            try:
+                value = kind(value)
+            except (TypeError, ValueError):
+                raise HTTPError(400, f"'{name}' must be a number")
+            if not low <= value <= high:
+                raise HTTPError(400, f"'{name}' must be between {low} and {high}")
+            return value
+
+        defaults = self.backend.config.get("default_generation_params", {})
+        size = self.backend.config.get("image_size", {})
+        request = {
+            "prompt": prompt,
+            "negative_prompt": str(payload.get("negative_prompt") or ""),
+            "num_images": number("num_images", defaults.get("num_images", 1), int, 1, self.max_images),
+            "guidance_scale": number("guidance_scale", defaults.get("guidance_scale", 7.5), float, 0.0, 30.0),
+            "num_inference_steps": number("num_inference_steps", defaults.get("num_inference_steps", 30), int, 1, 150),
+            "height": number("height", size.get("default_height", 512), int, 64, 1024),
+            "width": number("width", size.get("default_width", 512), int, 64, 1024),
+            "seed": None if payload.get("seed") is None else number("seed", None, int, 0, 2 ** 32 - 1),
+            "deadline_s": None if payload.get("deadline_s") is None else number("deadline_s", None, float, 0.1, 3600),
+            "scheduler": payload.get("scheduler") or None,
+            "model": payload.get("model") or None
+        }
+        if request["height"] % 8 or request["width"] % 8:
+            raise HTTPError(400, "'height' and 'width' must be multiples of 8")
+        if request["scheduler"] is not None and request["scheduler"] not in SCHEDULERS:
+            raise HTTPError(400, f"Unknown scheduler; choose from {', '.join(SCHEDULERS)}")
+        if request["model"] is not None and self.models is not None and request["model"] not in self.models:
+            raise HTTPError(400, f"Unknown model; choose from {', '.join(self.models)}")
+        return request
+
+    def submit(self, payload) -> Job:
+        request = self.validate(payload)
+        self.expire()
+        if len(self.active()) >= self.max_queue:
+            self.counts["rejected"] += 1
+            self.update_gauges()
+            # A rough hint: one average generation frees a slot
+            retry_after = max(1, round(self.metrics.mean_step_s() * request["num_inference_steps"]))
+            raise HTTPError(429, "Queue is full, retry later", {"Retry-After": str(retry_after)})
+
+        job = Job(request)
+        self.jobs[job.id] = job
+        self.counts["submitted"] += 1
+        task = asyncio.get_running_loop().create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self.update_gauges()
+        return job
+
+    async def _run(self, job: Job):
+        request = job.request
+        try:
+            while not self.backend.ready:
+                if self.backend.failed:
+                    raise RuntimeError(f"Model failed to load: {self.backend.loader.error}")
+                if job.finished:
+                    return
+                await asyncio.sleep(0.25)
+            if job.finished:
+                return
+
+            seeds = make_seeds(request["seed"], request["num_images"])
+
+            def on_progress(telemetry):
+                # Called on the scheduler's worker thread
+                if job.started_at is None:
+                    job.started_at = time.time()
+                    job.status = "running" if not job.finished else job.status
+                job.progress = {
+                    "step": telemetry.step, "total_steps": telemetry.total_steps, "eta_s": telemetry.eta_s,
+                    "steps_used": telemetry.steps_used
+                }
+
+            job.future = self.backend.scheduler.submit(
+                prompt=request["prompt"],
+                negative_prompt=request["negative_prompt"],
+                num_images=request["num_images"],
+                guidance_scale=request["guidance_scale"],
+                num_inference_steps=request["num_inference_steps"],
+                height=request["height"],
+                width=request["width"],
+                seeds=seeds,
+                scheduler=request["scheduler"],
+                on_progress=on_progress,
+                model=request["model"],
+                deadline_s=request["deadline_s"]
+            )
+            images = await asyncio.wrap_future(job.future)
+            if job.finished:
+                # Cancelled while running: nobody wants the images
+                return
+
+            generator = self.backend.generator or self.backend.loader.pool.peek(request["model"])
+            params = {
+                "guidance_scale": request["guidance_scale"],
+                "steps": request["num_inference_steps"],
+                "steps_used": job.future.request.telemetry.steps_used,
+                "deadline_s": request["deadline_s"],
+                "height": request["height"],
+                "width": request["width"],
+                "device": getattr(generator, "device", None),
+                "model": getattr(generator, "model_name", request["model"]),
+                "scheduler": request["scheduler"] or getattr(generator, "default_scheduler", None),
+                "job_id": job.id
+            }
+            futures = [
+                self.output_pipeline.submit(
+                    image, base_dir=self.output_dir, prompt=request["prompt"],
+                    negative_prompt=request["negative_prompt"], params=dict(params, seed=seed), index=index
+                )
+                for index, (image, seed) in enumerate(zip(images, seeds))
+            ]
+            job.results = [await asyncio.wrap_future(f) for f in futures]
+            await asyncio.gather(*(asyncio.wrap_future(p.saved) for p in job.results))
+            job.finish("done")
+        except asyncio.CancelledError:
+            # Marked, then passed on so that shutting the server down can
+            # wait for this task to end
+            job.finish("cancelled")
+            raise
+        except Exception as e:
+            job.finish("failed", repr(e))
+        finally:
+            if job.status in self.counts:
+                self.counts[job.status] += 1
+            self.update_gauges()
+
+    def cancel(self, job: Job):
+        # Queued jobs are dropped before they reach the pipeline; a running
+        # job stops at its next step unless it shares its batch with others
+        if job.finished:
+            return
+        if job.future is not None:
+            self.backend.scheduler.cancel(job.future)
+        job.finish("cancelled")
+        self.update_gauges()
+
+    async def expire_periodically(self):
+        # Finished jobs hold their encoded images until they expire, so this
+        # doesn't wait for the next submit
+        while True:
+            await asyncio.sleep(min(60.0, self.job_ttl_s))
+            self.expire()
+
+    def expire(self):
+        cutoff = time.time() - self.job_ttl_s
+        for job_id in [j.id for j in self.jobs.values() if j.finished and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def update_gauges(self):
+        active = self.active()
+        self.metrics.set_gauge("api_jobs_queued", sum(1 for j in active if j.status == "queued"))
+        self.metrics.set_gauge("api_jobs_running", sum(1 for j in active if j.status == "running"))
+        self.metrics.set_gauge("api_queue_capacity", self.max_queue)
+        for name, value in self.counts.items():
+            self.metrics.set_counter(f"api_jobs_{name}_total", value)
+
+    def get(self, job_id: str) -> Job:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPError(404, "Unknown job")
+        return job
+
+
+class APIServer:
+    ROUTES = [
+        ("POST", re.compile(r"^/v1/jobs$"), "submit"),
+        ("GET", re.compile(r"^/v1/jobs/(?P<job_id>[0-9a-f]{32})$"), "status"),
+        ("DELETE", re.compile(r"^/v1/jobs/(?P<job_id>[0-9a-f]{32})$"), "cancel"),
+        ("GET", re.compile(r"^/v1/jobs/(?P<job_id>[0-9a-f]{32})/images/(?P<index>\d+)$"), "image"),
+        ("GET", re.compile(r"^/healthz$"), "health"),
+        ("GET", re.compile(r"^/metrics$"), "metrics")
+    ]
+
+    def __init__(self, manager: JobManager):
+        self.manager = manager
+
+    # ---------- handlers: return (status, body, content type, extra headers) ----------
+
+    async def submit(self, body, query):
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "Body is not valid JSON")
+        job = self.manager.submit(payload)
+        return 202, job.to_dict(), None, {"Location": f"/v1/jobs/{job.id}"}
+
+    async def status(self, body, query, job_id):
+        return 200, self.manager.get(job_id).to_dict(), None, {}
+
+    async def cancel(self, body, query, job_id):
+        job = self.manager.get(job_id)
+        self.manager.cancel(job)
+        return 200, job.to_dict(), None, {}
+
+    async def image(self, body, query, job_id, index):
+        job = self.manager.get(job_id)
+        if job.status != "done":
+            raise HTTPError(409, f"Job is {job.status}")
+        index = int(index)
+        if index >= len(job.results):
+            raise HTTPError(404, "No such image")
+        processed = job.results[index]
+        fmt = query.get("format", [processed.policy.primary])[0]
+        if fmt not in processed.policy.formats:
+            raise HTTPError(404, f"Format not offered; choose from {', '.join(processed.policy.formats)}")
+        store = get_output_store()
+        if store is not None:
+            store.touch(processed.metadata_path)
+        # A deferred format is encoded (and saved) on this first request
+        data = await asyncio.get_running_loop().run_in_executor(None, processed.data, fmt)
+        return 200, data, FORMATS[fmt]["mime"], {}
+
+    async def health(self, body, query):
+        backend = self.manager.backend
+        health = {
+            "status": "ok" if backend.ready else ("failed" if backend.failed else "loading"),
+            "model": backend.status,
+            "queued": len(self.manager.active()),
+            "max_queue": self.manager.max_queue
+        }
+        return (200 if backend.ready else 503), health, None, {}
+
+    async def metrics(self, body, query):
+        self.manager.update_gauges()
+        return 200, self.manager.metrics.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4", {}
+
+    # ---------- HTTP/1.1, one request per connection ----------
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                method, path, query, body = await asyncio.wait_for(self._read_request(reader), READ_TIMEOUT_S)
+                status, payload, content_type, headers = await self._dispatch(method, path, query, body)
+            except HTTPError as e:
+                status, payload, content_type, headers = e.status, {"error": e.message}, None, e.headers
+            except asyncio.TimeoutError:
+                status, payload, content_type, headers = 408, {"error": "Request timeout"}, None, {}
+            except Exception as e:
+                print(f"API request failed: {e!r}")
+                status, payload, content_type, headers = 500, {"error": "Internal error"}, None, {}
+            await self._write_response(writer, status, payload, content_type, headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        parts = request_line.split()
+        if len(parts) != 3:
+            raise HTTPError(400, "Malformed request line")
+        method, target, _ = parts
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise HTTPError(431, "Too many headers")
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        return method.upper(), url.path, parse_qs(url.query), body
+
+    async def _dispatch(self, method, path, query, body):
+        allowed = []
+        for route_method, pattern, handler in self.ROUTES:
+            match = pattern.match(path)
+            if match is None:
+                continue
+            if route_method != method:
+                allowed.append(route_method)
+                continue
+            return await getattr(self, handler)(body, query, **match.groupdict())
+        if allowed:
+            raise HTTPError(405, "Method not allowed", {"Allow": ", ".join(allowed)})
+        raise HTTPError(404, "Not found")
+
+    async def _write_response(self, writer, status, payload, content_type, headers):
+        if isinstance(payload, (dict, list)):
+            payload = json.dumps(payload).encode("utf-8")
+            content_type = "application/json"
+        head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+                f"Content-Type: {content_type}",
+                f"Content-Length: {len(payload)}",
+                "Connection: close"]
+        head += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+        await writer.drain()
+
+
+def build_manager(config: dict, stub: bool = False, stub_step_s: float = 0.05) -> JobManager:
+    api_cfg = config.get("api", {})
+    metrics = MetricsRegistry(jsonl_path=config.get("telemetry", {}).get("jsonl_path"))
+    if stub:
+        from stub_generator import StubGenerator
+        backend = Backend(config, generator=StubGenerator(step_s=stub_step_s, metrics=metrics))
+        models = None
+    else:
+        # model.py (torch, diffusers) loads in the background; /healthz says when it's ready
+        from model_loader import loader_from_config
+        from pipeline_pool import models_from_config
+        backend = Backend(config, loader=loader_from_config(config, metrics=metrics))
+        models, _ = models_from_config(config)
+    output_pipeline = OutputPipeline(
+        max_workers=config.get("output_pipeline", {}).get("workers", 4),
+        catalog=get_catalog(),
+        policy=OutputPolicy.from_config(config.get("output_formats"))
+    )
+    store = get_output_store()
+    if store is not None:
+        storage_cfg = storage_config()
+        store.catalog = get_catalog()
+        store.start(interval_s=storage_cfg["maintenance_interval_s"], migrate=migration_enabled())
+    return JobManager(
+        backend, output_pipeline, metrics, models=models,
+        max_queue=api_cfg.get("max_queue", 16),
+        max_images=api_cfg.get("max_images", 4),
+        output_dir=api_cfg.get("output_dir", "outputs/api"),
+        job_ttl_s=api_cfg.get("job_ttl_s", 3600)
+    )
+
+
+async def serve(manager: JobManager, host: str, port: int):
+    server = await asyncio.start_server(APIServer(manager).handle, host, port)
+    print(f"API listening on http://{host}:{port}")
+    expiry = asyncio.get_running_loop().create_task(manager.expire_periodically())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        expiry.cancel()
+
+
+def main():
+    config = load_config()
+    api_cfg = config.get("api", {})
+    parser = argparse.ArgumentParser(description="HTTP API for text-to-image jobs")
+    parser.add_argument("--host", default=api_cfg.get("host", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=api_cfg.get("port", 8000))
+    parser.add_argument("--stub", action="store_true", help="serve the stub generator instead of the model")
+    parser.add_argument("--stub-step-s", type=float, default=0.05, help="seconds per stub denoising step")
+    args = parser.parse_args()
+
+    manager = build_manager(config, stub=args.stub, stub_step_s=args.stub_step_s)
+    try:
+        asyncio.run(serve(manager, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.output_pipeline.shutdown()
+
+
+if __name__ == "__main__":
+    main()
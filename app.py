@@ -1,8 +1,22 @@
 # app.py
 import os
+import time
+import threading
+from concurrent.futures import wait
 import streamlit as st
-from model import Text2ImageGenerator
-from utils import is_prompt_allowed, add_watermark, save_image_with_metadata
+# model.py (torch, diffusers) is imported by the loader thread, not here, so
+# the page renders before the heavy libraries are in memory
+from model_loader import loader_from_config
+from batching import scheduler_from_config
+from deadlines import DeadlineExceeded
+from pipeline_pool import models_from_config
+from result_cache import ResultCache, generation_key, precision_key
+from catalog import get_catalog
+from storage import get_output_store, migration_enabled, storage_config
+from postprocess import OutputPipeline
+from output_formats import FORMATS, OutputPolicy
+from schedulers import SCHEDULERS, recommended_steps
+from utils import STYLE_PROMPTS, apply_style, is_prompt_allowed, load_config, make_seeds
 
 # ---------- PAGE CONFIG ----------
 st.set_page_config(
@@ -84,11 +98,70 @@ st.markdown(
 )
 
 # ---------- MODEL (CACHED) ----------
+# Loads and warms up the pipeline on a background thread; the page polls it
 @st.cache_resource
-def load_generator():
-    return Text2ImageGenerator()
+def load_model_loader():
+    return loader_from_config(load_config())
 
-generator = load_generator()
+# One scheduler per server process: every session submits to it, and it
+# batches compatible requests into a single pipeline call
+@st.cache_resource
+def load_scheduler():
+    return scheduler_from_config(load_model_loader().pool, load_config())
+
+@st.cache_resource
+def load_result_cache():
+    cache_cfg = load_config().get("result_cache", {})
+    if not cache_cfg.get("enabled", True):
+        return None
+    return ResultCache(base_dir="outputs", max_entries=cache_cfg.get("max_entries", 10000))
+
+@st.cache_resource
+def load_catalog():
+    # Outputs written while the app wasn't running are picked up by the
+    # background scan load_output_store() starts
+    return get_catalog()
+
+@st.cache_resource
+def load_output_store():
+    # Sharded layout, retention and compaction of outputs/; existing flat
+    # outputs are migrated, then the catalog rescanned, by the maintenance
+    # thread while the app runs
+    store = get_output_store()
+    catalog = load_catalog()
+    if store is not None:
+        config = storage_config()
+        store.catalog = catalog
+        store.start(interval_s=config["maintenance_interval_s"], migrate=migration_enabled())
+    elif catalog is not None:
+        catalog.scan_in_background("outputs")
+    return store
+
+@st.cache_resource
+def load_output_pipeline():
+    workers = load_config().get("output_pipeline", {}).get("workers", 4)
+    policy = OutputPolicy.from_config(load_config().get("output_formats"))
+    return OutputPipeline(max_workers=workers, catalog=load_catalog(), policy=policy)
+
+def read_cached_files(files: dict) -> dict:
+    # {format: (file name, bytes)} of a result cache hit's files that are
+    # still on disk; retention may remove them after the lookup
+    downloads = {}
+    for fmt, path in files.items():
+        try:
+            with open(path, "rb") as f:
+                downloads[fmt] = (os.path.basename(path), f.read())
+        except (OSError, TypeError):
+            continue
+    return downloads
+
+models, default_model = models_from_config(load_config())
+loader = load_model_loader()
+generator = loader.generator  # None until the loader thread is done
+scheduler = load_scheduler() if loader.ready else None
+result_cache = load_result_cache()
+load_output_store()
+output_pipeline = load_output_pipeline()
 
 # ---------- HEADER ----------
 st.markdown(
@@ -128,7 +201,7 @@ st.markdown(
             </div>
         </div>
     </div>
-    """.format(device=generator.device),
+    """.format(device=generator.device if generator is not None else "Loading model..."),
     unsafe_allow_html=True
 )
 
@@ -161,9 +234,17 @@ with left_col:
     # Style & core sliders
     st.markdown('<div class="section-title">Style & Quality</div>', unsafe_allow_html=True)
 
+    model_names = list(models)
+    model_choice = st.selectbox(
+        "Model",
+        model_names,
+        index=model_names.index(default_model),
+        help="Models other than the default load on first use; the least recently used are unloaded when memory runs short."
+    )
+
     style = st.selectbox(
         "Artistic style",
-        ["Photorealistic", "Artistic / Painting", "Cartoon / Anime", "Concept Art"],
+        list(STYLE_PROMPTS),
         help="Choose the overall look & vibe of the output image."
     )
 
@@ -186,12 +267,21 @@ with left_col:
             help="Higher values follow the text more strictly but can reduce creativity."
         )
 
+    scheduler_names = list(SCHEDULERS)
+    sampler = st.selectbox(
+        "Sampler",
+        scheduler_names,
+        index=scheduler_names.index(load_config().get("scheduler", "default")),
+        format_func=lambda name: f"{SCHEDULERS[name]['label']} (~{SCHEDULERS[name]['steps']} steps)",
+        help="Fast samplers such as DPM-Solver++ or UniPC reach good quality in 10–15 steps."
+    )
+
     steps = st.slider(
         "Diffusion steps",
-        min_value=10,
+        min_value=4,
         max_value=50,
-        value=30,
-        step=5,
+        value=recommended_steps(sampler),
+        step=1,
         help="More steps = slower but sharper & more detailed images."
     )
 
@@ -209,12 +299,31 @@ with left_col:
         with c4:
             width = st.selectbox("Image width", [512, 640, 768], index=0)
 
+        seed_input = st.number_input(
+            "Seed",
+            min_value=-1,
+            max_value=2 ** 32 - 1,
+            value=-1,
+            step=1,
+            help="-1 picks a random seed. With a fixed seed, repeating a request returns the saved images."
+        )
+
+        time_limit = st.number_input(
+            "Time limit (seconds)",
+            min_value=0,
+            max_value=600,
+            value=0,
+            step=5,
+            help="0 = none. Otherwise fewer steps are run if needed to finish in time, based on measured speed."
+        )
+
     # Generate button
     st.markdown("")
     generate_button = st.button(
         "🚀 Generate Images",
         use_container_width=True,
-        type="primary"
+        type="primary",
+        disabled=not loader.ready
     )
 
     st.markdown('</div>', unsafe_allow_html=True)  # close glass-card
@@ -227,19 +336,11 @@ with right_col:
     status_box = st.empty()
     progress_text = st.empty()
     progress_bar = st.empty()
+    # Low-res previews while denoising; the final images replace them in place
+    results_box = st.empty()
 
     output_dir = "outputs"
 
-    # Style prompt enhancement
-    def apply_style(prompt_text: str, style_choice: str) -> str:
-        style_prompts = {
-            "Photorealistic": "ultra realistic, 8k, professional photography, sharp focus, high dynamic range",
-            "Artistic / Painting": "oil painting, brush strokes, rich texture, artstation, highly detailed",
-            "Cartoon / Anime": "anime style, clean lines, cell shading, vibrant colors",
-            "Concept Art": "concept art, matte painting, dramatic lighting, highly detailed, cinematic"
-        }
-        return f"{prompt_text}, {style_prompts.get(style_choice, '')}"
-
     # Handle generation
     if generate_button:
         if not prompt.strip():
@@ -252,7 +353,11 @@ with right_col:
             status_box.info("Generation started. This may take some time depending on your hardware.")
             progress_bar = st.progress(0)
 
-            if generator.device == "cuda":
+            # Prefer timings measured on this server over the generic guess
+            mean_step_s = generator.metrics.mean_step_s()
+            if mean_step_s > 0:
+                est = f"~{steps * mean_step_s + generator.metrics.mean_decode_s():.0f}s (measured)"
+            elif generator.device == "cuda":
                 est = "a few seconds per image (GPU)"
             else:
                 est = "around 30–60 seconds per image (CPU, slower)"
@@ -269,66 +374,224 @@ with right_col:
                 "height": height,
                 "width": width,
                 "device": generator.device,
-                "style": style
+                "style": style,
+                "model": models[model_choice],
+                "scheduler": sampler
             }
 
+            seeds = make_seeds(None if seed_input < 0 else seed_input, num_images)
+            # int8, bf16 and channels_last change the pixels, so they are part
+            # of the key; models not loaded yet get the same profile
+            precision = precision_key(loader.pool.peek(model_choice) or generator)
+            cache_keys = [
+                generation_key(
+                    model_name=models[model_choice],
+                    scheduler=sampler,
+                    prompt=styled_prompt,
+                    negative_prompt=negative_prompt_input,
+                    guidance_scale=guidance_scale,
+                    num_inference_steps=steps,
+                    height=height,
+                    width=width,
+                    seed=seed,
+                    precision=precision
+                )
+                for seed in seeds
+            ]
+            # Only explicitly seeded requests can repeat, so only those look up
+            cached = [
+                result_cache.get(key) if result_cache is not None and seed_input >= 0 else None
+                for key in cache_keys
+            ]
+            # Hits are read now; one whose files are gone is regenerated
+            cached_downloads = {}
+            for idx, meta in enumerate(cached):
+                if meta is not None:
+                    cached_downloads[idx] = read_cached_files(meta["files"])
+                    if not cached_downloads[idx]:
+                        cached[idx] = None
+            missing = [idx for idx, meta in enumerate(cached) if meta is None]
+
             progress_bar.progress(10)
             progress_text.markdown("🔧 Preparing model & pipeline...")
 
-            images = generator.generate(
-                prompt=styled_prompt,
-                negative_prompt=negative_prompt_input,
-                num_images=num_images,
-                guidance_scale=guidance_scale,
-                num_inference_steps=steps,
-                height=height,
-                width=width
-            )
-
-            progress_bar.progress(70)
+            # The worker thread reports each denoising step here; the script
+            # thread polls it, since Streamlit elements can't be updated from
+            # other threads
+            progress_state = {}
+            progress_lock = threading.Lock()
+
+            def on_progress(telemetry):
+                with progress_lock:
+                    progress_state.update(telemetry.to_dict())
+
+            def on_preview(telemetry, images):
+                with progress_lock:
+                    progress_state["preview"] = (telemetry.step, images)
+
+            new_images = []
+            steps_used = steps
+            if missing:
+                request_start = time.perf_counter()
+                future = scheduler.submit(
+                    prompt=styled_prompt,
+                    negative_prompt=negative_prompt_input,
+                    num_images=len(missing),
+                    guidance_scale=guidance_scale,
+                    num_inference_steps=steps,
+                    height=height,
+                    width=width,
+                    seeds=[seeds[idx] for idx in missing],
+                    scheduler=sampler,
+                    on_progress=on_progress,
+                    model=model_choice,
+                    on_preview=on_preview,
+                    deadline_s=time_limit or None
+                )
+                shown_preview = None
+                try:
+                    while not future.done():
+                        wait([future], timeout=0.25)
+                        with progress_lock:
+                            snapshot = dict(progress_state)
+                        preview = snapshot.get("preview")
+                        if preview is not None and preview[0] != shown_preview:
+                            shown_preview, preview_images = preview
+                            with results_box.container():
+                                preview_cols = st.columns(num_images)
+                                for idx, img in zip(missing, preview_images):
+                                    preview_cols[idx].image(
+                                        img, caption=f"Preview • step {shown_preview}", use_container_width=True
+                                    )
+                        if snapshot.get("total_steps"):
+                            done = snapshot["step"] / snapshot["total_steps"]
+                            progress_bar.progress(10 + int(done * 75))
+                            last_step = snapshot["step_s"][-1] if snapshot["step_s"] else 0.0
+                            progress_text.markdown(
+                                f"🎨 Denoising step `{snapshot['step']}/{snapshot['total_steps']}` "
+                                f"&nbsp;•&nbsp; `{last_step:.2f}s/step` "
+                                f"&nbsp;•&nbsp; ~`{snapshot['eta_s']:.0f}s` remaining"
+                            )
+                        elif future.request.started_at is None:
+                            progress_text.markdown("⏳ Waiting for the pipeline (queued behind other requests)...")
+                        elif loader.pool.peek(model_choice) is None:
+                            progress_text.markdown(f"📦 Loading model `{model_choice}`...")
+                except BaseException:
+                    # Streamlit stops the script with an exception when the
+                    # session reruns or goes away; nobody will see the images,
+                    # so the pipeline drops them at its next step
+                    scheduler.cancel(future)
+                    raise
+                try:
+                    new_images = future.result()
+                except DeadlineExceeded as e:
+                    progress_bar.empty()
+                    status_box.error(f"Can't finish within {time_limit}s: {e}")
+                    st.stop()
+                loader.record_request(time.perf_counter() - request_start)
+
+                telemetry = future.request.telemetry
+                steps_used = telemetry.steps_used or steps
+                telemetry_cfg = load_config().get("telemetry", {})
+                if telemetry_cfg.get("prometheus_path"):
+                    generator.metrics.write_prometheus(telemetry_cfg["prometheus_path"])
+            generated = dict(zip(missing, new_images))
+
+            progress_bar.progress(85)
             progress_text.markdown("✨ Post-processing: adding watermark & saving images...")
 
-            cols = st.columns(num_images)
-            saved_paths = []
-
-            for idx, img in enumerate(images):
-                wm_img = add_watermark(img)
+            # Watermark + encode all new images in parallel; files are written
+            # in the background and the UI uses the in-memory bytes
+            def on_saved(processed):
+                # Only explicitly seeded requests look up, so only those are
+                # indexed; images cut short by the time limit don't stand in
+                # for a full run
+                parameters = processed.metadata["parameters"]
+                if (result_cache is not None and seed_input >= 0
+                        and parameters["steps_used"] == parameters["steps"]):
+                    result_cache.put(
+                        parameters["cache_key"],
+                        processed.png_path, processed.jpg_path, processed.metadata_path
+                    )
 
-                png_path, jpg_path, metadata_path = save_image_with_metadata(
-                    wm_img,
+            pending = {
+                idx: output_pipeline.submit(
+                    img,
                     base_dir=output_dir,
                     prompt=styled_prompt,
                     negative_prompt=negative_prompt_input,
-                    params=params,
-                    index=idx
+                    params=dict(params, seed=seeds[idx], cache_key=cache_keys[idx], steps_used=steps_used),
+                    index=idx,
+                    on_saved=on_saved
                 )
-                saved_paths.append((png_path, jpg_path, metadata_path))
+                for idx, img in generated.items()
+            }
+
+            cols = results_box.container().columns(num_images)
+
+            for idx in range(num_images):
+                if idx in pending:
+                    processed = pending[idx].result()
+                    wm_img = processed.image
+                    downloads = {
+                        fmt: (os.path.basename(processed.metadata["files"][fmt]), data)
+                        for fmt, data in processed.encoded.items()
+                    }
+                else:
+                    # Served from disk: the saved files are already watermarked
+                    downloads = cached_downloads[idx]
+                    wm_img = next(iter(downloads.values()), (None, None))[1]
 
                 with cols[idx]:
                     st.image(
                         wm_img,
-                        caption=f"Variant {idx+1}",
+                        caption=f"Variant {idx+1} • seed {seeds[idx]}",
                         use_container_width=True
                     )
-                    st.download_button(
-                        label="Download PNG",
-                        data=open(png_path, "rb").read(),
-                        file_name=os.path.basename(png_path),
-                        mime="image/png",
-                        key=f"png_{idx}"
-                    )
-                    st.download_button(
-                        label="Download JPG",
-                        data=open(jpg_path, "rb").read(),
-                        file_name=os.path.basename(jpg_path),
-                        mime="image/jpeg",
-                        key=f"jpg_{idx}"
-                    )
+                    for fmt, (file_name, data) in downloads.items():
+                        st.download_button(
+                            label=f"Download {fmt.upper()}",
+                            data=data,
+                            file_name=file_name,
+                            mime=FORMATS[fmt]["mime"],
+                            key=f"{fmt}_{idx}"
+                        )
+                    deferred = [fmt.upper() for fmt in output_pipeline.policy.lazy if fmt not in downloads]
+                    if deferred:
+                        st.caption(f"{', '.join(deferred)} is created on demand from the Gallery page.")
 
             progress_bar.progress(100)
             progress_text.markdown("✅ Generation completed.")
             status_box.success("Images generated, watermarked, and saved with metadata.")
 
+            if missing:
+                st.markdown(
+                    f'<div class="tip-text">Queue wait {future.request.queue_wait_s:.1f}s • '
+                    f'text encode {telemetry.text_encode_s:.2f}s • '
+                    f'denoise {telemetry.denoise_s:.1f}s ({telemetry.step} steps, batch of {telemetry.batch_size}) • '
+                    f'VAE decode {telemetry.decode_s:.2f}s'
+                    # Only measured when a memory budget is set
+                    + (f' • peak memory +{telemetry.peak_delta_bytes / 1024 ** 2:.0f} MB' if telemetry.peak_bytes else '')
+                    + '</div>',
+                    unsafe_allow_html=True
+                )
+
+            cache_stats = (loader.pool.peek(model_choice) or generator).embedding_cache.stats()
+            pool_stats = loader.pool.stats()
+            st.markdown(
+                f'<div class="tip-text">Prompt embedding cache: {cache_stats["hits"]} hits, '
+                f'{cache_stats["misses"]} misses, {cache_stats["entries"]} entries • '
+                f'Models resident: {", ".join(pool_stats["resident"])} '
+                f'({pool_stats["resident_bytes"] / 1024 ** 3:.1f} of {pool_stats["max_bytes"] / 1024 ** 3:.1f} GB, '
+                f'{pool_stats["evictions"]} evictions)</div>',
+                unsafe_allow_html=True
+            )
+
+    elif loader.failed:
+        status_box.error(f"Model failed to load: {loader.error}")
+    elif not loader.ready:
+        status_box.info(f"⏳ Loading model: {loader.status} ({loader.elapsed_s:.0f}s). "
+                        "You can write your prompt meanwhile.")
     else:
         st.markdown(
             '<div class="tip-text">Generate an image to see results here. '
@@ -343,3 +606,8 @@ st.markdown(
     '<div class="footer-text">Built with Stable Diffusion, Streamlit, and a slightly overworked brain.</div>',
     unsafe_allow_html=True
 )
+
+# Poll the loader until the model is ready, then re-render with the button enabled
+if not loader.ready and not loader.failed:
+    time.sleep(0.5)
+    st.rerun()
@@ -0,0 +1,280 @@
+# batch_generate.py
+# Headless batch generation from a manifest such as deliverable/manifest.json.
+#
+#   python batch_generate.py deliverable/manifest.json --output-dir outputs/batch
+#   python batch_generate.py manifest.json --workers 4 --batch-size 2
+#
+# Entries with the same size and step count are generated together in one
+# pipeline call. Finished entries are appended to JSONL checkpoint files, so
+# re-running the same command after a crash or kill skips them.
+import os
+import json
+import glob
+import hashlib
+import argparse
+import multiprocessing
+from collections import OrderedDict
+
+from utils import is_prompt_allowed, load_config
+
+
+def load_manifest(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def entry_key(entry: dict) -> str:
+    # Stable across runs, so checkpoints survive manifest edits elsewhere
+    if entry.get("file"):
+        return entry["file"]
+    encoded = json.dumps(entry, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def entry_seed(entry: dict) -> int:
+    # Explicit seed if given, else derived from the key so a resumed run
+    # produces the same image it would have produced the first time
+    if entry.get("seed") is not None:
+        return int(entry["seed"])
+    return int(hashlib.sha256(entry_key(entry).encode("utf-8")).hexdigest()[:8], 16)
+
+
+def parse_size(size, defaults: dict) -> tuple:
+    # Manifest sizes are "WIDTHxHEIGHT", e.g. "768x512"
+    if not size:
+        return defaults.get("default_width", 512), defaults.get("default_height", 512)
+    width, height = str(size).lower().split("x")
+    return int(width), int(height)
+
+
+def load_checkpoint(checkpoint_dir: str) -> dict:
+    done = {}
+    for path in glob.glob(os.path.join(checkpoint_dir, "*.jsonl")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Last line of a file that was being written when killed
+                    continue
+                done[record["key"]] = record
+    return done
+
+
+class Checkpoint:
+    # One append-only file per shard, so worker processes never share a file
+    def __init__(self, checkpoint_dir: str, shard: int, num_shards: int):
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.path = os.path.join(checkpoint_dir, f"shard-{shard}-of-{num_shards}.jsonl")
+
+    def record(self, records: list):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def plan_batches(jobs: list, batch_size: int) -> list:
+    # Groups (index, entry) jobs by everything that must be shared within a
+    # pipeline call, then cuts each group into batches
+    groups = OrderedDict()
+    for job in jobs:
+        groups.setdefault(job["group"], []).append(job)
+
+    batches = []
+    for group_jobs in groups.values():
+        for start in range(0, len(group_jobs), batch_size):
+            batches.append(group_jobs[start:start + batch_size])
+    return batches
+
+
+def build_jobs(manifest: list, done: dict, config: dict) -> list:
+    defaults = config.get("default_generation_params", {})
+    size_defaults = config.get("image_size", {})
+    jobs = []
+    for index, entry in enumerate(manifest):
+        key = entry_key(entry)
+        if key in done:
+            continue
+        width, height = parse_size(entry.get("size"), size_defaults)
+        steps = int(entry.get("steps") or defaults.get("num_inference_steps", 30))
+        scheduler = entry.get("scheduler")
+        jobs.append({
+            "index": index,
+            "key": key,
+            "entry": entry,
+            "width": width,
+            "height": height,
+            "steps": steps,
+            "guidance": float(entry.get("guidance") or defaults.get("guidance_scale", 7.5)),
+            "seed": entry_seed(entry),
+            "scheduler": scheduler,
+            "group": (width, height, steps, scheduler)
+        })
+    return jobs
+
+
+def run_shard(shard: int, num_shards: int, jobs: list, args: dict):
+    import torch
+    from model import Text2ImageGenerator
+    from catalog import get_catalog
+    from output_formats import OutputPolicy
+    from postprocess import OutputPipeline
+
+    if args["threads"]:
+        torch.set_num_threads(args["threads"])
+
+    checkpoint = Checkpoint(args["checkpoint_dir"], shard, num_shards)
+    config = load_config()
+    generator = Text2ImageGenerator(
+        model_name=args["model"] or config.get("model_name", "runwayml/stable-diffusion-v1-5"),
+        scheduler=args["scheduler"] or config.get("scheduler", "default"),
+        cpu_profile=config.get("cpu_profile"),
+        use_safetensors=config.get("startup", {}).get("use_safetensors"),
+        memory_budget_mb=config.get("memory", {}).get("budget_mb")
+    )
+    # Shared with the app; SQLite serialises the shards' inserts
+    output = OutputPipeline(
+        max_workers=config.get("output_pipeline", {}).get("workers", 4),
+        catalog=get_catalog(),
+        policy=OutputPolicy.from_config(config.get("output_formats"))
+    )
+
+    batches = plan_batches(jobs, args["batch_size"])
+    for number, batch in enumerate(batches, start=1):
+        allowed = []
+        rejected = []
+        for job in batch:
+            if is_prompt_allowed(job["entry"].get("prompt", "")):
+                allowed.append(job)
+            else:
+                rejected.append({"key": job["key"], "status": "rejected"})
+                print(f"[shard {shard}] Skipping {job['key']}: prompt violates content guidelines")
+        if rejected:
+            checkpoint.record(rejected)
+        if not allowed:
+            continue
+
+        first = allowed[0]
+        images = generator.generate_batch(
+            prompts=[job["entry"]["prompt"] for job in allowed],
+            negative_prompts=[job["entry"].get("negative_prompt") or "" for job in allowed],
+            guidance_scales=[job["guidance"] for job in allowed],
+            num_inference_steps=first["steps"],
+            height=first["height"],
+            width=first["width"],
+            seeds=[job["seed"] for job in allowed],
+            scheduler=first["scheduler"]
+        )
+
+        # Watermarking and encoding run in parallel across the batch's images
+        pending = []
+        for job, image in zip(allowed, images):
+            entry = job["entry"]
+            params = {
+                "guidance_scale": job["guidance"],
+                "steps": job["steps"],
+                # Batch runs have no deadline, so every step runs
+                "steps_used": job["steps"],
+                "height": job["height"],
+                "width": job["width"],
+                "device": generator.device,
+                "model": generator.model_name,
+                "scheduler": job["scheduler"] or generator.default_scheduler,
+                "seed": job["seed"],
+                "manifest_file": entry.get("file"),
+                "article": entry.get("article"),
+                "title": entry.get("title")
+            }
+            pending.append((job, output.submit(
+                image,
+                base_dir=args["output_dir"],
+                prompt=entry["prompt"],
+                negative_prompt=entry.get("negative_prompt") or "",
+                params=params,
+                index=job["index"],
+                watermark=args["watermark"]
+            )))
+
+        records = []
+        for job, future in pending:
+            # Only checkpoint entries whose files are on disk
+            processed = future.result()
+            processed.saved.result()
+            records.append({
+                "key": job["key"],
+                "status": "done",
+                "png": processed.png_path,
+                "jpg": processed.jpg_path,
+                "files": processed.metadata["files"],
+                "metadata": processed.metadata_path
+            })
+        checkpoint.record(records)
+        print(f"[shard {shard}] batch {number}/{len(batches)}: {len(records)} images "
+              f"({first['width']}x{first['height']}, {first['steps']} steps)")
+    output.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate every entry of a manifest without the UI")
+    parser.add_argument("manifest", help="JSON list of entries (prompt, negative_prompt, steps, guidance, size)")
+    parser.add_argument("--output-dir", default=os.path.join("outputs", "batch"))
+    parser.add_argument("--checkpoint-dir", help="Default: <output-dir>/checkpoint")
+    parser.add_argument("--batch-size", type=int, default=4, help="Images per pipeline call")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes to shard the manifest over")
+    parser.add_argument("--threads", type=int, help="Torch threads per worker (default: cores / workers)")
+    parser.add_argument("--model", help="Default: model_name from config/model_config.json")
+    parser.add_argument("--scheduler", help="Default: scheduler from config/model_config.json")
+    parser.add_argument("--no-watermark", action="store_true")
+    args = parser.parse_args()
+
+    checkpoint_dir = args.checkpoint_dir or os.path.join(args.output_dir, "checkpoint")
+    manifest = load_manifest(args.manifest)
+    done = load_checkpoint(checkpoint_dir)
+    jobs = build_jobs(manifest, done, load_config())
+    print(f"{len(manifest)} entries, {len(manifest) - len(jobs)} already done, {len(jobs)} to generate")
+    if not jobs:
+        return
+
+    workers = max(1, min(args.workers, len(jobs)))
+    shard_args = {
+        "output_dir": args.output_dir,
+        "checkpoint_dir": checkpoint_dir,
+        "batch_size": args.batch_size,
+        "threads": args.threads or (max(1, (os.cpu_count() or 1) // workers) if workers > 1 else None),
+        "model": args.model,
+        "scheduler": args.scheduler,
+        "watermark": not args.no_watermark
+    }
+
+    # Deal batches round-robin so every shard gets whole same-size groups
+    batches = plan_batches(jobs, args.batch_size)
+    shards = [[job for batch in batches[i::workers] for job in batch] for i in range(workers)]
+
+    if workers == 1:
+        run_shard(0, 1, shards[0], shard_args)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_shard, args=(i, workers, shard, shard_args), name=f"shard-{i}")
+        for i, shard in enumerate(shards)
+    ]
+    for process in processes:
+        process.start()
+    failed = 0
+    for process in processes:
+        process.join()
+        if process.exitcode != 0:
+            failed += 1
+            print(f"{process.name} exited with code {process.exitcode}")
+    if failed:
+        raise SystemExit(f"{failed} shard(s) failed; re-run the same command to resume")
+
+
+if __name__ == "__main__":
+    main()
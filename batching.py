@@ -0,0 +1,285 @@
+# batching.py
+import threading
+import time
+from concurrent.futures import Future
+from deadlines import DeadlineExceeded, GenerationCancelled
+from telemetry import GenerationTelemetry
+from utils import make_seeds
+
+
+class GenerationRequest:
+    def __init__(
+        self,
+        prompt: str,
+        negative_prompt: str = "",
+        num_images: int = 1,
+        guidance_scale: float = 7.5,
+        num_inference_steps: int = 30,
+        height: int = 512,
+        width: int = 512,
+        seeds: list = None,
+        scheduler: str = None,
+        on_progress=None,
+        model: str = None,
+        on_preview=None,
+        deadline_s: float = None
+    ):
+        self.prompt = prompt
+        self.negative_prompt = negative_prompt
+        self.num_images = num_images
+        self.guidance_scale = guidance_scale
+        self.num_inference_steps = num_inference_steps
+        self.height = height
+        self.width = width
+        self.seeds = seeds or make_seeds(None, num_images)
+        self.scheduler = scheduler
+        self.on_progress = on_progress
+        self.on_preview = on_preview
+        self.model = model
+        self.future = Future()
+        self.submitted_at = time.perf_counter()
+        # Latency budget from submission, queue wait included (wall clock, so
+        # worker processes can check it too)
+        self.deadline = time.time() + deadline_s if deadline_s else None
+        self.cancelled = False
+        # Set when the request's batch starts; shared by every request in it
+        self.started_at = None
+        self.telemetry = None
+
+    @property
+    def queue_wait_s(self) -> float:
+        if self.started_at is None:
+            return time.perf_counter() - self.submitted_at
+        return self.started_at - self.submitted_at
+
+    @property
+    def group_key(self):
+        # Requests with the same key can share one pipeline call; prompts and
+        # guidance scales are per image and may differ inside a batch. A
+        # deadline may trim the batch's steps, so only requests that have one
+        # share a batch.
+        return (self.model, self.height, self.width, self.num_inference_steps, self.scheduler,
+                self.deadline is not None)
+
+
+class BatchingScheduler:
+    # Collects requests from concurrent sessions for a short window and runs
+    # compatible ones through a single generator.generate_batch() call. A single
+    # worker thread owns the generator, so the pipeline is never used by two
+    # threads at once. `generator` may also be a PipelinePool, in which case
+    # each batch runs on the model its requests asked for.
+
+    def __init__(self, generator, window_ms: float = 50, max_batch_images: int = 8,
+                 preview_every: int = 0, preview_budget: float = 0.02):
+        self.generator = generator
+        self.window_s = window_ms / 1000.0
+        self.max_batch_images = max_batch_images
+        self.preview_every = preview_every
+        self.preview_budget = preview_budget
+
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(
+            target=self._run, name="batching-scheduler", daemon=True
+        )
+        self._worker.start()
+
+    def submit(
+        self,
+        prompt: str,
+        negative_prompt: str = "",
+        num_images: int = 1,
+        guidance_scale: float = 7.5,
+        num_inference_steps: int = 30,
+        height: int = 512,
+        width: int = 512,
+        seeds: list = None,
+        scheduler: str = None,
+        on_progress=None,
+        model: str = None,
+        on_preview=None,
+        deadline_s: float = None
+    ) -> Future:
+        # on_progress(telemetry) is called from the worker thread after every
+        # denoising step of the batch this request ends up in, and
+        # on_preview(telemetry, images) with previews of this request's images.
+        # With deadline_s the steps may be cut to finish in time (the result's
+        # request.telemetry.steps_used), or the future fails with
+        # DeadlineExceeded if even a few steps won't fit.
+        request = GenerationRequest(
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            num_images=num_images,
+            guidance_scale=guidance_scale,
+            num_inference_steps=num_inference_steps,
+            height=height,
+            width=width,
+            seeds=seeds,
+            scheduler=scheduler,
+            on_progress=on_progress,
+            model=model,
+            on_preview=on_preview,
+            deadline_s=deadline_s
+        )
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("BatchingScheduler is closed")
+            self._pending.append(request)
+            self._cond.notify()
+        # Lets callers read queue wait and telemetry of their request
+        request.future.request = request
+        return request.future
+
+    def cancel(self, future: Future) -> bool:
+        # Queued requests are dropped right away (and stop counting towards
+        # their batch); a running batch stops at its next step once every
+        # request in it is cancelled (the others still need the shared
+        # pipeline call). Either way the future fails with GenerationCancelled.
+        request = future.request
+        with self._cond:
+            request.cancelled = True
+            queued = request in self._pending
+            if queued:
+                self._pending.remove(request)
+                self._cond.notify()
+        if queued:
+            future.set_exception(GenerationCancelled("Cancelled while queued"))
+            return True
+        return not future.done()
+
+    def generate(self, **kwargs):
+        # Blocking drop-in for Text2ImageGenerator.generate
+        return self.submit(**kwargs).result()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._worker.join()
+
+    def _queued_images(self, key) -> int:
+        return sum(r.num_images for r in self._pending if r.group_key == key)
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return None
+
+                # Hold the oldest request for the batching window so that
+                # requests arriving at about the same time can join it
+                head = self._pending[0]
+                key = head.group_key
+                deadline = head.submitted_at + self.window_s
+                while (not self._closed and self._pending and self._pending[0] is head
+                       and self._queued_images(key) < self.max_batch_images):
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                # Start over with the next oldest if this one was cancelled
+                if self._pending and self._pending[0] is head:
+                    break
+
+            batch, rest, total = [], [], 0
+            for request in self._pending:
+                fits = not batch or total + request.num_images <= self.max_batch_images
+                if request.group_key == key and fits:
+                    batch.append(request)
+                    total += request.num_images
+                else:
+                    rest.append(request)
+            self._pending = rest
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # Callers may have given up on their future while it was queued,
+            # or its deadline passed in the queue
+            for request in [r for r in batch if r.cancelled]:
+                request.future.set_exception(GenerationCancelled("Cancelled while queued"))
+                batch.remove(request)
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            for request in [r for r in batch if r.deadline is not None and r.deadline <= time.time()]:
+                request.future.set_exception(DeadlineExceeded("Deadline passed while queued"))
+                batch.remove(request)
+            if batch:
+                self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        prompts, negative_prompts, guidance_scales, seeds = [], [], [], []
+        for request in batch:
+            prompts += [request.prompt] * request.num_images
+            negative_prompts += [request.negative_prompt] * request.num_images
+            guidance_scales += [request.guidance_scale] * request.num_images
+            seeds += request.seeds
+
+        # Each request only sees previews of its own slice of the batch
+        preview_listeners, offset = [], 0
+        for request in batch:
+            if request.on_preview is not None:
+                preview_listeners.append(
+                    lambda t, images, r=request, start=offset: r.on_preview(t, images[start:start + r.num_images])
+                )
+            offset += request.num_images
+
+        telemetry = GenerationTelemetry(
+            listeners=[r.on_progress for r in batch if r.on_progress is not None],
+            preview_listeners=preview_listeners,
+            preview_every=self.preview_every,
+            preview_budget=self.preview_budget,
+            should_cancel=lambda: all(r.cancelled for r in batch),
+            deadline=min((r.deadline for r in batch if r.deadline is not None), default=None)
+        )
+        now = time.perf_counter()
+        for request in batch:
+            request.started_at = now
+            request.telemetry = telemetry
+
+        first = batch[0]
+        generator = self.generator
+        try:
+            if hasattr(generator, "acquire"):
+                generator = generator.acquire(first.model)
+            images = generator.generate_batch(
+                prompts=prompts,
+                negative_prompts=negative_prompts,
+                guidance_scales=guidance_scales,
+                num_inference_steps=first.num_inference_steps,
+                height=first.height,
+                width=first.width,
+                seeds=seeds,
+                scheduler=first.scheduler,
+                telemetry=telemetry
+            )
+        except Exception as e:
+            if isinstance(e, GenerationCancelled) and hasattr(generator, "metrics"):
+                generator.metrics.record_cancelled(e)
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        # Split the batch back out to each caller, in submission order
+        offset = 0
+        for request in batch:
+            request.future.set_result(images[offset:offset + request.num_images])
+            offset += request.num_images
+
+
+def scheduler_from_config(generator, config: dict) -> BatchingScheduler:
+    # One scheduler per process, with the "batching" and "previews" settings
+    batching = config.get("batching", {})
+    previews = config.get("previews", {})
+    return BatchingScheduler(
+        generator,
+        window_ms=batching.get("window_ms", 50),
+        max_batch_images=batching.get("max_batch_images", 8),
+        preview_every=previews.get("every_n_steps", 5),
+        preview_budget=previews.get("max_overhead", 0.02)
+    )
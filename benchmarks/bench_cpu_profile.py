@@ -0,0 +1,110 @@
+# benchmarks/bench_cpu_profile.py
+# Measures each option of the CPU profile (cpu_profile.py) on its own and all
+# together, against plain float32, with the pixel drift each one introduces.
+#
+#   python -m benchmarks.bench_cpu_profile --output bench_cpu_profile.json
+#   python -m benchmarks.bench_cpu_profile --model runwayml/stable-diffusion-v1-5 --size 512x512
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.common import pixel_drift, write_report
+
+PROMPT = "a futuristic city at sunset, highly detailed, 4K, cinematic lighting"
+NEGATIVE_PROMPT = "low quality, blurry, distorted, extra limbs"
+
+VARIANTS = {
+    "float32": {},
+    "fused_attention": {"fused_attention": True},
+    "channels_last": {"channels_last": True},
+    "bf16_autocast": {"bf16_autocast": True},
+    "torch_compile": {"torch_compile": True},
+    "all": {"fused_attention": True, "channels_last": True, "bf16_autocast": True, "torch_compile": True}
+}
+
+
+def run_variant(model_path, options, width, height, num_images, steps, repeat):
+    from model import Text2ImageGenerator
+
+    profile = dict(options, enabled=bool(options))
+    generator = Text2ImageGenerator(model_name=model_path, cpu_profile=profile)
+
+    def generate():
+        generator.embedding_cache.clear()
+        return generator.generate(
+            prompt=PROMPT,
+            negative_prompt=NEGATIVE_PROMPT,
+            num_images=num_images,
+            num_inference_steps=steps,
+            height=height,
+            width=width,
+            seeds=list(range(num_images))
+        )
+
+    # The first call is reported separately: torch.compile does its work there
+    start = time.perf_counter()
+    images = generate()
+    first_s = time.perf_counter() - start
+
+    walls = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        images = generate()
+        walls.append(time.perf_counter() - start)
+    return images, generator.cpu_options, first_s, walls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CPU profile options against float32")
+    parser.add_argument("--model", help="Pipeline to load (default: a tiny random-weight pipeline)")
+    parser.add_argument("--size", default="256x256", help="WIDTHxHEIGHT")
+    parser.add_argument("--num-images", type=int, default=1)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--variants", default=",".join(VARIANTS), help="Comma-separated subset of " + ", ".join(VARIANTS))
+    parser.add_argument("--output", default="bench_cpu_profile.json")
+    args = parser.parse_args()
+
+    from cpu_profile import bf16_supported
+    from benchmarks.tiny_pipeline import save_tiny_pipeline
+
+    width, height = (int(x) for x in args.size.lower().split("x"))
+    names = ["float32"] + [n for n in args.variants.split(",") if n and n != "float32"]
+    print(f"Native bf16: {bf16_supported()}")
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        model_path = args.model or save_tiny_pipeline(os.path.join(work_dir, "tiny-sd"))
+        reference = None
+        for name in names:
+            images, applied, first_s, walls = run_variant(
+                model_path, VARIANTS[name], width, height, args.num_images, args.steps, args.repeat
+            )
+            if reference is None:
+                reference = images
+            wall = statistics.median(walls)
+            result = {
+                "variant": name,
+                "applied": applied,
+                "first_call_s": first_s,
+                "wall_s": wall,
+                "speedup": results[0]["wall_s"] / wall if results else 1.0,
+                "drift": pixel_drift(reference, images)
+            }
+            results.append(result)
+            drift = result["drift"]
+            print(
+                f"{name:16s} {wall:.3f}s (first call {first_s:.2f}s) x{result['speedup']:.2f}, "
+                f"drift max {drift['max_abs']:.0f} mean {drift['mean_abs']:.2f} PSNR {drift['psnr_db']:.1f} dB"
+            )
+
+    write_report(
+        args.output, results, model=args.model or "tiny-random", width=width, height=height,
+        num_images=args.num_images, steps=args.steps
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/bench_encoding.py
+# Bytes written and encode time per output format and setting, on the
+# deliverable images (real Stable Diffusion outputs) resized to the usual
+# 512-768 px sizes, plus throughput of encoding a batch in parallel.
+#
+#   python -m benchmarks.bench_encoding --sizes 512x512,768x512,768x768
+#   python -m benchmarks.bench_encoding --workers 1,4 --batch 8
+import os
+import glob
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+from benchmarks.bench_generate import parse_ints, parse_sizes
+from benchmarks.common import write_report
+from output_formats import PRESETS, OutputPolicy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (format, encoder options) per case; the first is today's default
+CASES = {
+    "png_level6": ("png", {"compress_level": 6}),
+    "png_level1": ("png", {"compress_level": 1}),
+    "png_level9_optimize": ("png", {"compress_level": 9, "optimize": True}),
+    "jpg_q95": ("jpg", {"quality": 95}),
+    "jpg_q95_progressive": ("jpg", {"quality": 95, "progressive": True, "optimize": True}),
+    "jpg_q85": ("jpg", {"quality": 85}),
+    "webp_q90": ("webp", {"quality": 90, "method": 4}),
+    "webp_q80_m6": ("webp", {"quality": 80, "method": 6}),
+    "webp_lossless": ("webp", {"lossless": True, "quality": 80, "method": 4})
+}
+
+
+def load_sources(width: int, height: int) -> list:
+    # Center-cropped and resized deliverable images; synthetic gradients if
+    # the deliverable folder is missing
+    paths = sorted(glob.glob(os.path.join(ROOT, "deliverable", "*", "*.jpg")))
+    images = []
+    for path in paths:
+        with Image.open(path) as im:
+            im = im.convert("RGB")
+            scale = max(width / im.width, height / im.height)
+            im = im.resize((round(im.width * scale), round(im.height * scale)), Image.LANCZOS)
+            left, top = (im.width - width) // 2, (im.height - height) // 2
+            images.append(im.crop((left, top, left + width, top + height)))
+    if not images:
+        images = [Image.linear_gradient("L").resize((width, height)).convert("RGB")]
+    return images
+
+
+def time_case(policy: OutputPolicy, fmt: str, images: list, repeat: int) -> tuple:
+    start = time.perf_counter()
+    sizes = []
+    for _ in range(repeat):
+        sizes = [len(policy.encode(img, fmt)) for img in images]
+    per_image = (time.perf_counter() - start) / (repeat * len(images))
+    return per_image, sum(sizes) / len(sizes)
+
+
+def time_batch(policy: OutputPolicy, images: list, workers: int) -> float:
+    # Images per second through OutputPolicy.encode_all on a thread pool,
+    # as in OutputPipeline
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(policy.encode_all, images))
+    return len(images) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Output encoding benchmark")
+    parser.add_argument("--sizes", default="512x512,768x512,768x768")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", default="1,4", help="thread counts for the batch throughput cases")
+    parser.add_argument("--batch", type=int, default=8, help="images per batch throughput case")
+    parser.add_argument("--output", default="bench_encoding.json")
+    args = parser.parse_args()
+
+    results = []
+    for (width, height) in parse_sizes(args.sizes):
+        images = load_sources(width, height)
+        raw = width * height * 3
+        for name, (fmt, options) in CASES.items():
+            policy = OutputPolicy(formats=[fmt], **{fmt: options})
+            per_image, size = time_case(policy, fmt, images, args.repeat)
+            results.append({
+                "width": width, "height": height, "case": name, "format": fmt,
+                "encode_ms": per_image * 1000, "bytes": int(size), "ratio": raw / size
+            })
+            print(f"{width}x{height} {name}: {per_image * 1000:.1f} ms, {size / 1024:.0f} KB")
+
+        # What each preset writes up front per image, and batch throughput
+        batch = (images * args.batch)[:args.batch]
+        for preset in PRESETS:
+            policy = OutputPolicy.from_config({"preset": preset})
+            written = sum(len(b) for b in policy.encode_all(images[0]).values())
+            for workers in parse_ints(args.workers):
+                rate = time_batch(policy, batch, workers)
+                results.append({
+                    "width": width, "height": height, "case": f"preset:{preset}", "workers": workers,
+                    "images_per_s": rate, "bytes_written": written
+                })
+                print(f"{width}x{height} preset {preset} ({workers} threads): "
+                      f"{rate:.1f} images/s, {written / 1024:.0f} KB written per image")
+
+    write_report(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
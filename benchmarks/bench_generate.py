@@ -0,0 +1,147 @@
+# benchmarks/bench_generate.py
+# Times the generation path (generate -> add_watermark -> save_image_with_metadata)
+# on a tiny random-weight pipeline, fully offline on CPU.
+#
+#   python -m benchmarks.bench_generate --output bench_generate.json
+#   python -m benchmarks.bench_generate --baseline old.json --output new.json
+import argparse
+import itertools
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.common import StageTimer, compare_reports, write_report
+from memory import PeakRSSSampler
+
+PROMPT = "a futuristic city at sunset, highly detailed, 4K, cinematic lighting"
+NEGATIVE_PROMPT = "low quality, blurry, distorted, extra limbs"
+
+
+def parse_sizes(text: str) -> list:
+    # "512x512,768x512" -> [(512, 512), (768, 512)]; WIDTHxHEIGHT like the manifest
+    sizes = []
+    for item in text.split(","):
+        w, h = item.lower().split("x")
+        sizes.append((int(w), int(h)))
+    return sizes
+
+
+def parse_ints(text: str) -> list:
+    return [int(x) for x in text.split(",")]
+
+
+def run_case(generator, width, height, num_images, steps, out_dir, repeat, preview_every=0, memory_budget=None):
+    from telemetry import GenerationTelemetry
+    from utils import add_watermark, save_image_with_metadata
+
+    runs = []
+    for _ in range(repeat):
+        # Measure the full path, text encoding included
+        generator.embedding_cache.clear()
+        timer = StageTimer()
+        # A no-op preview listener is enough to make the generator render them
+        telemetry = GenerationTelemetry(preview_listeners=[lambda t, images: None], preview_every=preview_every,
+                                        measure_memory=True)
+        with PeakRSSSampler() as rss:
+            start = time.perf_counter()
+            with timer.time("generate"):
+                images = generator.generate(
+                    prompt=PROMPT,
+                    negative_prompt=NEGATIVE_PROMPT,
+                    num_images=num_images,
+                    num_inference_steps=steps,
+                    height=height,
+                    width=width,
+                    seeds=list(range(num_images)),
+                    telemetry=telemetry,
+                    memory_budget=memory_budget
+                )
+            with timer.time("watermark"):
+                marked = [add_watermark(img) for img in images]
+            with timer.time("save"):
+                for idx, img in enumerate(marked):
+                    save_image_with_metadata(img, out_dir, PROMPT, NEGATIVE_PROMPT, {"steps": steps}, index=idx)
+            wall = time.perf_counter() - start
+
+        # Split generate into the stages the generator measured itself
+        stages = {
+            "text_encode": telemetry.text_encode_s,
+            "denoise": telemetry.denoise_s,
+            "decode": telemetry.decode_s,
+            "preview": telemetry.preview_s,
+            "generate_other": timer.stages["generate"] - telemetry.text_encode_s
+            - telemetry.denoise_s - telemetry.decode_s - telemetry.preview_s,
+            "watermark": timer.stages["watermark"],
+            "save": timer.stages["save"]
+        }
+        runs.append((wall, stages, rss.peak, telemetry))
+
+    walls = [r[0] for r in runs]
+    wall = statistics.median(walls)
+    stages = {name: statistics.median(r[1][name] for r in runs) for name in runs[0][1]}
+    return {
+        "width": width,
+        "height": height,
+        "num_images": num_images,
+        "steps": steps,
+        "repeat": repeat,
+        "wall_s": wall,
+        "wall_min_s": min(walls),
+        "stages_s": stages,
+        "peak_rss_mb": max(r[2] for r in runs) / 1024 ** 2,
+        "peak_delta_mb": max(r[3].peak_delta_bytes for r in runs) / 1024 ** 2,
+        "memory_plan": runs[-1][3].memory_plan,
+        "images_per_s": num_images / wall
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the generation path")
+    parser.add_argument("--model", help="Pipeline to load (default: a tiny random-weight pipeline)")
+    parser.add_argument("--sizes", default="512x512,768x512,768x768")
+    parser.add_argument("--num-images", default="1,2,4")
+    parser.add_argument("--steps", default="10,30")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--preview-every", type=int, default=0, help="Render a latent preview every N steps")
+    parser.add_argument("--memory-budget-mb", type=float, help="Let the generator plan each case under this budget")
+    parser.add_argument("--output", default="bench_generate.json")
+    parser.add_argument("--baseline", help="Previous report to compare wall time against")
+    args = parser.parse_args()
+
+    from model import Text2ImageGenerator
+    from benchmarks.tiny_pipeline import save_tiny_pipeline
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        model_path = args.model or save_tiny_pipeline(os.path.join(work_dir, "tiny-sd"))
+
+        load_start = time.perf_counter()
+        generator = Text2ImageGenerator(model_name=model_path)
+        load_s = time.perf_counter() - load_start
+
+        # Warm-up so the first case doesn't pay one-off allocation costs
+        generator.generate("warm up", num_inference_steps=1, height=256, width=256)
+
+        out_dir = os.path.join(work_dir, "outputs")
+        results = []
+        cases = itertools.product(parse_sizes(args.sizes), parse_ints(args.num_images), parse_ints(args.steps))
+        for (width, height), num_images, steps in cases:
+            result = run_case(
+                generator, width, height, num_images, steps, out_dir, args.repeat, args.preview_every,
+                int(args.memory_budget_mb * 1024 ** 2) if args.memory_budget_mb else None
+            )
+            results.append(result)
+            stages = ", ".join(f"{k} {v:.2f}s" for k, v in result["stages_s"].items())
+            print(
+                f"{width}x{height} n={num_images} steps={steps}: {result['wall_s']:.2f}s "
+                f"({stages}), {result['images_per_s']:.2f} img/s, peak RSS {result['peak_rss_mb']:.0f} MB "
+                f"(+{result['peak_delta_mb']:.0f} MB)"
+            )
+
+    write_report(args.output, results, model=args.model or "tiny-random", load_s=load_s)
+    if args.baseline:
+        compare_reports(args.baseline, results, ("width", "height", "num_images", "steps"), "wall_s")
+
+
+if __name__ == "__main__":
+    main()
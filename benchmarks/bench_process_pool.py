@@ -0,0 +1,91 @@
+# benchmarks/bench_process_pool.py
+# Throughput of the multi-process backend (process_pool.py) against a single
+# process using every core, plus the memory the weights really take: PSS counts
+# shared pages once across all processes.
+#
+#   python -m benchmarks.bench_process_pool --workers 1,2,4 --output bench_process_pool.json
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.common import write_report
+
+PROMPT = "a futuristic city at sunset, highly detailed, 4K, cinematic lighting"
+
+
+def pss_mb(pid: int) -> float:
+    # Proportional set size (Linux); 0 where unavailable
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def run(generator, num_images, steps, width, height, repeat) -> float:
+    # Best of `repeat` batches, in images per second
+    best = 0.0
+    for r in range(repeat):
+        start = time.perf_counter()
+        generator.generate(PROMPT, num_images=num_images, num_inference_steps=steps, height=height,
+                           width=width, seeds=list(range(r * num_images, (r + 1) * num_images)))
+        best = max(best, num_images / (time.perf_counter() - start))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process backend throughput and memory")
+    parser.add_argument("--model", help="Pipeline to load (default: a tiny random-weight pipeline)")
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--num-images", type=int, default=8, help="Images per batch (spread over the workers)")
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--size", default="512x512", help="WIDTHxHEIGHT")
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--output", default="bench_process_pool.json")
+    args = parser.parse_args()
+    width, height = (int(x) for x in args.size.lower().split("x"))
+
+    import torch
+    from model import Text2ImageGenerator
+    from process_pool import ProcessPoolGenerator
+    from benchmarks.tiny_pipeline import save_tiny_pipeline
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        model_path = args.model or save_tiny_pipeline(os.path.join(work_dir, "tiny-sd"))
+
+        torch.set_num_threads(os.cpu_count() or 1)
+        generator = Text2ImageGenerator(model_name=model_path)
+        run(generator, 1, 1, width, height, 1)
+        baseline = run(generator, args.num_images, args.steps, width, height, args.repeat)
+        results.append({"backend": "single", "workers": 1, "threads": torch.get_num_threads(),
+                        "images_per_s": baseline, "speedup": 1.0, "pss_mb": pss_mb(os.getpid())})
+        print(f"single process, {torch.get_num_threads()} threads: {baseline:.2f} img/s, "
+              f"PSS {results[-1]['pss_mb']:.0f} MB")
+        del generator
+
+        for workers in (int(w) for w in args.workers.split(",")):
+            pool = ProcessPoolGenerator(model_name=model_path, workers=workers)
+            try:
+                pool.warm_up(height=height, width=width)
+                throughput = run(pool, args.num_images, args.steps, width, height, args.repeat)
+                pss = pss_mb(os.getpid()) + sum(pss_mb(p.pid) for p in pool._processes)
+            finally:
+                pool.close()
+            results.append({"backend": "process_pool", "workers": workers, "threads": pool.threads_per_worker,
+                            "images_per_s": throughput, "speedup": throughput / baseline, "pss_mb": pss,
+                            "shared_weights_mb": pool.shared_bytes / 1024 ** 2})
+            print(f"{workers} workers x {pool.threads_per_worker} threads: {throughput:.2f} img/s "
+                  f"(x{throughput / baseline:.2f}), PSS {pss:.0f} MB total, "
+                  f"{pool.shared_bytes / 1024 ** 2:.0f} MB weights shared")
+
+    write_report(args.output, results, model=args.model or "tiny-random", num_images=args.num_images,
+                 steps=args.steps, width=width, height=height)
+
+
+if __name__ == "__main__":
+    main()
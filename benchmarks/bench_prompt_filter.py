@@ -0,0 +1,117 @@
+# benchmarks/bench_prompt_filter.py
+# Throughput of the compiled prompt filter against the original per-keyword
+# substring scan, plus a screen of a manifest file. Checks the word boundary
+# cases below first and exits if any of them regressed.
+#
+#   python -m benchmarks.bench_prompt_filter --prompts 20000
+#   python -m benchmarks.bench_prompt_filter --manifest deliverable/manifest.json
+import argparse
+import json
+import random
+import time
+
+from benchmarks.common import write_report
+from prompt_filter import get_prompt_filter
+
+# The keyword list and check utils.py used before the compiled filter
+LEGACY_KEYWORDS = ["nude", "naked", "nsfw", "gore", "bloody", "violence", "sex"]
+
+# Prompt -> fragments the filter must find (empty: allowed)
+BOUNDARY_CASES = {
+    # Longer words that contain a term
+    "a pub in Essex": [],
+    "brass sextant on a chart": [],
+    "Sussex coastline at dawn": [],
+    # Words that only spell a term if the space between them is skipped
+    "let it go re-imagined": [],
+    "an old go re-run poster": [],
+    "pen is mightier than the sword": [],
+    # A listed word followed by another word matches the listed word alone
+    "the meth od": ["meth"],
+    # Split and disguised spellings use one separator throughout
+    "s e x": ["s e x"],
+    "n.u.d.e": ["n.u.d.e"],
+    "s3x": ["s3x"]
+}
+
+
+def check_boundaries(prompt_filter) -> list:
+    # (prompt, expected, found) for every case that came out wrong
+    return [
+        (prompt, expected, found)
+        for prompt, expected in BOUNDARY_CASES.items()
+        if (found := prompt_filter.find(prompt)) != expected
+    ]
+
+
+def legacy_is_allowed(prompt: str, keywords: list) -> bool:
+    lowered = prompt.lower()
+    for word in keywords:
+        if word in lowered:
+            return False
+    return True
+
+
+def synthetic_prompts(seed_prompts: list, count: int, seed: int = 0) -> list:
+    # Shuffled words from real prompts, so length and vocabulary look like ours
+    rng = random.Random(seed)
+    words = [w for p in seed_prompts for w in p.split()]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(8, 60))) for _ in range(count)]
+
+
+def throughput(fn, prompts: list) -> float:
+    start = time.perf_counter()
+    fn(prompts)
+    return len(prompts) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt filter throughput benchmark")
+    parser.add_argument("--manifest", default="deliverable/manifest.json")
+    parser.add_argument("--prompts", type=int, default=20000)
+    parser.add_argument("--output", default="bench_prompt_filter.json")
+    args = parser.parse_args()
+
+    with open(args.manifest, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    compile_start = time.perf_counter()
+    prompt_filter = get_prompt_filter()
+    compile_s = time.perf_counter() - compile_start
+
+    failures = check_boundaries(prompt_filter)
+    for prompt, expected, found in failures:
+        print(f"Boundary case {prompt!r}: expected {expected}, found {found}")
+    if failures:
+        raise SystemExit(f"{len(failures)} of {len(BOUNDARY_CASES)} boundary cases failed")
+    print(f"{len(BOUNDARY_CASES)} boundary cases pass")
+
+    flagged = prompt_filter.screen_manifest(manifest)
+    print(f"Manifest {args.manifest}: {len(manifest)} entries, {len(flagged)} flagged")
+    for entry, matches in flagged:
+        print(f"  {entry.get('file')}: {matches}")
+
+    prompts = synthetic_prompts([e["prompt"] for e in manifest], args.prompts)
+    # The legacy scan with the full term list shows how it scales with list length
+    full_terms = [t.rstrip("*") for t in prompt_filter.terms]
+
+    results = []
+    cases = [
+        ("legacy_substring_7_terms", lambda ps: [legacy_is_allowed(p, LEGACY_KEYWORDS) for p in ps]),
+        (f"legacy_substring_{len(full_terms)}_terms", lambda ps: [legacy_is_allowed(p, full_terms) for p in ps]),
+        ("compiled_is_allowed", lambda ps: [prompt_filter.is_allowed(p) for p in ps]),
+        ("compiled_check_many", prompt_filter.check_many)
+    ]
+    for name, fn in cases:
+        rate = throughput(fn, prompts)
+        results.append({"case": name, "prompts": len(prompts), "prompts_per_s": rate})
+        print(f"{name}: {rate:,.0f} prompts/s")
+
+    write_report(
+        args.output, results,
+        terms=len(prompt_filter.terms), compile_s=compile_s, manifest_flagged=len(flagged)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/bench_quantization.py
+# Dynamic int8 (quantization.py) against float32: load time with a cold and a
+# warm quantized cache, generation time, weight memory of the quantized
+# modules and pixel drift from the float32 images.
+#
+#   python -m benchmarks.bench_quantization --output bench_quantization.json
+#   python -m benchmarks.bench_quantization --model runwayml/stable-diffusion-v1-5 --size 512x512
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.common import pixel_drift, write_report
+from memory import PeakRSSSampler
+
+PROMPT = "a futuristic city at sunset, highly detailed, 4K, cinematic lighting"
+NEGATIVE_PROMPT = "low quality, blurry, distorted, extra limbs"
+
+# The first int8 run converts and fills the cache, the second loads from it
+VARIANTS = [("float32", False), ("int8_cold_cache", True), ("int8_warm_cache", True)]
+
+
+def run_variant(model_path, int8, cache_dir, width, height, num_images, steps, repeat):
+    from model import Text2ImageGenerator
+    from quantization import QUANTIZABLE_MODULES, weight_bytes
+
+    profile = {"enabled": int8, "int8_dynamic": int8, "int8_cache_dir": cache_dir}
+    start = time.perf_counter()
+    generator = Text2ImageGenerator(model_name=model_path, cpu_profile=profile)
+    load_s = time.perf_counter() - start
+
+    def generate():
+        generator.embedding_cache.clear()
+        return generator.generate(
+            prompt=PROMPT,
+            negative_prompt=NEGATIVE_PROMPT,
+            num_images=num_images,
+            num_inference_steps=steps,
+            height=height,
+            width=width,
+            seeds=list(range(num_images))
+        )
+
+    generate()
+    walls = []
+    with PeakRSSSampler() as rss:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            images = generate()
+            walls.append(time.perf_counter() - start)
+    weights = {name: weight_bytes(getattr(generator.pipe, name)) for name in QUANTIZABLE_MODULES}
+    return images, generator.cpu_options.get("int8_dynamic"), load_s, walls, weights, rss.peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare dynamic int8 quantization against float32")
+    parser.add_argument("--model", help="Pipeline to load (default: a tiny random-weight pipeline)")
+    parser.add_argument("--size", default="256x256", help="WIDTHxHEIGHT")
+    parser.add_argument("--num-images", type=int, default=1)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="bench_quantization.json")
+    args = parser.parse_args()
+
+    from quantization import int8_supported
+    from benchmarks.tiny_pipeline import save_tiny_pipeline
+
+    if not int8_supported():
+        raise SystemExit("This torch build has no quantized CPU engine")
+    width, height = (int(x) for x in args.size.lower().split("x"))
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        model_path = args.model or save_tiny_pipeline(os.path.join(work_dir, "tiny-sd"))
+        cache_dir = os.path.join(work_dir, "quantized")
+        reference = None
+        for name, int8 in VARIANTS:
+            images, applied, load_s, walls, weights, peak_rss = run_variant(
+                model_path, int8, cache_dir, width, height, args.num_images, args.steps, args.repeat
+            )
+            if reference is None:
+                reference = images
+            wall = statistics.median(walls)
+            result = {
+                "variant": name,
+                "applied": applied,
+                "load_s": load_s,
+                "wall_s": wall,
+                "speedup": results[0]["wall_s"] / wall if results else 1.0,
+                "weight_bytes": weights,
+                "peak_rss_bytes": peak_rss,
+                "drift": pixel_drift(reference, images)
+            }
+            results.append(result)
+            drift = result["drift"]
+            weight_mb = {k: round(v / 1024 ** 2, 1) for k, v in weights.items()}
+            print(
+                f"{name:16s} load {load_s:.2f}s, {wall:.3f}s x{result['speedup']:.2f}, weights {weight_mb} MB, "
+                f"drift max {drift['max_abs']:.0f} mean {drift['mean_abs']:.2f} PSNR {drift['psnr_db']:.1f} dB"
+            )
+
+    write_report(
+        args.output, results, model=args.model or "tiny-random", width=width, height=height,
+        num_images=args.num_images, steps=args.steps
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# benchmarks/bench_startup.py
+# Cold start of the app: how long until the page can render, until the model is
+# ready, and how long the first request then takes, with and without the
+# warm-up pass. Every case runs in a fresh interpreter so import costs count.
+#
+#   python -m benchmarks.bench_startup --output bench_startup.json
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import write_report
+
+# What app.py imports before the first render (streamlit itself aside)
+UI_MODULES = ["model_loader", "batching", "prompt_cache", "result_cache", "postprocess", "schedulers", "telemetry", "utils"]
+
+
+def child(args):
+    start = time.perf_counter()
+    for name in UI_MODULES:
+        __import__(name)
+    result = {"ui_import_s": time.perf_counter() - start}
+
+    from model_loader import ModelLoader
+
+    warm_up = None
+    if args.warm_up:
+        warm_up = {"num_inference_steps": 1, "height": 256, "width": 256}
+    loader = ModelLoader({"model_name": args.model, "use_safetensors": True}, warm_up=warm_up)
+    if not loader.wait():
+        raise SystemExit(f"Model failed to load: {loader.error}")
+    result.update(loader.timings)
+
+    start = time.perf_counter()
+    loader.generator.generate("a lighthouse on a cliff at dawn", num_inference_steps=args.steps,
+                              height=args.height, width=args.width, seeds=[0])
+    result["first_request_s"] = time.perf_counter() - start
+    start = time.perf_counter()
+    loader.generator.generate("a lighthouse on a cliff at dawn", num_inference_steps=args.steps,
+                              height=args.height, width=args.width, seeds=[1])
+    result["second_request_s"] = time.perf_counter() - start
+    print("RESULT " + json.dumps(result))
+
+
+def run_case(model_path, warm_up, steps, width, height) -> dict:
+    cmd = [sys.executable, "-m", "benchmarks.bench_startup", "--child", "--model", model_path,
+           "--steps", str(steps), "--size", f"{width}x{height}"]
+    if warm_up:
+        cmd.append("--warm-up")
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+    line = next(l for l in proc.stdout.splitlines() if l.startswith("RESULT "))
+    return dict(json.loads(line[len("RESULT "):]), warm_up=warm_up, process_wall_s=wall)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start and first-request latency")
+    parser.add_argument("--model", help="Pipeline to load (default: a tiny random-weight pipeline)")
+    parser.add_argument("--size", default="512x512", help="WIDTHxHEIGHT of the timed requests")
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--warm-up", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", default="bench_startup.json")
+    args = parser.parse_args()
+    args.width, args.height = (int(x) for x in args.size.lower().split("x"))
+
+    if args.child:
+        child(args)
+        return
+
+    from benchmarks.tiny_pipeline import save_tiny_pipeline
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        model_path = args.model or save_tiny_pipeline(os.path.join(work_dir, "tiny-sd"))
+        for warm_up in (False, True):
+            result = run_case(model_path, warm_up, args.steps, args.width, args.height)
+            results.append(result)
+            print(
+                f"warm-up {'on ' if warm_up else 'off'}: UI imports {result['ui_import_s']:.2f}s, "
+                f"torch/diffusers import {result['import_s']:.2f}s, load {result['load_s']:.2f}s, "
+                f"warm-up {result.get('warm_up_s', 0.0):.2f}s, ready after {result['cold_start_s']:.2f}s; "
+                f"first request {result['first_request_s']:.2f}s, second {result['second_request_s']:.2f}s"
+            )
+
+    write_report(args.output, results, model=args.model or "tiny-random", width=args.width,
+                 height=args.height, steps=args.steps)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# benchmarks/bench_sweep.py
+# A seeds x guidance scales sweep (sweeps.py) as one batched call against the
+# same images generated one pipeline call each, the way a sweep is done by
+# hand: wall time, text encoder time and pixel drift between the two (every
+# image has its own seed generator and guidance scale, so they should match).
+#
+#   python -m benchmarks.bench_sweep --output bench_sweep.json
+#   python -m benchmarks.bench_sweep --model runwayml/stable-diffusion-v1-5 --size 512x512 --steps 20
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.bench_generate import parse_ints
+from benchmarks.common import pixel_drift, write_report
+from memory import PeakRSSSampler
+
+PROMPT = "a lighthouse on a cliff during a storm, highly detailed, cinematic lighting"
+NEGATIVE_PROMPT = "low quality, blurry, distorted, extra limbs"
+
+
+def run_separate(generator, seeds, guidance_scales, width, height, steps):
+    # One generate() per variant, in the sweep's order
+    from telemetry import GenerationTelemetry
+
+    images, encode_s = [], 0.0
+    for seed in seeds:
+        for guidance_scale in guidance_scales:
+            telemetry = GenerationTelemetry()
+            images += generator.generate(
+                prompt=PROMPT,
+                negative_prompt=NEGATIVE_PROMPT,
+                guidance_scale=guidance_scale,
+                num_inference_steps=steps,
+                height=height,
+                width=width,
+                seeds=[seed],
+                telemetry=telemetry
+            )
+            encode_s += telemetry.text_encode_s
+    return images, encode_s
+
+
+def run_sweep(generator, seeds, guidance_scales, width, height, steps):
+    sweep = generator.generate_sweep(
+        PROMPT,
+        seeds=seeds,
+        guidance_scales=guidance_scales,
+        negative_prompts=[NEGATIVE_PROMPT],
+        num_inference_steps=steps,
+        height=height,
+        width=width
+    )
+    return sweep["images"], sweep["telemetry"].text_encode_s
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a batched parameter sweep against one call per variant")
+    parser.add_argument("--model", help="Pipeline to load (default: a tiny random-weight pipeline)")
+    parser.add_argument("--size", default="256x256", help="WIDTHxHEIGHT")
+    parser.add_argument("--seeds", default="0,1,2")
+    parser.add_argument("--guidance", default="7,8,8.5,9", help="Comma-separated guidance scales")
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--output", default="bench_sweep.json")
+    args = parser.parse_args()
+
+    from model import Text2ImageGenerator
+    from benchmarks.tiny_pipeline import save_tiny_pipeline
+
+    width, height = (int(x) for x in args.size.lower().split("x"))
+    seeds = parse_ints(args.seeds)
+    guidance_scales = [float(g) for g in args.guidance.split(",")]
+    variants = len(seeds) * len(guidance_scales)
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        model_path = args.model or save_tiny_pipeline(os.path.join(work_dir, "tiny-sd"))
+        generator = Text2ImageGenerator(model_name=model_path)
+        generator.warm_up(height=height, width=width)
+        reference = None
+        for name, run in (("separate_calls", run_separate), ("sweep", run_sweep)):
+            # Both start without cached prompt embeddings
+            generator.embedding_cache.clear()
+            with PeakRSSSampler() as rss:
+                start = time.perf_counter()
+                images, encode_s = run(generator, seeds, guidance_scales, width, height, args.steps)
+                wall = time.perf_counter() - start
+            if reference is None:
+                reference = images
+            result = {
+                "mode": name,
+                "images": len(images),
+                "wall_s": wall,
+                "per_image_s": wall / len(images),
+                "speedup": results[0]["wall_s"] / wall if results else 1.0,
+                "text_encode_s": encode_s,
+                "peak_rss_bytes": rss.peak,
+                "drift": pixel_drift(reference, images)
+            }
+            results.append(result)
+            drift = result["drift"]
+            print(
+                f"{name:15s} {len(images)} images {wall:.2f}s x{result['speedup']:.2f}, "
+                f"text encode {encode_s:.3f}s, peak RSS {rss.peak / 1024 ** 2:.0f} MB, "
+                f"drift max {drift['max_abs']:.0f} PSNR {drift['psnr_db']:.1f} dB"
+            )
+
+    write_report(
+        args.output, results, model=args.model or "tiny-random", width=width, height=height,
+        steps=args.steps, seeds=seeds, guidance_scales=guidance_scales, variants=variants
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# benchmarks/bench_watermark.py
+# Cost of watermarking a request's images: the original per-call ImageDraw
+# version vs the cached overlay (per image and as one NumPy batch).
+#
+#   python -m benchmarks.bench_watermark --sizes 512x512,768x768 --num-images 4
+import argparse
+import time
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from benchmarks.bench_generate import parse_ints, parse_sizes
+from benchmarks.common import write_report
+from watermark import WatermarkRenderer
+
+
+def legacy_add_watermark(image: Image.Image, text: str = "AI GENERATED"):
+    # The implementation utils.add_watermark had before the cached renderer
+    img = image.copy()
+    draw = ImageDraw.Draw(img)
+    width, height = img.size
+    font_size = int(width * 0.03)
+    try:
+        font = ImageFont.truetype("arial.ttf", font_size)
+    except OSError:
+        font = ImageFont.load_default()
+    bbox = draw.textbbox((0, 0), text, font=font)
+    text_width = bbox[2] - bbox[0]
+    text_height = bbox[3] - bbox[1]
+    padding = 10
+    x = width - text_width - padding
+    y = height - text_height - padding
+    draw.rectangle((x - 5, y - 5, x + text_width + 5, y + text_height + 5), fill=(0, 0, 0, 128))
+    draw.text((x, y), text, font=font, fill=(255, 255, 255))
+    return img
+
+
+def time_per_call(fn, repeat: int) -> float:
+    fn()  # warm caches
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watermark compositing benchmark")
+    parser.add_argument("--sizes", default="512x512,768x512,768x768")
+    parser.add_argument("--num-images", default="1,4")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", default="bench_watermark.json")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    renderer = WatermarkRenderer()
+    results = []
+    for (width, height) in parse_sizes(args.sizes):
+        for n in parse_ints(args.num_images):
+            batch = rng.integers(0, 256, size=(n, height, width, 3), dtype=np.uint8)
+            images = [Image.fromarray(a) for a in batch]
+            cases = {
+                "legacy": lambda: [legacy_add_watermark(img) for img in images],
+                "cached_overlay": lambda: [renderer.apply(img) for img in images],
+                "numpy_batch": lambda: renderer.apply_batch(batch)
+            }
+            for name, fn in cases.items():
+                per_call = time_per_call(fn, args.repeat)
+                results.append({"width": width, "height": height, "num_images": n, "case": name, "ms": per_call * 1000})
+                print(f"{width}x{height} n={n} {name}: {per_call * 1000:.3f} ms")
+
+    write_report(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
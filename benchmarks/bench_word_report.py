@@ -0,0 +1,140 @@
+# benchmarks/bench_word_report.py
+# Build time and .docx size of the Word report: the original script (caption
+# rescan per entry, full-resolution pictures) vs make_word_report.py with a
+# cold thumbnail cache, a warm one, one edited entry, and nothing changed.
+#
+#   python -m benchmarks.bench_word_report --num-images 200 --size 1536x1024
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from PIL import Image
+from docx import Document
+from docx.shared import Inches
+
+import make_word_report as report
+from benchmarks.bench_generate import parse_sizes
+from benchmarks.common import write_report
+
+
+def make_deliverable(root: str, num_images: int, width: int, height: int, quality: int = 95):
+    # Smooth gradients plus noise: compresses like a photo, unlike pure noise
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    manifest, captions = [], []
+    for i in range(num_images):
+        article = i % 3 + 1
+        file_rel = f"article{article}/image_{i:04d}.jpg"
+        os.makedirs(os.path.join(root, f"article{article}"), exist_ok=True)
+        base = np.stack([(x * (i + 1)) % 256, (y * 3 + i * 7) % 256, (x + y + i * 13) % 256], axis=-1)
+        noise = rng.normal(0, 12, size=base.shape)
+        pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+        Image.fromarray(pixels).save(os.path.join(root, file_rel), quality=quality)
+        manifest.append({
+            "file": file_rel, "article": article, "title": f"Image {i}",
+            "prompt": f"a photorealistic scene number {i}", "negative_prompt": "blurry",
+            "steps": 30, "guidance": 7.5, "size": f"{width}x{height}"
+        })
+        captions.append(f"{file_rel}\nTitle: Image {i}\nCaption: Caption of image {i}.\n")
+    with open(os.path.join(root, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    with open(os.path.join(root, "captions.md"), "w", encoding="utf-8") as f:
+        f.write("\n".join(captions))
+
+
+def legacy_build(deliverable_dir: str, output_doc: str, readme_path: str, code_files: list):
+    # The image section of the script before this change: captions.md is
+    # re-split and scanned for every entry, pictures are embedded as-is
+    manifest = report.load_manifest(os.path.join(deliverable_dir, "manifest.json"))
+    captions_text = report.read_text(os.path.join(deliverable_dir, "captions.md")) or ""
+    readme_text = report.read_text(readme_path) or ""
+    doc = Document()
+    report.add_heading(doc, "README (summary)", level=2)
+    report.add_paragraph(doc, "\n".join(readme_text.splitlines()[:80]))
+    for entry in manifest:
+        file_rel = entry.get("file")
+        img_path = os.path.join(deliverable_dir, file_rel)
+        lines = captions_text.splitlines()
+        idx = next((i for i, line in enumerate(lines) if line.strip().endswith(file_rel)), None)
+        caption = ""
+        if idx is not None:
+            for j in range(idx, min(idx + 8, len(lines))):
+                if lines[j].strip().lower().startswith("caption:"):
+                    caption = lines[j].split(":", 1)[1].strip()
+                    break
+        report.add_paragraph(doc, entry.get("title", file_rel), bold=True, size=12)
+        doc.add_picture(img_path, width=Inches(report.IMAGE_WIDTH_IN))
+        report.add_paragraph(doc, f"Caption: {caption}\nMetadata: {json.dumps(entry, indent=2)}")
+    report.embed_code_files(doc, code_files, os.path.dirname(readme_path))
+    report.add_paragraph(doc, json.dumps(manifest, indent=2, ensure_ascii=False))
+    doc.save(output_doc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Word report build benchmark")
+    parser.add_argument("--num-images", type=int, default=200)
+    parser.add_argument("--size", default="1536x1024")
+    parser.add_argument("--max-px", type=int, default=report.DEFAULT_MAX_PX)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default="bench_word_report.json")
+    args = parser.parse_args()
+
+    (width, height), = parse_sizes(args.size)
+    workdir = tempfile.mkdtemp(prefix="bench_word_report_")
+    try:
+        deliverable = os.path.join(workdir, "deliverable")
+        make_deliverable(deliverable, args.num_images, width, height)
+        source_mb = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, files in os.walk(deliverable) for name in files if name.endswith(".jpg")
+        ) / 1024 ** 2
+        print(f"{args.num_images} images of {width}x{height}, {source_mb:.1f} MB of JPEG")
+
+        common = dict(
+            manifest_path=os.path.join(deliverable, "manifest.json"),
+            captions_path=os.path.join(deliverable, "captions.md"),
+            deliverable_dir=deliverable,
+            cache_dir=os.path.join(deliverable, ".report_cache"),
+            readme_path=report.README_PATH,
+            max_px=args.max_px,
+            workers=args.workers
+        )
+        output_doc = os.path.join(workdir, "report.docx")
+
+        def edit_one_caption():
+            path = common["captions_path"]
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text.replace("Caption of image 0.", "An edited caption of image 0.", 1))
+
+        cases = [
+            ("legacy", None, lambda: legacy_build(deliverable, output_doc, report.README_PATH, report.CODE_FILES)),
+            ("cold_cache", None, lambda: report.build_document(output_doc=output_doc, **common)),
+            ("warm_cache_forced", None, lambda: report.build_document(output_doc=output_doc, force=True, **common)),
+            ("one_caption_edited", edit_one_caption, lambda: report.build_document(output_doc=output_doc, **common)),
+            ("unchanged", None, lambda: report.build_document(output_doc=output_doc, **common))
+        ]
+        results = []
+        for name, prepare, build in cases:
+            if prepare is not None:
+                prepare()
+            start = time.perf_counter()
+            outcome = build()
+            elapsed = time.perf_counter() - start
+            size_mb = os.path.getsize(output_doc) / 1024 ** 2
+            rebuilt = outcome["rebuilt"] if outcome else True
+            results.append({"case": name, "seconds": elapsed, "docx_mb": size_mb, "rebuilt": rebuilt})
+            print(f"{name}: {elapsed:.2f}s, {size_mb:.1f} MB{'' if rebuilt else ' (kept)'}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    write_report(args.output, results, num_images=args.num_images, width=width, height=height,
+                 max_px=args.max_px, source_mb=source_mb)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# benchmarks/common.py
+import os
+import json
+import time
+import platform
+import subprocess
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    def time(self, name: str):
+        return _Stage(self, name)
+
+
+class _Stage:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.timer.stages[self.name] = self.timer.stages.get(self.name, 0.0) + elapsed
+        return False
+
+
+def run_metadata() -> dict:
+    # Enough context to line up results from different commits and machines
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    meta = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+    try:
+        import torch
+        meta["torch"] = torch.__version__
+        meta["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return meta
+
+
+def write_report(path: str, results: list, **extra):
+    report = {"meta": run_metadata(), "results": results}
+    report.update(extra)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved benchmark report: {path}")
+
+
+def compare_reports(baseline_path: str, results: list, key_fields: tuple, metric: str):
+    # Prints the relative change of `metric` per case against a previous report
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    previous = {tuple(r[k] for k in key_fields): r for r in baseline}
+
+    print(f"\nChange in {metric} vs {baseline_path}:")
+    for result in results:
+        key = tuple(result[k] for k in key_fields)
+        if key not in previous or not previous[key].get(metric):
+            continue
+        change = (result[metric] - previous[key][metric]) / previous[key][metric] * 100
+        print(f"  {key}: {previous[key][metric]:.3f} -> {result[metric]:.3f} ({change:+.1f}%)")
+
+
+def pixel_drift(reference: list, images: list) -> dict:
+    # How far images from an optimised run are from the float32 reference,
+    # on the 0-255 scale of the saved PNGs
+    import numpy as np
+
+    diffs = [
+        np.abs(np.asarray(a, dtype=np.float32) - np.asarray(b, dtype=np.float32))
+        for a, b in zip(reference, images)
+    ]
+    mse = float(np.mean([np.mean(d ** 2) for d in diffs]))
+    return {
+        "max_abs": float(max(d.max() for d in diffs)),
+        "mean_abs": float(np.mean([d.mean() for d in diffs])),
+        "psnr_db": float("inf") if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse))
+    }
@@ -0,0 +1,231 @@
+# benchmarks/load_test.py
+# N simulated Streamlit sessions pressing "Generate Images" at the same time.
+# Each session is a thread (as Streamlit runs each session's script) going
+# through the app's generate handler: prompt filter, apply_style, the shared
+# BatchingScheduler, then watermark, encode and save in the OutputPipeline.
+# Sweeps concurrency levels and reports throughput, queue wait, end-to-end
+# latency percentiles and peak memory per level, and the level where
+# throughput stops growing.
+#
+#   python -m benchmarks.load_test --concurrency 1,2,4,8,16 --requests 4
+#   python -m benchmarks.load_test --backend tiny --steps 10 --size 128x128
+#   python -m benchmarks.load_test --backend model --model runwayml/stable-diffusion-v1-5 --size 512x512
+import argparse
+import math
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_generate import parse_ints, parse_sizes
+from benchmarks.common import write_report
+from memory import PeakRSSSampler, current_rss
+
+PROMPTS = [
+    "a futuristic city at sunset, highly detailed, cinematic lighting",
+    "a cozy study room with warm lighting, wooden desk, bookshelves",
+    "a colossal floating island above the ocean, dramatic lighting",
+    "a renaissance painting of a knight looking at the stars",
+    "a walking almirah of brown color on a road",
+    "a lighthouse on a cliff during a storm"
+]
+NEGATIVE_PROMPT = "low quality, blurry, distorted, extra limbs"
+# Throughput within this fraction of the best level counts as saturated
+SATURATION = 0.9
+
+
+def percentile(values: list, q: float) -> float:
+    # Nearest-rank percentile; 0 for no values
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def build_generator(args):
+    if args.backend == "stub":
+        from stub_generator import StubGenerator
+        return StubGenerator(step_s=args.stub_step_s, decode_s=args.stub_decode_s,
+                             image_step_s=args.stub_image_step_s)
+
+    from model import Text2ImageGenerator
+    if args.backend == "tiny":
+        from benchmarks.tiny_pipeline import save_tiny_pipeline
+        model_path = save_tiny_pipeline(os.path.join(args.work_dir, "tiny-sd"))
+    else:
+        model_path = args.model
+    generator = Text2ImageGenerator(model_name=model_path)
+    generator.warm_up()
+    return generator
+
+
+def run_session(session, scheduler, output, args, width, height, output_dir, records):
+    # One user: the app's handler for every press of the button, with a
+    # random think time in between
+    from utils import STYLE_PROMPTS, apply_style, is_prompt_allowed, make_seeds
+
+    rng = random.Random(session)
+    styles = list(STYLE_PROMPTS)
+    for r in range(args.requests):
+        prompt, style = rng.choice(PROMPTS), rng.choice(styles)
+        start = time.perf_counter()
+        if not is_prompt_allowed(prompt):
+            records.append({"session": session, "rejected": True})
+            continue
+        styled_prompt = apply_style(prompt, style)
+        seeds = make_seeds(None, args.num_images)
+        future = scheduler.submit(
+            prompt=styled_prompt,
+            negative_prompt=NEGATIVE_PROMPT,
+            num_images=args.num_images,
+            guidance_scale=7.5,
+            num_inference_steps=args.steps,
+            height=height,
+            width=width,
+            seeds=seeds,
+            on_progress=lambda telemetry: None
+        )
+        images = future.result()
+        generated_at = time.perf_counter()
+        params = {"steps": args.steps, "height": height, "width": width, "style": style, "session": session}
+        pending = [
+            output.submit(image, base_dir=output_dir, prompt=styled_prompt, negative_prompt=NEGATIVE_PROMPT,
+                          params=dict(params, seed=seed), index=index)
+            for index, (image, seed) in enumerate(zip(images, seeds))
+        ]
+        # The app shows the images once they are watermarked and encoded;
+        # the files are still being written in the background
+        for processed in pending:
+            processed.result()
+        end = time.perf_counter()
+        records.append({
+            "session": session,
+            "latency_s": end - start,
+            "queue_wait_s": future.request.queue_wait_s,
+            "generate_s": generated_at - start,
+            "postprocess_s": end - generated_at,
+            "batch_images": future.request.telemetry.batch_size
+        })
+        if args.think_s > 0 and r + 1 < args.requests:
+            time.sleep(rng.expovariate(1 / args.think_s))
+
+
+def run_level(generator, concurrency, args, width, height, config):
+    from batching import BatchingScheduler
+    from output_formats import OutputPolicy
+    from postprocess import OutputPipeline
+
+    batching = config.get("batching", {})
+    scheduler = BatchingScheduler(
+        generator,
+        window_ms=args.window_ms if args.window_ms is not None else batching.get("window_ms", 50),
+        max_batch_images=args.max_batch_images or batching.get("max_batch_images", 8)
+    )
+    output = OutputPipeline(
+        max_workers=args.output_workers or config.get("output_pipeline", {}).get("workers", 4),
+        policy=OutputPolicy.from_config(config.get("output_formats"))
+    )
+    output_dir = os.path.join(args.work_dir, f"outputs_{concurrency}")
+    records = []
+    sessions = [
+        threading.Thread(target=run_session, args=(i, scheduler, output, args, width, height, output_dir, records),
+                         name=f"session-{i}")
+        for i in range(concurrency)
+    ]
+    base_rss = current_rss()
+    with PeakRSSSampler() as rss:
+        start = time.perf_counter()
+        for session in sessions:
+            session.start()
+        for session in sessions:
+            session.join()
+        # Counted until every file is on disk
+        output.shutdown()
+        wall = time.perf_counter() - start
+    scheduler.close()
+
+    done = [r for r in records if not r.get("rejected")]
+    latencies = [r["latency_s"] for r in done]
+    waits = [r["queue_wait_s"] for r in done]
+    return {
+        "concurrency": concurrency,
+        "requests": len(done),
+        "rejected": len(records) - len(done),
+        "wall_s": wall,
+        "requests_per_s": len(done) / wall,
+        "images_per_s": len(done) * args.num_images / wall,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "latency_p99_s": percentile(latencies, 99),
+        "queue_wait_p50_s": percentile(waits, 50),
+        "queue_wait_p95_s": percentile(waits, 95),
+        "postprocess_mean_s": statistics.mean(r["postprocess_s"] for r in done) if done else 0.0,
+        "mean_batch_images": statistics.mean(r["batch_images"] for r in done) if done else 0.0,
+        "peak_rss_mb": rss.peak / 1024 ** 2,
+        "peak_rss_growth_mb": (rss.peak - base_rss) / 1024 ** 2
+    }
+
+
+def saturation_point(results: list):
+    # The lowest concurrency already within SATURATION of the best
+    # throughput; more sessions beyond it mostly add queue wait
+    best = max(r["images_per_s"] for r in results)
+    return next(r["concurrency"] for r in results if r["images_per_s"] >= SATURATION * best)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the app's generate path with simulated sessions")
+    parser.add_argument("--backend", choices=["stub", "tiny", "model"], default="stub",
+                        help="stub: StubGenerator; tiny: tiny random-weight pipeline; model: --model")
+    parser.add_argument("--model", help="Pipeline for --backend model")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="Comma-separated numbers of sessions")
+    parser.add_argument("--requests", type=int, default=4, help="Button presses per session")
+    parser.add_argument("--think-s", type=float, default=0.0, help="Mean pause between a session's requests")
+    parser.add_argument("--num-images", type=int, default=1)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--size", default="512x512", help="WIDTHxHEIGHT")
+    parser.add_argument("--stub-step-s", type=float, default=0.005, help="Stub seconds per step")
+    parser.add_argument("--stub-image-step-s", type=float, default=0.01,
+                        help="Stub seconds per step per image of the batch")
+    parser.add_argument("--stub-decode-s", type=float, default=0.05)
+    parser.add_argument("--window-ms", type=float, help="Batching window (default: config)")
+    parser.add_argument("--max-batch-images", type=int, help="Images per batch (default: config)")
+    parser.add_argument("--output-workers", type=int, help="Output pipeline threads (default: config)")
+    parser.add_argument("--output", default="bench_load_test.json")
+    args = parser.parse_args()
+    if args.backend == "model" and not args.model:
+        parser.error("--backend model needs --model")
+
+    from utils import load_config
+
+    config = load_config()
+    (width, height), = parse_sizes(args.size)
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        args.work_dir = work_dir
+        generator = build_generator(args)
+        print(f"{args.backend} backend, {args.size}, {args.steps} steps, {args.num_images} image(s) per request, "
+              f"{args.requests} requests per session")
+        for concurrency in parse_ints(args.concurrency):
+            result = run_level(generator, concurrency, args, width, height, config)
+            results.append(result)
+            print(
+                f"{concurrency:3d} sessions: {result['images_per_s']:.2f} img/s, "
+                f"latency p50 {result['latency_p50_s']:.2f}s p95 {result['latency_p95_s']:.2f}s "
+                f"p99 {result['latency_p99_s']:.2f}s, queue wait p95 {result['queue_wait_p95_s']:.2f}s, "
+                f"batch {result['mean_batch_images']:.1f}, peak RSS {result['peak_rss_mb']:.0f} MB"
+            )
+
+    saturated_at = saturation_point(results)
+    print(f"Throughput saturates at ~{saturated_at} concurrent sessions")
+    write_report(
+        args.output, results, backend=args.backend, model=args.model, width=width, height=height,
+        steps=args.steps, num_images=args.num_images, requests_per_session=args.requests,
+        think_s=args.think_s, saturation_concurrency=saturated_at
+    )
+
+
+if __name__ == "__main__":
+    main()
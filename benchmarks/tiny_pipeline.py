@@ -0,0 +1,116 @@
+# benchmarks/tiny_pipeline.py
+import os
+import json
+import tempfile
+import torch
+from diffusers import AutoencoderKL, PNDMScheduler, StableDiffusionPipeline, UNet2DConditionModel
+from transformers import CLIPTextConfig, CLIPTextModel, CLIPTokenizer
+
+# A randomly initialised Stable Diffusion pipeline with the same structure as
+# SD 1.5 (4-channel latents, 8x VAE downsampling, cross-attention UNet) but
+# tiny widths, so the whole generation path runs offline on a CPU in seconds.
+# The images are noise; only timings and shapes are meaningful.
+
+
+def _byte_alphabet() -> list:
+    # Same byte -> unicode table the CLIP BPE tokenizer uses
+    printable = (
+        list(range(ord("!"), ord("~") + 1))
+        + list(range(ord("¡"), ord("¬") + 1))
+        + list(range(ord("®"), ord("ÿ") + 1))
+    )
+    codes = printable[:]
+    extra = 0
+    for b in range(256):
+        if b not in printable:
+            printable.append(b)
+            codes.append(256 + extra)
+            extra += 1
+    return [chr(c) for c in codes]
+
+
+def _build_tokenizer(work_dir: str) -> CLIPTokenizer:
+    # Character-level vocabulary with no merges, written locally so nothing
+    # is downloaded
+    chars = _byte_alphabet()
+    vocab = {}
+    for c in chars:
+        vocab[c] = len(vocab)
+    for c in chars:
+        vocab[c + "</w>"] = len(vocab)
+    vocab["<|startoftext|>"] = len(vocab)
+    vocab["<|endoftext|>"] = len(vocab)
+
+    vocab_path = os.path.join(work_dir, "vocab.json")
+    merges_path = os.path.join(work_dir, "merges.txt")
+    with open(vocab_path, "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+    with open(merges_path, "w", encoding="utf-8") as f:
+        f.write("#version: 0.2\n")
+
+    return CLIPTokenizer(vocab_path, merges_path, model_max_length=77)
+
+
+def build_tiny_pipeline(seed: int = 0) -> StableDiffusionPipeline:
+    with tempfile.TemporaryDirectory() as work_dir:
+        tokenizer = _build_tokenizer(work_dir)
+
+    torch.manual_seed(seed)
+    unet = UNet2DConditionModel(
+        block_out_channels=(32, 64),
+        layers_per_block=1,
+        sample_size=64,
+        in_channels=4,
+        out_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+        cross_attention_dim=32,
+        attention_head_dim=8,
+        norm_num_groups=32
+    )
+    vae = AutoencoderKL(
+        block_out_channels=[32, 32, 32, 32],
+        in_channels=3,
+        out_channels=3,
+        down_block_types=["DownEncoderBlock2D"] * 4,
+        up_block_types=["UpDecoderBlock2D"] * 4,
+        latent_channels=4,
+        layers_per_block=1,
+        norm_num_groups=32
+    )
+    text_encoder = CLIPTextModel(CLIPTextConfig(
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+        hidden_size=32,
+        intermediate_size=37,
+        num_attention_heads=4,
+        num_hidden_layers=2,
+        vocab_size=len(tokenizer),
+        max_position_embeddings=77
+    ))
+    scheduler = PNDMScheduler(
+        beta_start=0.00085,
+        beta_end=0.012,
+        beta_schedule="scaled_linear",
+        skip_prk_steps=True,
+        steps_offset=1
+    )
+
+    return StableDiffusionPipeline(
+        unet=unet,
+        vae=vae,
+        text_encoder=text_encoder,
+        tokenizer=tokenizer,
+        scheduler=scheduler,
+        safety_checker=None,
+        feature_extractor=None,
+        requires_safety_checker=False
+    )
+
+
+def save_tiny_pipeline(path: str, seed: int = 0) -> str:
+    # Saved as safetensors so Text2ImageGenerator(model_name=path) exercises
+    # the real from_pretrained loading path
+    build_tiny_pipeline(seed).save_pretrained(path, safe_serialization=True)
+    return path
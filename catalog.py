@@ -0,0 +1,353 @@
+# catalog.py
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from datetime import datetime
+
+# Columns pulled out of the metadata "parameters" dict so they can be indexed;
+# everything else stays queryable through json_extract on the params column
+PARAM_COLUMNS = {
+    "model": "TEXT",
+    "scheduler": "TEXT",
+    "seed": "INTEGER",
+    "steps": "INTEGER",
+    "guidance_scale": "REAL",
+    "width": "INTEGER",
+    "height": "INTEGER",
+    "style": "TEXT"
+}
+
+# Files a scan indexes between commits
+SCAN_BATCH = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    negative_prompt TEXT NOT NULL DEFAULT '',
+    {param_columns},
+    image_path TEXT,
+    png_path TEXT,
+    jpg_path TEXT,
+    metadata_path TEXT NOT NULL UNIQUE,
+    mtime_ns INTEGER NOT NULL DEFAULT 0,
+    params TEXT NOT NULL DEFAULT '{{}}'
+);
+CREATE INDEX IF NOT EXISTS images_created_at ON images (created_at);
+CREATE INDEX IF NOT EXISTS images_model ON images (model, created_at);
+CREATE INDEX IF NOT EXISTS images_seed ON images (seed);
+CREATE INDEX IF NOT EXISTS images_size ON images (width, height);
+-- JSON files under the scanned directories that are not image metadata, so
+-- that a rescan doesn't parse them again
+CREATE TABLE IF NOT EXISTS skipped_files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+""".format(param_columns=",\n    ".join(f"{name} {kind}" for name, kind in PARAM_COLUMNS.items()))
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5(
+    prompt, negative_prompt, content='images', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS images_fts_insert AFTER INSERT ON images BEGIN
+    INSERT INTO images_fts (rowid, prompt, negative_prompt)
+    VALUES (new.rowid, new.prompt, new.negative_prompt);
+END;
+CREATE TRIGGER IF NOT EXISTS images_fts_delete AFTER DELETE ON images BEGIN
+    INSERT INTO images_fts (images_fts, rowid, prompt, negative_prompt)
+    VALUES ('delete', old.rowid, old.prompt, old.negative_prompt);
+END;
+CREATE TRIGGER IF NOT EXISTS images_fts_update AFTER UPDATE ON images BEGIN
+    INSERT INTO images_fts (images_fts, rowid, prompt, negative_prompt)
+    VALUES ('delete', old.rowid, old.prompt, old.negative_prompt);
+    INSERT INTO images_fts (rowid, prompt, negative_prompt)
+    VALUES (new.rowid, new.prompt, new.negative_prompt);
+END;
+"""
+
+
+def _created_at(metadata: dict, metadata_path: str) -> str:
+    # ISO 8601, so string comparison orders by time
+    if metadata.get("created_at"):
+        return metadata["created_at"]
+    try:
+        return datetime.strptime(metadata["timestamp"], "%Y%m%d_%H%M%S").isoformat()
+    except (KeyError, TypeError, ValueError):
+        return datetime.fromtimestamp(os.path.getmtime(metadata_path)).isoformat(timespec="seconds")
+
+
+def _as_iso(value) -> str:
+    if value is None or isinstance(value, str):
+        return value
+    return value.isoformat()
+
+
+def fts_query(text: str) -> str:
+    # Free text -> FTS5 query: every word must match, the last one as a prefix
+    # so partially typed words already find something. Quoting keeps FTS
+    # syntax characters in prompts from being parsed as operators.
+    words = [w.replace('"', '""') for w in text.split()]
+    if not words:
+        return ""
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+class Catalog:
+    # SQLite index over saved outputs (the metadata JSON files stay the
+    # source of truth). Updated by OutputPipeline / save_image_with_metadata
+    # on every save, and rebuilt incrementally by scan() for files written
+    # elsewhere. Each thread gets its own connection; WAL mode lets the
+    # gallery read while a writer (or a batch_generate worker) inserts.
+
+    def __init__(self, db_path: str = "outputs/catalog.sqlite3"):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._local = threading.local()
+        # Set while scan() runs, so the gallery can say the list is filling in
+        self.scanning = False
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        self._add_missing_columns(conn)
+        try:
+            conn.executescript(FTS_SCHEMA)
+            self.full_text = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: fall back to LIKE
+            self.full_text = False
+        conn.commit()
+
+    @staticmethod
+    def _add_missing_columns(conn):
+        # Databases created by an older version lack newer columns; their
+        # rows get the values on the next add() or rescan of the file
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(images)")}
+        if "image_path" not in existing:
+            conn.execute("ALTER TABLE images ADD COLUMN image_path TEXT")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _row(self, metadata: dict, metadata_path: str) -> dict:
+        params = metadata.get("parameters") or {}
+        files = metadata.get("files") or {}
+        try:
+            mtime_ns = os.stat(metadata_path).st_mtime_ns
+        except OSError:
+            mtime_ns = 0
+        row = {
+            # Files from before ids were assigned get a stable one from their path
+            "id": metadata.get("id") or uuid.uuid5(uuid.NAMESPACE_URL, os.path.abspath(metadata_path)).hex,
+            "created_at": _created_at(metadata, metadata_path),
+            "prompt": metadata.get("prompt") or "",
+            "negative_prompt": metadata.get("negative_prompt") or "",
+            # The primary format's file (what the gallery shows)
+            "image_path": files.get(metadata.get("primary_format") or "png") or next(iter(files.values()), None),
+            "png_path": files.get("png"),
+            "jpg_path": files.get("jpg"),
+            "metadata_path": metadata_path,
+            "mtime_ns": mtime_ns,
+            "params": json.dumps(params, ensure_ascii=False)
+        }
+        for name in PARAM_COLUMNS:
+            row[name] = params.get(name)
+        return row
+
+    def _upsert(self, conn, row: dict):
+        columns = ", ".join(row)
+        placeholders = ", ".join(f":{name}" for name in row)
+        # Replacing by path first keeps metadata_path unique when a rewritten
+        # file carries a different id
+        conn.execute("DELETE FROM images WHERE metadata_path = ? AND id != ?", (row["metadata_path"], row["id"]))
+        conn.execute(f"INSERT OR REPLACE INTO images ({columns}) VALUES ({placeholders})", row)
+
+    def add(self, metadata: dict, metadata_path: str):
+        conn = self._conn()
+        with conn:
+            self._upsert(conn, self._row(metadata, metadata_path))
+
+    def remove(self, image_id: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM images WHERE id = ?", (image_id,))
+
+    def get(self, image_id: str):
+        row = self._conn().execute("SELECT * FROM images WHERE id = ?", (image_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        entry = dict(row)
+        entry["params"] = json.loads(entry["params"])
+        return entry
+
+    def _where(self, text=None, model=None, seed=None, since=None, until=None, params=None, **columns):
+        # columns: any of PARAM_COLUMNS; params: other parameter keys, matched
+        # exactly through json_extract
+        clauses, args = [], []
+        if text and text.strip():
+            if self.full_text:
+                clauses.append("images.rowid IN (SELECT rowid FROM images_fts WHERE images_fts MATCH ?)")
+                args.append(fts_query(text))
+            else:
+                for word in text.split():
+                    clauses.append("images.prompt LIKE ?")
+                    args.append(f"%{word}%")
+        columns.update(model=model, seed=seed)
+        for name, value in columns.items():
+            if name not in PARAM_COLUMNS:
+                raise ValueError(f"Unknown catalog column '{name}'")
+            if value is not None:
+                clauses.append(f"images.{name} = ?")
+                args.append(value)
+        if since is not None:
+            clauses.append("images.created_at >= ?")
+            args.append(_as_iso(since))
+        if until is not None:
+            clauses.append("images.created_at < ?")
+            args.append(_as_iso(until))
+        for key, value in (params or {}).items():
+            clauses.append("json_extract(images.params, ?) = ?")
+            args += [f"$.{key}", value]
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+    def search(self, text: str = None, limit: int = 24, offset: int = 0, **filters) -> list:
+        # Newest first. Filters as in _where: model, seed, steps, width, ...,
+        # since/until (datetime or ISO string), params={key: value}
+        where, args = self._where(text, **filters)
+        rows = self._conn().execute(
+            f"SELECT * FROM images{where} ORDER BY created_at DESC, id LIMIT ? OFFSET ?",
+            args + [int(limit), int(offset)]
+        ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def count(self, text: str = None, **filters) -> int:
+        where, args = self._where(text, **filters)
+        return self._conn().execute(f"SELECT COUNT(*) FROM images{where}", args).fetchone()[0]
+
+    def models(self) -> list:
+        rows = self._conn().execute(
+            "SELECT DISTINCT model FROM images WHERE model IS NOT NULL ORDER BY model"
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def scan(self, base_dir: str = "outputs") -> dict:
+        # Incremental rebuild from the metadata JSON files under base_dir:
+        # only new or modified files are parsed, and rows whose file is gone
+        # are dropped. Deleting the database and scanning rebuilds it fully.
+        # Metadata the output store compacted into segments counts as present.
+        # Commits every SCAN_BATCH files, so readers see the rows arrive.
+        self.scanning = True
+        try:
+            return self._scan(base_dir)
+        finally:
+            self.scanning = False
+
+    def scan_in_background(self, base_dir: str = "outputs") -> threading.Thread:
+        def run():
+            try:
+                print(f"Catalog scan of {base_dir}: {self.scan(base_dir)}")
+            except Exception as e:
+                print(f"Catalog scan failed: {e}")
+
+        self.scanning = True
+        thread = threading.Thread(target=run, name="catalog-scan", daemon=True)
+        thread.start()
+        return thread
+
+    def _scan(self, base_dir: str) -> dict:
+        from storage import get_output_store
+
+        conn = self._conn()
+        base = os.path.join(os.path.abspath(base_dir), "")
+        known = {}
+        for path, mtime_ns in conn.execute("SELECT metadata_path, mtime_ns FROM images"):
+            known[path] = mtime_ns
+        for path, mtime_ns in conn.execute("SELECT path, mtime_ns FROM skipped_files"):
+            known[path] = mtime_ns
+
+        seen, added, skipped = set(), 0, 0
+        with conn:
+            for root, dirs, files in os.walk(base_dir):
+                dirs[:] = [d for d in dirs if not d.startswith(".")]
+                for name in files:
+                    if not name.endswith(".json") or name.startswith("."):
+                        continue
+                    path = os.path.join(root, name)
+                    seen.add(path)
+                    try:
+                        mtime_ns = os.stat(path).st_mtime_ns
+                    except OSError:
+                        continue
+                    if known.get(path) == mtime_ns:
+                        continue
+                    try:
+                        with open(path, "r", encoding="utf-8") as f:
+                            metadata = json.load(f)
+                    except (OSError, ValueError):
+                        metadata = None
+                    if not isinstance(metadata, dict) or "prompt" not in metadata or "files" not in metadata:
+                        conn.execute("INSERT OR REPLACE INTO skipped_files VALUES (?, ?)", (path, mtime_ns))
+                        skipped += 1
+                        continue
+                    self._upsert(conn, self._row(metadata, path))
+                    added += 1
+                    if added % SCAN_BATCH == 0:
+                        conn.commit()
+
+            store = get_output_store()
+            if store is not None:
+                for path, metadata in store.compacted(base_dir):
+                    seen.add(path)
+                    if path not in known:
+                        self._upsert(conn, self._row(metadata, path))
+                        added += 1
+
+            gone = [p for p in known if os.path.abspath(p).startswith(base) and p not in seen]
+            for path in gone:
+                conn.execute("DELETE FROM images WHERE metadata_path = ?", (path,))
+                conn.execute("DELETE FROM skipped_files WHERE path = ?", (path,))
+        return {"indexed": added, "skipped": skipped, "removed": len(gone), "total": self.count()}
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(db_path: str = None):
+    # One Catalog per database file and process; None if disabled in config
+    if db_path is None:
+        from utils import load_config
+        catalog_cfg = load_config().get("catalog", {})
+        if not catalog_cfg.get("enabled", True):
+            return None
+        db_path = catalog_cfg.get("path", "outputs/catalog.sqlite3")
+    with _catalogs_lock:
+        if db_path not in _catalogs:
+            _catalogs[db_path] = Catalog(db_path)
+        return _catalogs[db_path]
+
+
+if __name__ == "__main__":
+    # python catalog.py [outputs ...]  -- index (or re-index) existing outputs
+    import sys
+    catalog = get_catalog()
+    for directory in sys.argv[1:] or ["outputs"]:
+        print(directory, catalog.scan(directory))
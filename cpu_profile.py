@@ -0,0 +1,86 @@
+# cpu_profile.py
+import contextlib
+import torch
+
+# Opt-in CPU performance settings, read from "cpu_profile" in
+# config/model_config.json. Every option is off unless the profile is enabled;
+# benchmarks/bench_cpu_profile.py measures each one against plain float32.
+DEFAULT_CPU_PROFILE = {
+    "enabled": False,
+    "bf16_autocast": False,
+    "channels_last": False,
+    "torch_compile": False,
+    "fused_attention": False,
+    # Dynamic int8 for the Linear layers of these modules (quantization.py),
+    # cached on disk after the first conversion
+    "int8_dynamic": False,
+    "int8_modules": ("unet", "text_encoder"),
+    "int8_cache_dir": "cache/quantized",
+    "intra_op_threads": None,
+    "inter_op_threads": None
+}
+
+
+def resolve_profile(profile: dict = None) -> dict:
+    resolved = dict(DEFAULT_CPU_PROFILE)
+    resolved.update(profile or {})
+    return resolved
+
+
+def bf16_supported() -> bool:
+    # Needs AVX512-BF16 or AMX; elsewhere bf16 autocast is emulated and slower
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def apply_thread_settings(profile: dict):
+    # Must run before the first parallel op; torch refuses to change the
+    # inter-op pool once it has been used
+    if profile.get("intra_op_threads"):
+        torch.set_num_threads(int(profile["intra_op_threads"]))
+    if profile.get("inter_op_threads"):
+        try:
+            torch.set_num_interop_threads(int(profile["inter_op_threads"]))
+        except RuntimeError as e:
+            print(f"Could not set inter-op threads: {e}")
+
+
+def apply_cpu_profile(pipe, profile: dict) -> dict:
+    # Applies the model-level options to a loaded pipeline and returns the
+    # options that actually took effect
+    applied = {}
+
+    if profile.get("fused_attention"):
+        # Scaled-dot-product attention fuses QK^T, softmax and V into one
+        # kernel instead of materialising the attention matrix step by step
+        from diffusers.models.attention_processor import AttnProcessor2_0
+        pipe.unet.set_attn_processor(AttnProcessor2_0())
+        pipe.vae.set_attn_processor(AttnProcessor2_0())
+        applied["fused_attention"] = True
+
+    if profile.get("channels_last"):
+        pipe.unet.to(memory_format=torch.channels_last)
+        pipe.vae.to(memory_format=torch.channels_last)
+        applied["channels_last"] = True
+
+    if profile.get("bf16_autocast"):
+        if bf16_supported():
+            applied["bf16_autocast"] = True
+        else:
+            print("bf16 autocast requested but this CPU has no native bf16 support; staying in float32")
+
+    if profile.get("torch_compile"):
+        # Compiles lazily on the first call, which is then much slower
+        pipe.unet = torch.compile(pipe.unet)
+        applied["torch_compile"] = True
+
+    applied["intra_op_threads"] = torch.get_num_threads()
+    return applied
+
+
+def cpu_autocast(applied: dict):
+    if applied.get("bf16_autocast"):
+        return torch.autocast("cpu", dtype=torch.bfloat16)
+    return contextlib.nullcontext()
@@ -0,0 +1,108 @@
+# deadlines.py
+import threading
+
+# Below this many steps images are mostly noise, so a deadline that can't fit
+# them fails the request up front instead of returning garbage
+MIN_STEPS = 4
+# Plan to finish this far inside the deadline; step times jitter
+SAFETY_MARGIN = 0.9
+
+
+class GenerationCancelled(Exception):
+    # Raised out of generate_batch() at the next step once nobody wants the
+    # images any more (every request of the batch was cancelled)
+    pass
+
+
+class DeadlineExceeded(GenerationCancelled):
+    # The request's latency deadline can't be met, or has already passed
+    pass
+
+
+class StepCostModel:
+    # Learns how long generations take on this machine from finished
+    # GenerationTelemetry records: seconds per denoising step, plus the text
+    # encode and decode around them, per (batch size, height, width). An
+    # exponential moving average, so a warm pipeline quickly replaces the cold
+    # start. Shapes not seen yet are scaled by megapixels from the closest
+    # one. Used to pick how many steps fit into a deadline.
+
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self._costs = {}  # (batch_size, height, width) -> [step_s, fixed_s]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _megapixels(shape) -> float:
+        batch_size, height, width = shape
+        return max(batch_size, 1) * height * width / 1e6
+
+    def observe(self, telemetry):
+        shape = (telemetry.batch_size, telemetry.height, telemetry.width)
+        steps = telemetry.steps_used or telemetry.step
+        if not self._megapixels(shape) or not steps or not telemetry.step_s:
+            return
+        # With sub-batches every step is recorded once per chunk, so use the
+        # whole denoise time rather than a per-step average
+        step_s = telemetry.denoise_s / steps
+        fixed_s = telemetry.text_encode_s + telemetry.decode_s
+        with self._lock:
+            costs = self._costs.get(shape)
+            if costs is None:
+                self._costs[shape] = [step_s, fixed_s]
+            else:
+                costs[0] += self.alpha * (step_s - costs[0])
+                costs[1] += self.alpha * (fixed_s - costs[1])
+
+    @property
+    def known(self) -> bool:
+        return bool(self._costs)
+
+    def costs(self, batch_size: int, height: int, width: int):
+        # (step_s, fixed_s) for the shape, or None before any measurement
+        shape = (batch_size, height, width)
+        with self._lock:
+            if shape in self._costs:
+                return tuple(self._costs[shape])
+            if not self._costs:
+                return None
+            mp = self._megapixels(shape)
+            nearest = min(self._costs, key=lambda known: abs(self._megapixels(known) - mp))
+            scale = mp / self._megapixels(nearest)
+            return tuple(cost * scale for cost in self._costs[nearest])
+
+    def estimate_s(self, steps: int, batch_size: int, height: int, width: int) -> float:
+        step_s, fixed_s = self.costs(batch_size, height, width)
+        return steps * step_s + fixed_s
+
+    def fit(self, telemetry, requested: int) -> int:
+        # Step count for a generate_batch() call whose batch size and image
+        # size are already on `telemetry`; records requested and used steps
+        steps = requested
+        if telemetry.deadline is not None and telemetry.fit_to_deadline:
+            steps = self.plan_steps(requested, telemetry.batch_size, telemetry.height, telemetry.width,
+                                    telemetry.remaining_s)
+        telemetry.steps_requested = requested
+        telemetry.steps_used = steps
+        return steps
+
+    def plan_steps(self, requested: int, batch_size: int, height: int, width: int, remaining_s: float,
+                   min_steps: int = MIN_STEPS) -> int:
+        # The most steps (up to `requested`) that finish within remaining_s.
+        # Without measurements yet the request runs as asked and is only
+        # stopped if it overruns.
+        if remaining_s <= 0:
+            raise DeadlineExceeded("Deadline passed before generation started")
+        costs = self.costs(batch_size, height, width)
+        if costs is None:
+            return requested
+        step_s, fixed_s = costs
+        budget = remaining_s * SAFETY_MARGIN - fixed_s
+        steps = min(requested, int(budget / step_s) if step_s > 0 else requested)
+        floor = min(min_steps, requested)
+        if steps < floor:
+            raise DeadlineExceeded(
+                f"{floor} steps of {batch_size}x{width}x{height} need "
+                f"~{self.estimate_s(floor, batch_size, height, width):.1f}s, {remaining_s:.1f}s left"
+            )
+        return steps
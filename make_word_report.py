@@ -1,19 +1,40 @@
 # make_word_report.py
+#
+#   python make_word_report.py                 # rebuild only if something changed
+#   python make_word_report.py --force --max-px 1100 --workers 8
+#
+# Images are embedded as report-resolution JPEG thumbnails, made in parallel
+# and cached by content hash in deliverable/.report_cache/. Every section is
+# fingerprinted; if none changed since the last run the existing document is
+# kept as it is.
 import os
+import io
 import json
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from docx import Document
 from docx.shared import Inches, Pt
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+from PIL import Image
 
 ROOT = os.path.abspath(os.path.dirname(__file__))
 DELIVERABLE_DIR = os.path.join(ROOT, "deliverable")
 MANIFEST_PATH = os.path.join(DELIVERABLE_DIR, "manifest.json")
 CAPTIONS_PATH = os.path.join(DELIVERABLE_DIR, "captions.md")
 OUTPUT_DOC = os.path.join(ROOT, "AI_Trial_Submission.docx")
+CACHE_DIR = os.path.join(DELIVERABLE_DIR, ".report_cache")
 
 CODE_FILES = ["app.py", "model.py", "utils.py"]
 README_PATH = os.path.join(ROOT, "README.md")
 
+IMAGE_WIDTH_IN = 5.5
+# 200 dpi at the embedded width: sharp in print, a fraction of a full-size JPEG
+DEFAULT_MAX_PX = 1100
+THUMB_QUALITY = 85
+# Bump when the layout code changes, so cached plans don't hide it
+LAYOUT_VERSION = 2
+
 def load_manifest(path):
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
@@ -23,6 +44,84 @@ def read_text(path):
     with open(path, "r", encoding="utf-8") as f:
         return f.read()
 
+def parse_captions(text: str) -> dict:
+    # captions.md in one pass: {file path: {"title": ..., "caption": ...}}.
+    # A line ending in an image path starts an entry; the "Title:" and
+    # "Caption:" lines that follow it belong to that entry.
+    captions = {}
+    current = None
+    for line in (text or "").splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        key, _, value = stripped.partition(":")
+        key = key.strip().lower()
+        if key in ("title", "caption"):
+            if current is not None and not current[key]:
+                current[key] = value.strip()
+        elif stripped.split()[-1].lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
+            current = captions.setdefault(stripped.split()[-1], {"title": "", "caption": ""})
+    return captions
+
+def find_caption(captions: dict, file_rel: str) -> str:
+    # Exact path first, then the old behaviour of matching on the path suffix
+    if file_rel in captions:
+        return captions[file_rel]["caption"]
+    for path, entry in captions.items():
+        if path.endswith(file_rel):
+            return entry["caption"]
+    return ""
+
+def file_digest(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def make_thumbnail(img_path: str, cache_dir: str, max_px: int = DEFAULT_MAX_PX, quality: int = THUMB_QUALITY) -> str:
+    # Report-resolution JPEG of img_path, cached under the hash of the source
+    # bytes and the settings; the same picture under another name is reused
+    content_hash = file_digest(img_path)
+    thumb_path = os.path.join(cache_dir, "thumbs", f"{content_hash}_{max_px}_{quality}.jpg")
+    if os.path.exists(thumb_path):
+        return thumb_path
+
+    with Image.open(img_path) as im:
+        # JPEG decoders can skip straight to a reduced scale
+        im.draft("RGB", (max_px, max_px))
+        im = im.convert("RGB")
+        im.thumbnail((max_px, max_px), Image.LANCZOS)
+        buffer = io.BytesIO()
+        im.save(buffer, format="JPEG", quality=quality)
+        data = buffer.getvalue()
+    if len(data) >= os.path.getsize(img_path) and img_path.lower().endswith((".jpg", ".jpeg")):
+        # Already small enough; re-encoding would only lose quality
+        with open(img_path, "rb") as f:
+            data = f.read()
+
+    os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+    tmp_path = f"{thumb_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, thumb_path)
+    return thumb_path
+
+def make_thumbnails(paths: list, cache_dir: str, max_px: int = DEFAULT_MAX_PX, workers: int = None) -> dict:
+    # {source path: thumbnail path or the exception}; Pillow releases the GIL
+    # while decoding, resizing and encoding, so threads scale
+    paths = [p for p in dict.fromkeys(paths) if os.path.exists(p)]
+    workers = workers or min(8, os.cpu_count() or 1)
+
+    def run(path):
+        try:
+            return make_thumbnail(path, cache_dir, max_px)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail") as pool:
+        return dict(zip(paths, pool.map(run, paths)))
+
 def add_heading(doc, text, level=1):
     doc.add_heading(text, level=level)
 
@@ -34,7 +133,7 @@ def add_paragraph(doc, text, bold=False, italic=False, size=11):
     run.font.size = Pt(size)
     return p
 
-def insert_image_with_caption(doc, img_path, title, caption, meta):
+def insert_image_with_caption(doc, img_path, title, caption, meta, thumb=None):
     if not os.path.exists(img_path):
         add_paragraph(doc, f"[Missing image file: {img_path}]", bold=True)
         return
@@ -42,7 +141,9 @@ def insert_image_with_caption(doc, img_path, title, caption, meta):
     add_paragraph(doc, title, bold=True, size=12)
     # Insert image (fit to ~5.5 inches width)
     try:
-        doc.add_picture(img_path, width=Inches(5.5))
+        if isinstance(thumb, Exception):
+            raise thumb
+        doc.add_picture(thumb or img_path, width=Inches(IMAGE_WIDTH_IN))
     except Exception as e:
         add_paragraph(doc, f"[Could not insert image {img_path} — {e}]", bold=True)
     # Caption and metadata
@@ -57,10 +158,10 @@ def insert_image_with_caption(doc, img_path, title, caption, meta):
     p.add_run(meta_text)
     doc.add_paragraph()  # blank line
 
-def embed_code_files(doc, files):
+def embed_code_files(doc, files, root=ROOT):
     add_heading(doc, "Included code files", level=2)
     for f in files:
-        path = os.path.join(ROOT, f)
+        path = os.path.join(root, f)
         if not os.path.exists(path):
             add_paragraph(doc, f"- {f} (not found)", bold=False)
             continue
@@ -73,14 +174,97 @@ def embed_code_files(doc, files):
         p.paragraph_format.space_after = Pt(6)
         doc.add_paragraph()  # spacer
 
-def build_document():
-    if not os.path.exists(MANIFEST_PATH):
+def image_sections(manifest: list, captions: dict, deliverable_dir: str) -> list:
+    sections = []
+    for entry in manifest:
+        file_rel = entry.get("file")
+        caption = find_caption(captions, file_rel) or entry.get("notes", "")
+        sections.append({
+            "img_path": os.path.join(deliverable_dir, file_rel),
+            "title": entry.get("title", file_rel),
+            "caption": caption,
+            "meta": {
+                "prompt": entry.get("prompt"),
+                "negative_prompt": entry.get("negative_prompt"),
+                "steps": entry.get("steps"),
+                "guidance": entry.get("guidance"),
+                "size": entry.get("size"),
+                "article": entry.get("article")
+            }
+        })
+    return sections
+
+def section_fingerprints(sections: list, readme_text: str, code_files: list, manifest: list,
+                         max_px: int, root: str = ROOT) -> dict:
+    # One fingerprint per document section: the text that goes into it plus
+    # the size and mtime of any file it embeds
+    def fp(*parts):
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+    def stat(path):
+        try:
+            st = os.stat(path)
+            return (st.st_size, st.st_mtime_ns)
+        except OSError:
+            return None
+
+    plan = {"layout": fp(LAYOUT_VERSION, max_px, THUMB_QUALITY), "readme": fp(readme_text)}
+    for i, section in enumerate(sections):
+        plan[f"image:{i}"] = fp(section, stat(section["img_path"]))
+    plan["code"] = fp([(f, stat(os.path.join(root, f))) for f in code_files])
+    plan["manifest"] = fp(manifest)
+    return plan
+
+def load_plan(cache_dir: str) -> dict:
+    try:
+        with open(os.path.join(cache_dir, "plan.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_plan(cache_dir: str, plan: dict):
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, "plan.json"), "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=2)
+
+def build_document(
+    manifest_path: str = MANIFEST_PATH,
+    captions_path: str = CAPTIONS_PATH,
+    deliverable_dir: str = DELIVERABLE_DIR,
+    output_doc: str = OUTPUT_DOC,
+    cache_dir: str = CACHE_DIR,
+    readme_path: str = README_PATH,
+    code_files: list = CODE_FILES,
+    max_px: int = DEFAULT_MAX_PX,
+    workers: int = None,
+    force: bool = False
+) -> dict:
+    # Returns {"rebuilt": bool, "changed": [names of sections that changed]}
+    if not os.path.exists(manifest_path):
         print("manifest.json not found in deliverable/. Create it and re-run.")
-        return
+        return {"rebuilt": False, "changed": []}
 
-    manifest = load_manifest(MANIFEST_PATH)
-    captions_text = read_text(CAPTIONS_PATH) or ""
-    readme_text = read_text(README_PATH) or ""
+    manifest = load_manifest(manifest_path)
+    captions = parse_captions(read_text(captions_path) or "")
+    readme_text = read_text(readme_path) or ""
+    root = os.path.dirname(os.path.abspath(readme_path))
+    sections = image_sections(manifest, captions, deliverable_dir)
+
+    plan = section_fingerprints(sections, readme_text, code_files, manifest, max_px, root)
+    previous = load_plan(cache_dir)
+    changed = [name for name, value in plan.items() if previous.get("sections", {}).get(name) != value]
+    changed += [name for name in previous.get("sections", {}) if name not in plan]
+    up_to_date = (
+        not changed and os.path.exists(output_doc)
+        and previous.get("output_path") == os.path.abspath(output_doc)
+        and previous.get("output") == [os.path.getsize(output_doc), os.stat(output_doc).st_mtime_ns]
+    )
+    if up_to_date and not force:
+        print("Word file is up to date:", output_doc)
+        return {"rebuilt": False, "changed": []}
+
+    # Thumbnails of unchanged images come straight from the cache
+    thumbs = make_thumbnails([s["img_path"] for s in sections], cache_dir, max_px, workers)
 
     doc = Document()
     doc.styles['Normal'].font.name = 'Calibri'
@@ -99,57 +283,38 @@ def build_document():
 
     # Images
     add_heading(doc, "Generated Images and Captions", level=2)
-    for entry in manifest:
-        file_rel = entry.get("file")
-        img_path = os.path.join(DELIVERABLE_DIR, file_rel)
-        title = entry.get("title", file_rel)
-        # find caption from captions.md (simple search)
-        caption = ""
-        try:
-            # parse captions.md naive: look for the file path line and read next lines until blank
-            if captions_text:
-                lines = captions_text.splitlines()
-                idx = None
-                for i, line in enumerate(lines):
-                    if line.strip().endswith(file_rel):
-                        idx = i
-                        break
-                if idx is not None:
-                    # read next non-empty lines as title/caption
-                    # next line title, then 'Caption: ...' lines
-                    # we'll assemble a short caption if present
-                    # safer: search for "Caption:" after idx
-                    cap = ""
-                    for j in range(idx, min(idx+8, len(lines))):
-                        if lines[j].strip().lower().startswith("caption:"):
-                            cap = lines[j].split(":",1)[1].strip()
-                            break
-                    caption = cap
-        except Exception:
-            caption = ""
-
-        if not caption:
-            caption = entry.get("notes", "")
-
-        insert_image_with_caption(doc, img_path, title, caption, {
-            "prompt": entry.get("prompt"),
-            "negative_prompt": entry.get("negative_prompt"),
-            "steps": entry.get("steps"),
-            "guidance": entry.get("guidance"),
-            "size": entry.get("size"),
-            "article": entry.get("article")
-        })
+    for section in sections:
+        insert_image_with_caption(
+            doc, section["img_path"], section["title"], section["caption"], section["meta"],
+            thumb=thumbs.get(section["img_path"])
+        )
 
     # Code files
-    embed_code_files(doc, CODE_FILES)
+    embed_code_files(doc, code_files, root)
 
     # Manifest appendix
     add_heading(doc, "Manifest (full metadata)", level=2)
     add_paragraph(doc, json.dumps(manifest, indent=2, ensure_ascii=False))
 
     # Save
-    doc.save(OUTPUT_DOC)
-    print("Saved Word file:", OUTPUT_DOC)
+    doc.save(output_doc)
+    save_plan(cache_dir, {
+        "sections": plan,
+        "output_path": os.path.abspath(output_doc),
+        "output": [os.path.getsize(output_doc), os.stat(output_doc).st_mtime_ns]
+    })
+    print(f"Saved Word file: {output_doc} ({len(changed)} changed sections)")
+    return {"rebuilt": True, "changed": changed}
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the submission Word document")
+    parser.add_argument("--output", default=OUTPUT_DOC)
+    parser.add_argument("--max-px", type=int, default=DEFAULT_MAX_PX,
+                        help="longest side of embedded images, in pixels")
+    parser.add_argument("--workers", type=int, default=None, help="thumbnail threads")
+    parser.add_argument("--force", action="store_true", help="rebuild even if nothing changed")
+    args = parser.parse_args()
+    build_document(output_doc=args.output, max_px=args.max_px, workers=args.workers, force=args.force)
 
 if __name__ == "__main__":
-    build_document()
+    main()
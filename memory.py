@@ -0,0 +1,211 @@
+# memory.py
+import os
+import sys
+import ctypes
+import resource
+import threading
+
+MB = 1024 ** 2
+
+
+def current_rss() -> int:
+    # Resident set size in bytes; Linux reads /proc, elsewhere falls back to
+    # the process high-water mark
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == "darwin" else usage * 1024
+
+
+def release_free_memory():
+    # glibc keeps freed heap pages resident, which would make a block that
+    # reuses them look free; trimming first makes RSS deltas meaningful
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+class PeakRSSSampler:
+    # Samples RSS on a background thread while a block runs, so each
+    # benchmark case gets its own peak instead of the lifetime maximum
+    def __init__(self, interval_s: float = 0.005):
+        self.interval_s = interval_s
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._stop.wait(self.interval_s)
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+        return False
+
+
+class PeakMemory:
+    # Peak memory while a block runs: the CUDA allocator's peak on GPU, the
+    # sampled process RSS on CPU. `delta` is the growth over the start, i.e.
+    # what the block needed on top of the resident weights. Disabled, it
+    # measures nothing and both stay 0: on CPU measuring costs a heap trim
+    # and a polling thread, so callers only enable it when they use the result.
+    def __init__(self, device: str, enabled: bool = True, interval_s: float = 0.05):
+        self.device = device
+        self.enabled = enabled
+        self.interval_s = interval_s
+        self.baseline = 0
+        self.peak = 0
+        self._sampler = None
+
+    @property
+    def delta(self) -> int:
+        return max(self.peak - self.baseline, 0)
+
+    def __enter__(self):
+        if not self.enabled:
+            return self
+        if self.device == "cuda":
+            import torch
+            torch.cuda.reset_peak_memory_stats()
+            self.baseline = torch.cuda.memory_allocated()
+        else:
+            release_free_memory()
+            self._sampler = PeakRSSSampler(self.interval_s).__enter__()
+            self.baseline = self._sampler.peak
+        return self
+
+    def __exit__(self, *exc):
+        if not self.enabled:
+            return False
+        if self.device == "cuda":
+            import torch
+            self.peak = torch.cuda.max_memory_allocated()
+        else:
+            self._sampler.__exit__(*exc)
+            self.peak = self._sampler.peak
+        return False
+
+
+class MemoryPlan:
+    # How one generate_batch() call is run to stay under a memory budget
+    def __init__(self, sub_batch: int, sequential_decode: bool = False, vae_tiling: bool = False,
+                 estimated_bytes: int = 0, fits: bool = True):
+        self.sub_batch = sub_batch
+        self.sequential_decode = sequential_decode
+        self.vae_tiling = vae_tiling
+        self.estimated_bytes = estimated_bytes
+        self.fits = fits
+
+    def to_dict(self) -> dict:
+        return {
+            "sub_batch": self.sub_batch,
+            "sequential_decode": self.sequential_decode,
+            "vae_tiling": self.vae_tiling,
+            "estimated_bytes": self.estimated_bytes,
+            "fits": self.fits
+        }
+
+
+class MemoryPlanner:
+    # Estimates the working memory of a generation (on top of the weights)
+    # from the pipeline's shapes, and picks the cheapest settings that fit a
+    # byte budget. Rough by design; observe() scales the estimates by what
+    # was actually measured on this machine.
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+        self.correction = 1.0
+
+    def _dtype_bytes(self) -> int:
+        return self.pipe.unet.dtype.itemsize
+
+    def _fused_attention(self, module) -> bool:
+        # Scaled-dot-product attention never materialises the T x T scores
+        return all(type(p).__name__ == "AttnProcessor2_0" for p in module.attn_processors.values())
+
+    def denoise_bytes(self, samples: int, height: int, width: int) -> int:
+        # samples counts the unconditional copies of classifier-free guidance
+        d = self._dtype_bytes()
+        tokens = (height // 8) * (width // 8)
+        channels = self.pipe.unet.config.block_out_channels[0]
+        # Residual/norm tensors and the GEGLU feed-forward (8x channels) at
+        # full latent resolution dominate
+        total = samples * tokens * channels * 16 * d
+        if not self._fused_attention(self.pipe.unet):
+            heads = self.pipe.unet.config.attention_head_dim
+            heads = heads[0] if isinstance(heads, (list, tuple)) else heads
+            total += samples * heads * tokens * tokens * d
+        return total
+
+    def decode_bytes(self, images: int, height: int, width: int, vae_tiling: bool) -> int:
+        d = self._dtype_bytes()
+        pixels = height * width
+        vae = self.pipe.vae
+        if vae_tiling:
+            tile = getattr(vae, "tile_sample_min_size", 512)
+            pixels = min(pixels, tile * tile)
+        channels = vae.config.block_out_channels
+        # The last up block runs at full resolution on block_out_channels[0]
+        # channels, fed by an upsampled block_out_channels[1] tensor
+        per_pixel = (channels[1] + 3 * channels[0]) * d
+        total = images * pixels * per_pixel
+        if not self._fused_attention(vae):
+            latent_pixels = pixels // 64
+            total += images * latent_pixels * latent_pixels * d
+        # The decoded float images themselves
+        return total + images * height * width * 3 * 4
+
+    def estimate(self, batch: int, height: int, width: int, plan: MemoryPlan) -> int:
+        denoise = self.denoise_bytes(2 * plan.sub_batch, height, width)
+        decode_images = 1 if plan.sequential_decode else batch
+        decode = self.decode_bytes(decode_images, height, width, plan.vae_tiling)
+        return int(max(denoise, decode) * self.correction)
+
+    def plan(self, batch: int, height: int, width: int, budget: int = None) -> MemoryPlan:
+        # Cheapest first: decoding one image at a time only costs a little
+        # speed, smaller sub-batches cost throughput. VAE tiling comes last
+        # because it slightly changes the image at the seams. Denoising has no
+        # other knob: with the default scaled-dot-product attention there are
+        # no score matrices for attention slicing to shrink.
+        sub_batches = [batch]
+        while sub_batches[-1] > 1:
+            sub_batches.append((sub_batches[-1] + 1) // 2)
+
+        candidates = []
+        for sub_batch in sub_batches:
+            for sequential_decode in (False, True):
+                candidates.append(MemoryPlan(sub_batch, sequential_decode))
+        tile = getattr(self.pipe.vae, "tile_sample_min_size", 512)
+        if height * width > tile * tile:
+            for sub_batch in sub_batches:
+                candidates.append(MemoryPlan(sub_batch, True, True))
+
+        for plan in candidates:
+            plan.estimated_bytes = self.estimate(batch, height, width, plan)
+            if budget is None or plan.estimated_bytes <= budget:
+                return plan
+        # Nothing fits: run with the smallest footprint and say so
+        plan = candidates[-1]
+        plan.fits = False
+        return plan
+
+    def observe(self, plan: MemoryPlan, measured_bytes: int):
+        # Moves the correction factor towards measured / estimated
+        if plan.estimated_bytes <= 0 or measured_bytes <= 0:
+            return
+        raw = plan.estimated_bytes / self.correction
+        ratio = min(max(measured_bytes / raw, 0.25), 4.0)
+        self.correction = 0.7 * self.correction + 0.3 * ratio
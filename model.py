@@ -1,24 +1,218 @@
 # model.py
+import time
+import contextlib
+import threading
 import torch
 from diffusers import StableDiffusionPipeline
+from PIL import Image
+from deadlines import StepCostModel
+from cpu_profile import apply_cpu_profile, apply_thread_settings, cpu_autocast, resolve_profile
+from memory import MB, MemoryPlan, MemoryPlanner, PeakMemory
+from previews import latents_to_rgb
+from prompt_cache import PromptEmbeddingCache
+from quantization import int8_supported, load_quantized, quantize_pipeline
+from schedulers import build_scheduler
+from sweeps import run_sweep
+from telemetry import GenerationTelemetry, MetricsRegistry
+
+
+class _SampleGuidancePipeline(StableDiffusionPipeline):
+    # The stock pipeline takes a single guidance scale for the whole batch.
+    # Setting sample_guidance to a (batch, 1, 1, 1) tensor lets every image of
+    # one batched call use its own scale in the classifier-free guidance step.
+    sample_guidance = None
+
+    @property
+    def guidance_scale(self):
+        if self.sample_guidance is not None:
+            return self.sample_guidance
+        return self._guidance_scale
+
+
+def _equal_scale_runs(guidance_scales: list, start: int, end: int) -> list:
+    # (start, end) ranges of [start, end) over which the guidance scale stays
+    # the same
+    runs = []
+    for i in range(start, end):
+        if runs and guidance_scales[i] == guidance_scales[runs[-1][0]]:
+            runs[-1] = (runs[-1][0], i + 1)
+        else:
+            runs.append((i, i + 1))
+    return runs
+
 
 class Text2ImageGenerator:
-    def __init__(self, model_name: str = "runwayml/stable-diffusion-v1-5"):
+    def __init__(
+        self,
+        model_name: str = "runwayml/stable-diffusion-v1-5",
+        embedding_cache: PromptEmbeddingCache = None,
+        scheduler: str = "default",
+        metrics: MetricsRegistry = None,
+        cpu_profile: dict = None,
+        use_safetensors: bool = None,
+        components: dict = None,
+        memory_budget_mb: float = None
+    ):
         # Detect device
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"Using device: {self.device}")
 
+        # Opt-in CPU tuning (see cpu_profile.py); thread pools are sized before
+        # loading because torch can't resize the inter-op pool once used
+        self.cpu_profile = resolve_profile(cpu_profile)
+        use_cpu_profile = self.device == "cpu" and self.cpu_profile["enabled"]
+        if use_cpu_profile:
+            apply_thread_settings(self.cpu_profile)
+
+        # Dynamic int8 (quantization.py): modules quantized on an earlier start
+        # come from the cache instead of loading their float32 weights
+        int8_modules = []
+        if use_cpu_profile and self.cpu_profile["int8_dynamic"]:
+            if int8_supported():
+                int8_modules = list(self.cpu_profile["int8_modules"])
+                missing = [name for name in int8_modules if name not in (components or {})]
+                cached = load_quantized(model_name, missing, self.cpu_profile["int8_cache_dir"])
+                components = dict(cached, **(components or {}))
+            else:
+                print("int8 quantization requested but this torch build has no quantized CPU engine; staying in float32")
+
         # Load pipeline
         dtype = torch.float16 if self.device == "cuda" else torch.float32
 
-        self.pipe = StableDiffusionPipeline.from_pretrained(
+        # safetensors files are memory-mapped and, with low_cpu_mem_usage, copied
+        # straight into modules created on the meta device (no random init first)
+        self.model_name = model_name
+        self.pipe = _SampleGuidancePipeline.from_pretrained(
             model_name,
             torch_dtype=dtype,
-            safety_checker=None  # simple manual filtering will be used instead
+            use_safetensors=use_safetensors,
+            low_cpu_mem_usage=True,
+            safety_checker=None,  # simple manual filtering will be used instead
+            # Already-loaded modules (e.g. a VAE shared by a PipelinePool) are
+            # used as they are instead of being loaded again
+            **(components or {})
         )
 
         self.pipe = self.pipe.to(self.device)
 
+        self.cpu_options = {}
+        profile = self.cpu_profile
+        if int8_modules:
+            self.cpu_options["int8_dynamic"] = quantize_pipeline(
+                self.pipe, model_name, int8_modules, profile["int8_cache_dir"]
+            )
+            if profile["bf16_autocast"]:
+                # Quantized Linear layers only take float32 activations
+                print("bf16 autocast is not combined with int8 quantization; using int8 only")
+                profile = dict(profile, bf16_autocast=False)
+        if use_cpu_profile:
+            self.cpu_options.update(apply_cpu_profile(self.pipe, profile))
+            print(f"CPU profile: {self.cpu_options}")
+
+        # Text-encoder outputs are reused across requests and across the images
+        # of one request (styled prompts and negative prompts repeat a lot)
+        self.embedding_cache = embedding_cache or PromptEmbeddingCache()
+
+        # Scheduler instances are built once per name and swapped in per call,
+        # under _pipe_lock like everything else generate_batch() sets on the pipe
+        self._schedulers = {"default": self.pipe.scheduler}
+        self._pipe_lock = threading.Lock()
+        self.default_scheduler = scheduler
+        self.get_scheduler(scheduler)
+
+        # Aggregated timings of every pipeline call (Prometheus / JSONL export)
+        self.metrics = metrics or MetricsRegistry()
+        # Measured cost per step, for fitting the step count into a deadline
+        self.step_costs = StepCostModel()
+
+        # Working-memory budget per call (on top of the weights); None = unlimited
+        self.memory_budget = int(memory_budget_mb * MB) if memory_budget_mb else None
+        self.memory_planner = MemoryPlanner(self.pipe)
+
+    @property
+    def scheduler_name(self) -> str:
+        return self.default_scheduler
+
+    def get_scheduler(self, name: str):
+        if name not in self._schedulers:
+            self._schedulers[name] = build_scheduler(name, self._schedulers["default"].config)
+        return self._schedulers[name]
+
+    def _autocast(self):
+        # Autocast for GPU to save memory and speed up; bf16 on CPU only when
+        # the CPU profile turned it on
+        if self.device == "cuda":
+            return torch.autocast(self.device)
+        return cpu_autocast(self.cpu_options)
+
+    def warm_up(self, num_inference_steps: int = 1, height: int = 256, width: int = 256) -> float:
+        # Runs one throwaway generation through the full path; its timings are
+        # kept out of the metrics so they don't skew the ETA estimates
+        start = time.perf_counter()
+        metrics, self.metrics = self.metrics, MetricsRegistry()
+        step_costs, self.step_costs = self.step_costs, StepCostModel()
+        try:
+            self.generate("warm up", num_inference_steps=num_inference_steps, height=height, width=width, seeds=[0])
+        finally:
+            self.metrics = metrics
+            self.step_costs = step_costs
+        return time.perf_counter() - start
+
+    def encode_prompts(self, texts: list):
+        # Returns a (len(texts), seq, dim) tensor, running the text encoder only
+        # for distinct strings that are not cached yet
+        embeds = {}
+        missing = []
+        for text in dict.fromkeys(texts):
+            cached = self.embedding_cache.get(text)
+            if cached is None:
+                missing.append(text)
+            else:
+                embeds[text] = cached
+
+        if missing:
+            with torch.no_grad(), self._autocast():
+                encoded, _ = self.pipe.encode_prompt(
+                    missing,
+                    device=self.device,
+                    num_images_per_prompt=1,
+                    do_classifier_free_guidance=False
+                )
+            for text, embed in zip(missing, encoded):
+                embed = embed.unsqueeze(0)
+                self.embedding_cache.put(text, embed)
+                embeds[text] = embed
+
+        if len(embeds) == 1:
+            # Same prompt for every image: broadcast instead of copying
+            return embeds[texts[0]].expand(len(texts), -1, -1)
+        return torch.cat([embeds[text] for text in texts])
+
+    def decode_latents(self, latents, sequential: bool = False):
+        # Same VAE decode + postprocess the pipeline does, kept separate so it
+        # can be timed on its own. Sequential decoding holds the VAE
+        # activations of one image at a time.
+        batches = latents.split(1) if sequential else [latents]
+        images = []
+        for batch in batches:
+            with torch.no_grad(), self._autocast():
+                decoded = self.pipe.vae.decode(
+                    batch / self.pipe.vae.config.scaling_factor, return_dict=False
+                )[0]
+            images += self.pipe.image_processor.postprocess(decoded, output_type="pil")
+        return images
+
+    @contextlib.contextmanager
+    def _memory_settings(self, plan: MemoryPlan):
+        # Turns on the plan's VAE tiling for one call
+        tiling = self.pipe.vae.use_tiling
+        try:
+            if plan.vae_tiling:
+                self.pipe.vae.enable_tiling()
+            yield
+        finally:
+            self.pipe.vae.use_tiling = tiling
+
     def generate(
         self,
         prompt: str,
@@ -27,28 +221,164 @@ class Text2ImageGenerator:
         guidance_scale: float = 7.5,
         num_inference_steps: int = 30,
         height: int = 512,
-        width: int = 512
+        width: int = 512,
+        seeds: list = None,
+        scheduler: str = None,
+        telemetry: GenerationTelemetry = None,
+        memory_budget: int = None
     ):
-        # Autocast for GPU to save memory and speed up
-        if self.device == "cuda":
-            with torch.autocast(self.device):
-                result = self.pipe(
-                    prompt=[prompt] * num_images,
-                    negative_prompt=[negative_prompt] * num_images if negative_prompt else None,
-                    guidance_scale=guidance_scale,
-                    num_inference_steps=num_inference_steps,
-                    height=height,
-                    width=width
-                )
-        else:
-            result = self.pipe(
-                prompt=[prompt] * num_images,
-                negative_prompt=[negative_prompt] * num_images if negative_prompt else None,
-                guidance_scale=guidance_scale,
-                num_inference_steps=num_inference_steps,
-                height=height,
-                width=width
-            )
+        return self.generate_batch(
+            prompts=[prompt] * num_images,
+            negative_prompts=[negative_prompt] * num_images,
+            guidance_scales=[guidance_scale] * num_images,
+            num_inference_steps=num_inference_steps,
+            height=height,
+            width=width,
+            seeds=seeds,
+            scheduler=scheduler,
+            telemetry=telemetry,
+            memory_budget=memory_budget
+        )
+
+    def generate_sweep(
+        self,
+        prompt: str,
+        seeds: list,
+        guidance_scales: list,
+        negative_prompts: list = ("",),
+        **kwargs
+    ) -> dict:
+        # Every seed x guidance scale x negative prompt of one prompt in a
+        # single generate_batch() call, plus a contact sheet (see sweeps.py)
+        return run_sweep(self, prompt, seeds, guidance_scales, negative_prompts, **kwargs)
+
+    def generate_batch(
+        self,
+        prompts: list,
+        negative_prompts: list,
+        guidance_scales: list,
+        num_inference_steps: int = 30,
+        height: int = 512,
+        width: int = 512,
+        seeds: list = None,
+        scheduler: str = None,
+        telemetry: GenerationTelemetry = None,
+        memory_budget: int = None
+    ):
+        # One pipeline call for a batch of images; prompts, negative_prompts and
+        # guidance_scales hold one entry per image, so requests from different
+        # users with the same size and step count can share a UNet pass.
+        # Pass a GenerationTelemetry to get called back after every step, to
+        # cancel between steps or to set a deadline (which may lower
+        # num_inference_steps; telemetry.steps_used has the count run).
+        # memory_budget (bytes) overrides the generator's default budget.
+        if telemetry is None:
+            telemetry = GenerationTelemetry()
+        telemetry.batch_size = len(prompts)
+        telemetry.height = height
+        telemetry.width = width
+        telemetry.check()
+        num_inference_steps = self.step_costs.fit(telemetry, num_inference_steps)
+        telemetry.total_steps = num_inference_steps
+        telemetry.expected_decode_s = self.metrics.mean_decode_s()
+
+        # An empty negative prompt encodes "", which is what the pipeline
+        # uses for the unconditional branch anyway
+        encode_start = time.perf_counter()
+        prompt_embeds = self.encode_prompts(list(prompts))
+        negative_prompt_embeds = self.encode_prompts([n or "" for n in negative_prompts])
+        telemetry.text_encode_s = time.perf_counter() - encode_start
+
+        # One generator per image, so an image depends only on its own seed and
+        # not on which other requests it was batched with
+        generators = None
+        if seeds is not None:
+            generators = [torch.Generator(device=self.device).manual_seed(int(s)) for s in seeds]
+
+        # The scheduler, per-sample guidance and memory settings live on the
+        # shared pipeline, so overlapping calls (the batching worker, warm-up,
+        # sweeps, batch runs) take turns from here to the decoded images
+        with self._pipe_lock:
+            self.pipe.scheduler = self.get_scheduler(scheduler or self.default_scheduler)
+
+            # Under a memory budget the batch may be denoised in sub-batches and
+            # decoded image by image; the images don't change, only the peak does
+            budget = memory_budget if memory_budget is not None else self.memory_budget
+            plan = self.memory_planner.plan(len(prompts), height, width, budget)
+            telemetry.memory_plan = plan.to_dict()
+            if not plan.fits:
+                print(f"No memory plan fits {budget / MB:.0f} MB for {len(prompts)}x{width}x{height}; "
+                      f"using the smallest ({plan.estimated_bytes / MB:.0f} MB estimated)")
+            chunks = [(start, min(start + plan.sub_batch, len(prompts)))
+                      for start in range(0, len(prompts), plan.sub_batch)]
+            if self.pipe.unet.config.get("time_cond_proj_dim") is not None:
+                # UNets that embed the guidance scale (LCM) take one scalar per
+                # call, so per-sample guidance can't apply; split at each change
+                chunks = [run for start, end in chunks for run in _equal_scale_runs(guidance_scales, start, end)]
+
+            previews = [None] * len(prompts)
 
-        images = result.images
+            def render_previews(latents, start):
+                # Sub-batches fill in their slice; the others keep their last preview
+                images = latents_to_rgb(latents)
+                if not images:
+                    return []
+                previews[start:start + len(images)] = images
+                blank = Image.new("RGB", images[0].size, (64, 64, 64))
+                return [img or blank for img in previews]
+
+            telemetry.mark()
+            latents = []
+            # Measured for the planner under a budget, else only when asked for
+            measure = budget is not None or telemetry.measure_memory
+            with PeakMemory(self.device, enabled=measure) as peak, self._memory_settings(plan):
+                for start, end in chunks:
+                    def on_step_end(pipe, step, timestep, callback_kwargs, start=start):
+                        # Some schedulers run a different number of timesteps than requested
+                        telemetry.total_steps = pipe.num_timesteps * len(chunks)
+                        telemetry.record_step()
+                        # Raising here leaves the denoising loop right away
+                        telemetry.check()
+                        if telemetry.wants_preview():
+                            chunk_latents = callback_kwargs["latents"]
+                            telemetry.preview(lambda: render_previews(chunk_latents, start))
+                        return callback_kwargs
+
+                    chunk_scales = guidance_scales[start:end]
+                    if len(set(chunk_scales)) > 1:
+                        self.pipe.sample_guidance = torch.tensor(
+                            chunk_scales, device=self.device, dtype=self.pipe.unet.dtype
+                        ).view(-1, 1, 1, 1)
+                    try:
+                        with self._autocast():
+                            result = self.pipe(
+                                prompt_embeds=prompt_embeds[start:end],
+                                negative_prompt_embeds=negative_prompt_embeds[start:end],
+                                guidance_scale=max(chunk_scales),
+                                num_inference_steps=num_inference_steps,
+                                height=height,
+                                width=width,
+                                generator=generators[start:end] if generators else None,
+                                output_type="latent",
+                                callback_on_step_end=on_step_end
+                            )
+                    finally:
+                        self.pipe.sample_guidance = None
+                    latents.append(result.images)
+                    del result
+
+                telemetry.check()
+                decode_start = time.perf_counter()
+                images = self.decode_latents(torch.cat(latents), sequential=plan.sequential_decode)
+                telemetry.decode_s = time.perf_counter() - decode_start
+
+        telemetry.peak_bytes = peak.peak
+        telemetry.peak_delta_bytes = peak.delta
+        self.memory_planner.observe(plan, peak.delta)
+
+        telemetry.finish()
+        self.step_costs.observe(telemetry)
+        self.metrics.record(
+            telemetry, model=self.model_name, scheduler=scheduler or self.default_scheduler
+        )
         return images
@@ -0,0 +1,135 @@
+# model_loader.py
+import threading
+import time
+
+
+class ModelLoader:
+    # Imports torch/diffusers, loads the pipeline and warms it up on a daemon
+    # thread, so the UI can render straight away and poll `status` / `ready`.
+    # Nothing heavy is imported by this module itself. With pool_kwargs the
+    # generator comes from a PipelinePool (its default model), so other models
+    # can be loaded later on demand.
+
+    def __init__(self, generator_kwargs: dict = None, warm_up: dict = None, pool_kwargs: dict = None):
+        self.generator_kwargs = dict(generator_kwargs or {})
+        self.warm_up = warm_up
+        self.pool_kwargs = pool_kwargs
+        self.pool = None
+        self.generator = None
+        self.status = "starting"
+        self.error = None
+        self.timings = {}
+        self.started_at = time.perf_counter()
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="model-loader", daemon=True)
+        self._thread.start()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set() and self.generator is not None
+
+    @property
+    def failed(self) -> bool:
+        return self._ready.is_set() and self.generator is None
+
+    @property
+    def elapsed_s(self) -> float:
+        return self.timings.get("cold_start_s", time.perf_counter() - self.started_at)
+
+    def wait(self, timeout: float = None) -> bool:
+        self._ready.wait(timeout)
+        return self.ready
+
+    def _stage(self, name: str, status: str):
+        self.status = status
+        self._stage_name = name
+        self._stage_start = time.perf_counter()
+
+    def _end_stage(self):
+        self.timings[self._stage_name + "_s"] = time.perf_counter() - self._stage_start
+
+    def _run(self):
+        try:
+            self._stage("import", "importing torch and diffusers")
+            from model import Text2ImageGenerator
+            self._end_stage()
+
+            self._stage("load", "loading model weights")
+            if self.pool_kwargs is not None:
+                from pipeline_pool import PipelinePool
+                self.pool = PipelinePool(generator_kwargs=self.generator_kwargs, **self.pool_kwargs)
+                generator = self.pool.acquire()
+            else:
+                generator = Text2ImageGenerator(**self.generator_kwargs)
+            self._end_stage()
+
+            if self.warm_up is not None:
+                # One tiny generation pays the first-call costs (allocator,
+                # kernel selection, lazy init) before a user request does
+                self._stage("warm_up", "warming up the pipeline")
+                generator.warm_up(**self.warm_up)
+                self._end_stage()
+
+            self.timings["cold_start_s"] = time.perf_counter() - self.started_at
+            for name, value in self.timings.items():
+                generator.metrics.set_gauge(f"startup_{name[:-2]}_seconds", value)
+            self.generator = generator
+            self.status = "ready"
+            print(f"Model ready in {self.timings['cold_start_s']:.1f}s: {self.timings}")
+        except Exception as e:
+            self.error = e
+            self.status = "failed"
+            print(f"Model loading failed: {e}")
+        finally:
+            self._ready.set()
+
+    def record_request(self, latency_s: float):
+        # Keeps the latency of the first generation after startup
+        with self._lock:
+            if "first_request_s" in self.timings:
+                return
+            self.timings["first_request_s"] = latency_s
+        if self.generator is not None:
+            self.generator.metrics.set_gauge("startup_first_request_seconds", latency_s)
+
+
+def loader_from_config(config: dict, metrics=None) -> ModelLoader:
+    # The app's and the API server's loader, from model_config.json. Every
+    # model in "models" can be requested; the pool keeps as many resident as
+    # fit in model_pool.max_mb and loads the others on demand.
+    from pipeline_pool import models_from_config
+    from telemetry import MetricsRegistry
+
+    cache_cfg = config.get("embedding_cache", {})
+    telemetry_cfg = config.get("telemetry", {})
+    startup = config.get("startup", {})
+    warm_up = None
+    if startup.get("warm_up", True):
+        warm_up = {
+            "num_inference_steps": startup.get("warm_up_steps", 1),
+            "height": startup.get("warm_up_size", 256),
+            "width": startup.get("warm_up_size", 256)
+        }
+    models, default_model = models_from_config(config)
+    return ModelLoader(
+        generator_kwargs={
+            "scheduler": config.get("scheduler", "default"),
+            "metrics": metrics or MetricsRegistry(jsonl_path=telemetry_cfg.get("jsonl_path")),
+            "cpu_profile": config.get("cpu_profile"),
+            "use_safetensors": startup.get("use_safetensors"),
+            "memory_budget_mb": config.get("memory", {}).get("budget_mb")
+        },
+        warm_up=warm_up,
+        pool_kwargs={
+            "models": models,
+            "default_model": default_model,
+            "max_bytes": int(config.get("model_pool", {}).get("max_mb", 8192) * 1024 * 1024),
+            "workers": config.get("process_pool", {}).get("workers", 0),
+            "threads_per_worker": config.get("process_pool", {}).get("threads_per_worker"),
+            "embedding_cache_kwargs": {
+                "max_entries": cache_cfg.get("max_entries", 256),
+                "max_bytes": int(cache_cfg.get("max_mb", 64) * 1024 * 1024)
+            }
+        }
+    )
@@ -0,0 +1,145 @@
+# output_formats.py
+import io
+import os
+import json
+import threading
+from PIL import Image
+
+# Keys double as the keys of metadata["files"]
+FORMATS = {
+    "png": {"ext": "png", "pil": "PNG", "mime": "image/png"},
+    "jpg": {"ext": "jpg", "pil": "JPEG", "mime": "image/jpeg"},
+    "webp": {"ext": "webp", "pil": "WEBP", "mime": "image/webp"}
+}
+
+DEFAULT_OPTIONS = {
+    # Pillow's defaults; compress_level 1-3 is several times faster for
+    # slightly bigger files, optimize is slower still for slightly smaller ones
+    "png": {"compress_level": 6, "optimize": False},
+    "jpg": {"quality": 95, "progressive": False, "optimize": False},
+    # lossless=True keeps every pixel, usually well below PNG's size
+    "webp": {"quality": 90, "lossless": False, "method": 4}
+}
+
+# formats: first one is the primary (always written); lazy: written only
+# when somebody asks for them (materialize)
+PRESETS = {
+    "png+jpeg": {"formats": ["png", "jpg"], "lazy": []},
+    "jpeg+png_on_demand": {"formats": ["jpg", "png"], "lazy": ["png"]},
+    "webp": {"formats": ["webp", "png"], "lazy": ["png"]},
+    "webp_lossless": {"formats": ["webp", "jpg"], "lazy": ["jpg"], "webp": {"lossless": True}}
+}
+
+
+class OutputPolicy:
+    # Which formats an output is saved in, with which encoder settings, and
+    # which of them are only produced on demand. Configured per deployment in
+    # the "output_formats" section of model_config.json.
+
+    def __init__(self, formats: list = ("png", "jpg"), lazy: list = (), **options):
+        unknown = [f for f in list(formats) + list(lazy) if f not in FORMATS]
+        if unknown or not formats:
+            raise ValueError(f"Unknown output format(s) {unknown}; choose from {', '.join(FORMATS)}")
+        self.formats = list(dict.fromkeys(formats))
+        # The primary format is what the app shows, so it is never lazy
+        self.lazy = [f for f in self.formats[1:] if f in lazy]
+        self.options = {
+            name: dict(DEFAULT_OPTIONS[name], **(options.get(name) or {})) for name in FORMATS
+        }
+
+    @classmethod
+    def from_config(cls, config: dict = None):
+        # {"preset": "webp", "webp": {"quality": 85}} or explicit
+        # {"formats": [...], "lazy": [...], "png": {...}, ...}
+        config = dict(config or {})
+        preset = dict(PRESETS[config.pop("preset", "png+jpeg")])
+        for name in FORMATS:
+            preset[name] = dict(preset.get(name) or {}, **(config.pop(name, None) or {}))
+        preset.update(config)
+        return cls(**preset)
+
+    @property
+    def primary(self) -> str:
+        return self.formats[0]
+
+    @property
+    def eager(self) -> list:
+        return [f for f in self.formats if f not in self.lazy]
+
+    def encode(self, image: Image.Image, fmt: str) -> bytes:
+        if fmt == "jpg":
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format=FORMATS[fmt]["pil"], **self.options[fmt])
+        return buffer.getvalue()
+
+    def encode_all(self, image: Image.Image, formats: list = None) -> dict:
+        # {format: bytes} for `formats`, by default every eager one
+        return {fmt: self.encode(image, fmt) for fmt in (formats or self.eager)}
+
+    def to_dict(self) -> dict:
+        return {
+            "formats": self.formats,
+            "lazy": self.lazy,
+            "options": {f: self.options[f] for f in self.formats}
+        }
+
+
+_materialize_lock = threading.Lock()
+
+
+def format_path(metadata_path: str, fmt: str) -> str:
+    # Every file of an output shares the metadata file's name
+    return os.path.splitext(metadata_path)[0] + "." + FORMATS[fmt]["ext"]
+
+
+def materialize(metadata_path: str, fmt: str, policy: OutputPolicy, image: Image.Image = None, catalog=None) -> str:
+    # Path of the output in `fmt`, encoding and saving it first if it was
+    # deferred. Encodes from `image` when the caller still has it, else from
+    # the stored primary file (a lossy primary stays lossy). The metadata
+    # file and the catalog are updated to list the new file.
+    from storage import get_output_store, read_metadata
+
+    with _materialize_lock:
+        # The metadata may have been compacted into a segment; it is written
+        # back out as a file with the new format listed
+        metadata = read_metadata(metadata_path)
+        files = metadata.setdefault("files", {})
+        if files.get(fmt) and os.path.exists(files[fmt]):
+            return files[fmt]
+
+        if image is None:
+            source = next((p for p in files.values() if p and os.path.exists(p)), None)
+            if source is None:
+                raise FileNotFoundError(f"No stored image for {metadata_path}")
+            with Image.open(source) as stored:
+                image = stored.copy()
+
+        path = format_path(metadata_path, fmt)
+        data = policy.encode(image, fmt)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+        files[fmt] = path
+        with open(metadata_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=4)
+        os.replace(metadata_path + ".tmp", metadata_path)
+    store = get_output_store()
+    if store is not None:
+        store.add(metadata, metadata_path)
+    if catalog is not None:
+        catalog.add(metadata, metadata_path)
+    return path
+
+
+_policy = None
+
+
+def get_output_policy() -> OutputPolicy:
+    # The deployment's policy from model_config.json, built once per process
+    global _policy
+    if _policy is None:
+        from utils import load_config
+        _policy = OutputPolicy.from_config(load_config().get("output_formats"))
+    return _policy
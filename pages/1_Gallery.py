@@ -0,0 +1,122 @@
+# pages/1_Gallery.py
+# History of generated images, paged from the SQLite catalog (catalog.py)
+# instead of listing and parsing the output files.
+import os
+from datetime import datetime, time as dtime, timedelta
+import streamlit as st
+# Streamlit puts app.py's directory on sys.path for every page
+from catalog import get_catalog
+from storage import get_output_store
+from output_formats import FORMATS, format_path, get_output_policy, materialize
+
+st.set_page_config(
+    page_title="Gallery • AI-Powered Text-to-Image Generator",
+    page_icon="🖼️",
+    layout="wide"
+)
+
+COLUMNS = 4
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def file_bytes(path: str, mtime_ns: int) -> bytes:
+    # mtime_ns is only part of the cache key: a rewritten file is read again
+    with open(path, "rb") as f:
+        return f.read()
+
+catalog = get_catalog()
+policy = get_output_policy()
+st.title("Gallery")
+if catalog is None:
+    st.info("The catalog is disabled (`catalog.enabled` in config/model_config.json).")
+    st.stop()
+
+# ---------- FILTERS ----------
+with st.sidebar:
+    st.markdown("### Filters")
+    text = st.text_input("Prompt contains", placeholder="e.g. lighthouse sunset")
+    model_options = ["All models"] + catalog.models()
+    model = st.selectbox("Model", model_options)
+    seed = st.number_input("Seed (-1 = any)", min_value=-1, value=-1, step=1)
+    dates = st.date_input("Created between", value=())
+    page_size = st.selectbox("Per page", [12, 24, 48], index=1)
+    if st.button("Rescan outputs/"):
+        st.success(f"Rescan: {catalog.scan('outputs')}")
+
+filters = {
+    "model": None if model == "All models" else model,
+    "seed": None if seed < 0 else int(seed)
+}
+if len(dates) == 2:
+    filters["since"] = datetime.combine(dates[0], dtime.min)
+    filters["until"] = datetime.combine(dates[1] + timedelta(days=1), dtime.min)
+
+# Back to the first page whenever the filters change
+query = (text, tuple(sorted((k, str(v)) for k, v in filters.items())), page_size)
+if st.session_state.get("gallery_query") != query:
+    st.session_state.gallery_query = query
+    st.session_state.gallery_page = 0
+
+if catalog.scanning:
+    st.caption("Scanning outputs/ for images saved while the app was stopped; more appear as it fills in.")
+
+total = catalog.count(text, **filters)
+pages = max(1, -(-total // page_size))
+page = min(st.session_state.gallery_page, pages - 1)
+
+# ---------- PAGER ----------
+prev_col, info_col, next_col = st.columns([1, 4, 1])
+if prev_col.button("← Newer", disabled=page == 0):
+    st.session_state.gallery_page = page - 1
+    st.rerun()
+if next_col.button("Older →", disabled=page >= pages - 1):
+    st.session_state.gallery_page = page + 1
+    st.rerun()
+info_col.markdown(f"{total} images • page {page + 1} of {pages}")
+
+# ---------- GRID ----------
+entries = catalog.search(text, limit=page_size, offset=page * page_size, **filters)
+if not entries:
+    st.info("No images match these filters yet.")
+store = get_output_store()
+if store is not None:
+    # Shown images count as used for the retention budget
+    store.touch(*(entry["metadata_path"] for entry in entries))
+
+for start in range(0, len(entries), COLUMNS):
+    cols = st.columns(COLUMNS)
+    for col, entry in zip(cols, entries[start:start + COLUMNS]):
+        with col:
+            image_path = entry["image_path"] or entry["png_path"] or entry["jpg_path"]
+            if image_path and os.path.exists(image_path):
+                st.image(image_path, use_container_width=True)
+            else:
+                # Evicted (result cache or storage retention) or deleted; the next rescan drops it
+                st.markdown("*file no longer on disk*")
+            st.caption(
+                f"{entry['prompt'][:120]}\n\n"
+                f"{entry['created_at'].replace('T', ' ')} • seed {entry['seed']} • "
+                f"{entry['steps']} steps • {entry['width']}x{entry['height']}"
+            )
+            # Files are only read once their downloads are asked for, not on
+            # every rerun of the page
+            prepared = st.session_state.setdefault("gallery_prepared", set())
+            if image_path and os.path.exists(image_path) and entry["id"] not in prepared:
+                if st.button("Prepare downloads", key=f"prepare_{entry['id']}"):
+                    prepared.add(entry["id"])
+                    st.rerun()
+            elif image_path and os.path.exists(image_path):
+                for fmt in policy.formats:
+                    path = format_path(entry["metadata_path"], fmt)
+                    if os.path.exists(path):
+                        st.download_button(
+                            f"Download {fmt.upper()}", file_bytes(path, os.stat(path).st_mtime_ns),
+                            file_name=os.path.basename(path), mime=FORMATS[fmt]["mime"],
+                            key=f"{fmt}_{entry['id']}"
+                        )
+                    elif st.button(f"Create {fmt.upper()}", key=f"make_{fmt}_{entry['id']}"):
+                        # Deferred by the output policy; encoded from the stored file now
+                        materialize(entry["metadata_path"], fmt, policy, catalog=catalog)
+                        st.rerun()
+            with st.expander("Details"):
+                st.json({k: v for k, v in entry.items() if k != "mtime_ns"})
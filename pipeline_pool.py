@@ -0,0 +1,289 @@
+# pipeline_pool.py
+import gc
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from prompt_cache import PromptEmbeddingCache
+from telemetry import MetricsRegistry
+
+# Pipeline components that are often identical across checkpoints of the same
+# family (fine-tunes usually keep the SD 1.5 VAE and CLIP text encoder)
+SHARED_COMPONENTS = ("vae", "text_encoder", "tokenizer")
+
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+
+def _file_hash(path: str) -> str:
+    # Content hash of one weight/config file, memoised by size and mtime
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _file_hashes_lock:
+        if key in _file_hashes:
+            return _file_hashes[key]
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    with _file_hashes_lock:
+        _file_hashes[key] = digest.hexdigest()
+    return _file_hashes[key]
+
+
+def local_model_dir(model_name: str):
+    # Local checkout, or the Hugging Face cache snapshot if already downloaded
+    if os.path.isdir(model_name):
+        return model_name
+    try:
+        from huggingface_hub import snapshot_download
+        return snapshot_download(model_name, local_files_only=True)
+    except Exception:
+        return None
+
+
+def component_fingerprint(model_dir: str, component: str):
+    # Hash over every file of the component's subfolder, so two checkpoints
+    # share a component only if its weights and config are byte-identical
+    folder = os.path.join(model_dir, component)
+    if not os.path.isdir(folder):
+        return None
+    digest = hashlib.sha256(component.encode("utf-8"))
+    for root, _, files in sorted(os.walk(folder)):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, folder).encode("utf-8"))
+            digest.update(_file_hash(path).encode("ascii"))
+    return digest.hexdigest()
+
+
+def models_from_config(config: dict) -> tuple:
+    # ({display name: hub id or path}, default name) from model_config.json;
+    # model_name is always available, under its own id if "models" lacks it
+    model_name = config.get("model_name", "runwayml/stable-diffusion-v1-5")
+    models = dict(config.get("models") or {})
+    default = next((name for name, path in models.items() if path == model_name), None)
+    if default is None:
+        default = model_name
+        models = dict({model_name: model_name}, **models)
+    return models, default
+
+
+def module_bytes(module) -> int:
+    total = sum(p.numel() * p.element_size() for p in module.parameters())
+    return total + sum(b.numel() * b.element_size() for b in module.buffers())
+
+
+class PipelinePool:
+    # Keeps several Text2ImageGenerators resident up to a RAM budget and evicts
+    # the least recently used one when a new model doesn't fit. Components
+    # listed in SHARED_COMPONENTS are loaded once and reused by every model
+    # whose files for them are identical; so is the prompt embedding cache of a
+    # shared text encoder.
+
+    def __init__(self, models: dict, default_model: str = None, max_bytes: int = 8 * 1024 ** 3,
+                 generator_kwargs: dict = None, embedding_cache_kwargs: dict = None,
+                 workers: int = 0, threads_per_worker: int = None):
+        # models: display name -> hub id or local path. With workers > 0 every
+        # model is served by a ProcessPoolGenerator instead (process_pool.py)
+        self.models = dict(models)
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.default_model = default_model or next(iter(self.models))
+        self.max_bytes = max_bytes
+        self.generator_kwargs = dict(generator_kwargs or {})
+        self.embedding_cache_kwargs = dict(embedding_cache_kwargs or {})
+        self.generator_kwargs.pop("embedding_cache", None)
+        # One registry for all models; records are labelled with the model
+        self.metrics = self.generator_kwargs.pop("metrics", None) or MetricsRegistry()
+
+        self._generators = OrderedDict()  # name -> generator, least recently used first
+        self._shared = {}                 # fingerprint -> component object
+        self._embedding_caches = {}       # text encoder fingerprint -> cache
+        self._sizes = {}                  # name -> unshared bytes, from the last load
+        self._loading = {}                # name -> Event set when its load ends
+        self._lock = threading.RLock()
+
+        self.loads = 0
+        self.evictions = 0
+        self.shared_hits = 0
+        self.load_s = {}
+
+    def resolve(self, model: str = None) -> str:
+        name = model or self.default_model
+        if name not in self.models:
+            raise KeyError(f"Unknown model '{name}'. Available: {', '.join(self.models)}")
+        return name
+
+    def acquire(self, model: str = None):
+        # Returns the generator for `model`, loading it (and evicting others)
+        # if needed. Evicted generators must no longer be used by callers.
+        # The load itself runs outside the lock, so peek() and stats() answer
+        # while it takes its time; other callers of the same model wait for it.
+        name = self.resolve(model)
+        while True:
+            with self._lock:
+                if name in self._generators:
+                    self._generators.move_to_end(name)
+                    return self._generators[name]
+                loading = self._loading.get(name)
+                if loading is None:
+                    self._loading[name] = threading.Event()
+                    # Make room up front when we know roughly how big the model is
+                    self._evict_until(self._sizes.get(name, 0), keep=None)
+                    break
+            # Loaded by another caller; if that load failed, try again here
+            loading.wait()
+
+        try:
+            generator = self._load(name)
+            with self._lock:
+                self._generators[name] = generator
+                self._evict_until(0, keep=name)
+                self._update_gauges()
+            return generator
+        finally:
+            with self._lock:
+                self._loading.pop(name).set()
+
+    def _load(self, name: str):
+        model_name = self.models[name]
+        start = time.perf_counter()
+        fingerprints = self._component_fingerprints(model_name)
+        with self._lock:
+            components = {c: self._shared[fp] for c, fp in fingerprints.items() if fp in self._shared}
+            self.shared_hits += len(components)
+            embedding_cache = self._embedding_cache(fingerprints.get("text_encoder"))
+
+        kwargs = dict(
+            model_name=model_name,
+            embedding_cache=embedding_cache,
+            metrics=self.metrics,
+            components=components,
+            **self.generator_kwargs
+        )
+        if self.workers > 0:
+            from process_pool import ProcessPoolGenerator
+            generator = ProcessPoolGenerator(workers=self.workers, threads_per_worker=self.threads_per_worker, **kwargs)
+        else:
+            from model import Text2ImageGenerator
+            generator = Text2ImageGenerator(**kwargs)
+
+        # First load of a hub model: its files are only local now
+        downloaded = not fingerprints
+        if downloaded:
+            fingerprints = self._component_fingerprints(model_name)
+        with self._lock:
+            if downloaded:
+                generator.embedding_cache = self._embedding_cache(fingerprints.get("text_encoder"))
+            for component, fp in fingerprints.items():
+                self._shared.setdefault(fp, getattr(generator.pipe, component))
+
+            self.load_s[name] = time.perf_counter() - start
+            self.loads += 1
+            self._sizes[name] = self._unshared_bytes(generator)
+        print(f"Loaded model '{name}' in {self.load_s[name]:.1f}s "
+              f"({len(components)} shared components, {self._sizes[name] / 1024 ** 2:.0f} MB own weights)")
+        return generator
+
+    def _component_fingerprints(self, model_name: str) -> dict:
+        model_dir = local_model_dir(model_name)
+        if model_dir is None:
+            return {}
+        fingerprints = {}
+        for component in SHARED_COMPONENTS:
+            fp = component_fingerprint(model_dir, component)
+            if fp is not None:
+                fingerprints[component] = fp
+        return fingerprints
+
+    def _embedding_cache(self, text_encoder_fp: str):
+        if text_encoder_fp is None:
+            return PromptEmbeddingCache(**self.embedding_cache_kwargs)
+        if text_encoder_fp not in self._embedding_caches:
+            self._embedding_caches[text_encoder_fp] = PromptEmbeddingCache(**self.embedding_cache_kwargs)
+        return self._embedding_caches[text_encoder_fp]
+
+    def _modules(self, generator) -> dict:
+        import torch
+        return {
+            id(module): module for module in generator.pipe.components.values()
+            if isinstance(module, torch.nn.Module)
+        }
+
+    def _unshared_bytes(self, generator) -> int:
+        # Weights this generator holds that no other resident one does
+        held = set()
+        for other in self._generators.values():
+            if other is not generator:
+                held.update(self._modules(other))
+        return sum(module_bytes(m) for mid, m in self._modules(generator).items() if mid not in held)
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            modules = {}
+            for generator in self._generators.values():
+                modules.update(self._modules(generator))
+            return sum(module_bytes(m) for m in modules.values())
+
+    def _evict_until(self, incoming_bytes: int, keep: str):
+        while self._generators:
+            if self.resident_bytes() + incoming_bytes <= self.max_bytes:
+                return
+            victim = next((n for n in self._generators if n != keep), None)
+            if victim is None:
+                # The model in use doesn't fit on its own; keep it anyway
+                return
+            self._evict(victim)
+
+    def _evict(self, name: str):
+        generator = self._generators.pop(name)
+        if hasattr(generator, "close"):
+            # Worker processes of a ProcessPoolGenerator
+            generator.close()
+        self.evictions += 1
+        # Forget shared components nobody holds any more, so they can be freed
+        in_use = set()
+        for generator in self._generators.values():
+            in_use.update(id(c) for c in generator.pipe.components.values())
+        for fp in [fp for fp, c in self._shared.items() if id(c) not in in_use]:
+            del self._shared[fp]
+            self._embedding_caches.pop(fp, None)
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+        print(f"Evicted model '{name}' from the pipeline pool")
+
+    def _update_gauges(self):
+        self.metrics.set_gauge("pool_resident_bytes", self.resident_bytes())
+        self.metrics.set_gauge("pool_resident_models", len(self._generators))
+        self.metrics.set_counter("pool_loads_total", self.loads)
+        self.metrics.set_counter("pool_evictions_total", self.evictions)
+        self.metrics.set_counter("pool_shared_components_total", self.shared_hits)
+
+    def peek(self, model: str = None):
+        # The resident generator for `model`, or None; never loads or evicts
+        with self._lock:
+            return self._generators.get(model or self.default_model)
+
+    def resident(self) -> list:
+        with self._lock:
+            return list(self._generators)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "resident": list(self._generators),
+                "loading": list(self._loading),
+                "resident_bytes": self.resident_bytes(),
+                "max_bytes": self.max_bytes,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "shared_components": self.shared_hits,
+                "load_s": dict(self.load_s)
+            }
@@ -0,0 +1,122 @@
+# postprocess.py
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from PIL import Image
+from output_formats import get_output_policy, materialize
+from utils import add_watermark, encode_image, prepare_output, write_outputs
+
+
+class ProcessedImage:
+    # A watermarked image with its encoded bytes. The same bytes back the
+    # download buttons and the files on disk; `saved` resolves once the
+    # background writer has put them there. Formats the policy defers are
+    # encoded by data() the first time somebody asks for them.
+    def __init__(self, image, encoded, metadata, metadata_path, saved, policy=None, catalog=None):
+        self.image = image
+        self.encoded = encoded
+        self.metadata = metadata
+        self.metadata_path = metadata_path
+        self.saved = saved
+        self.policy = policy or get_output_policy()
+        self.catalog = catalog
+
+    @property
+    def png_bytes(self) -> bytes:
+        return self.encoded.get("png")
+
+    @property
+    def jpg_bytes(self) -> bytes:
+        return self.encoded.get("jpg")
+
+    @property
+    def png_path(self) -> str:
+        return self.metadata["files"].get("png")
+
+    @property
+    def jpg_path(self) -> str:
+        return self.metadata["files"].get("jpg")
+
+    def data(self, fmt: str) -> bytes:
+        # Bytes in `fmt`; a deferred format is encoded from the in-memory
+        # image (so a PNG of a JPEG-primary output is still lossless) and saved
+        if fmt not in self.encoded:
+            self.saved.result()
+            path = materialize(self.metadata_path, fmt, self.policy, image=self.image, catalog=self.catalog)
+            self.metadata["files"][fmt] = path
+            with open(path, "rb") as f:
+                self.encoded[fmt] = f.read()
+        return self.encoded[fmt]
+
+
+class OutputPipeline:
+    # Watermarking and encoding run on a thread pool (Pillow releases the GIL
+    # while encoding), and disk writes go to a single background writer so they
+    # stay off the request path. With a catalog, every written image is also
+    # indexed there (see catalog.py). `policy` (output_formats.py) picks the
+    # formats and encoder settings.
+
+    def __init__(self, max_workers: int = 4, catalog=None, policy=None):
+        self.catalog = catalog
+        self.policy = policy or get_output_policy()
+        self._encoders = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="encode")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="disk-writer")
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def _track(self, future: Future) -> Future:
+        with self._lock:
+            self._in_flight.add(future)
+        future.add_done_callback(self._untrack)
+        return future
+
+    def _untrack(self, future: Future):
+        with self._lock:
+            self._in_flight.discard(future)
+
+    def submit(
+        self,
+        image: Image.Image,
+        base_dir: str,
+        prompt: str,
+        negative_prompt: str,
+        params: dict,
+        index: int = 0,
+        watermark: bool = True,
+        on_saved=None
+    ) -> Future:
+        # Resolves to a ProcessedImage as soon as the bytes are ready; on_saved
+        # is called with it once the files are written
+        return self._track(self._encoders.submit(
+            self._process, image, base_dir, prompt, negative_prompt, params, index, watermark, on_saved
+        ))
+
+    def _process(self, image, base_dir, prompt, negative_prompt, params, index, watermark, on_saved):
+        if watermark:
+            image = add_watermark(image)
+        encoded = encode_image(image, self.policy)
+        metadata, metadata_path = prepare_output(base_dir, prompt, negative_prompt, params, index, list(encoded))
+
+        processed = ProcessedImage(
+            image, encoded, metadata, metadata_path, saved=None, policy=self.policy, catalog=self.catalog
+        )
+        processed.saved = self._track(self._writer.submit(self._write, processed, on_saved))
+        return processed
+
+    def _write(self, processed, on_saved):
+        write_outputs(processed.metadata, processed.metadata_path, dict(processed.encoded), catalog=self.catalog)
+        if on_saved is not None:
+            on_saved(processed)
+        return processed
+
+    def flush(self):
+        # Waits for every queued encode and write
+        while True:
+            with self._lock:
+                pending = list(self._in_flight)
+            if not pending:
+                return
+            wait(pending)
+
+    def shutdown(self):
+        self._encoders.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
@@ -0,0 +1,32 @@
+# previews.py
+from PIL import Image
+
+# Linear map from the 4 Stable Diffusion 1.x latent channels to RGB in [-1, 1].
+# 12 multiply-adds per latent pixel (1/64 of the output pixels) instead of a
+# full VAE decode: blurry and slightly off in colour, but good enough to watch
+# the composition form.
+SD_LATENT_RGB_FACTORS = [
+    [0.3512, 0.2297, 0.3227],
+    [0.3250, 0.4974, 0.2350],
+    [-0.2829, 0.1762, 0.2721],
+    [-0.2120, -0.2616, -0.7177]
+]
+
+
+def latents_to_rgb(latents, size: tuple = None) -> list:
+    # latents: (batch, 4, h, w) tensor, as passed to callback_on_step_end.
+    # Returns one PIL image per sample at latent resolution (1/8 of the final
+    # size) unless `size` is given; empty if the latent space is not SD 1.x's.
+    import torch
+
+    if latents.ndim != 4 or latents.shape[1] != len(SD_LATENT_RGB_FACTORS):
+        return []
+    with torch.no_grad():
+        factors = torch.tensor(SD_LATENT_RGB_FACTORS, dtype=torch.float32, device=latents.device)
+        rgb = torch.einsum("bchw,cr->bhwr", latents.float(), factors)
+        rgb = ((rgb + 1) / 2).clamp(0, 1).mul(255).to(torch.uint8).cpu().numpy()
+
+    images = [Image.fromarray(array) for array in rgb]
+    if size is not None:
+        images = [img.resize(size, Image.BILINEAR) for img in images]
+    return images
@@ -0,0 +1,393 @@
+# process_pool.py
+import os
+import time
+import queue
+import itertools
+import threading
+from PIL import Image
+from deadlines import GenerationCancelled, StepCostModel
+from telemetry import GenerationTelemetry, MetricsRegistry
+from utils import make_seeds
+
+# Modules whose weights are moved into shared memory and handed to workers
+SHARED_MODULES = ("unet", "vae", "text_encoder")
+# Ids of the most recently cancelled jobs, shared with the workers
+CANCEL_SLOTS = 64
+
+
+def share_module_weights(module) -> int:
+    # Packs every parameter and buffer of `module` into one shared-memory block
+    # per dtype and points the module at views of it. Workers that receive the
+    # module map the same pages instead of holding their own copy, and only a
+    # handful of blocks (not one per tensor) cross the process boundary.
+    import torch
+
+    tensors = list(itertools.chain(module.parameters(), module.buffers()))
+    if all(t.is_shared() for t in tensors):
+        # Already shared, e.g. a VAE a PipelinePool reuses across models
+        return 0
+    by_dtype = {}
+    for tensor in tensors:
+        by_dtype.setdefault(tensor.dtype, []).append(tensor)
+
+    shared = 0
+    with torch.no_grad():
+        for dtype, tensors in by_dtype.items():
+            block = torch.empty(sum(t.numel() for t in tensors), dtype=dtype).share_memory_()
+            offset = 0
+            for tensor in tensors:
+                view = block[offset:offset + tensor.numel()].view_as(tensor)
+                view.copy_(tensor)
+                tensor.data = view
+                offset += tensor.numel()
+            shared += block.numel() * block.element_size()
+    return shared
+
+
+def _worker_main(index, model_name, components, generator_kwargs, threads, tasks, results, cancelled):
+    import torch
+    torch.set_num_threads(threads)
+    from model import Text2ImageGenerator
+
+    try:
+        generator = Text2ImageGenerator(model_name=model_name, components=components, **generator_kwargs)
+    except Exception as e:
+        results.put(("failed", None, index, repr(e)))
+        return
+    results.put(("ready", None, index, None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        job_id, chunk, deadline, previews, kwargs = task
+
+        def on_step(telemetry, job_id=job_id, chunk=chunk):
+            results.put(("step", job_id, chunk, (telemetry.step, telemetry.total_steps)))
+
+        def on_preview(telemetry, images, job_id=job_id, chunk=chunk):
+            # Latent-resolution images (1/8 of the final size), a few KB each
+            results.put(("preview", job_id, chunk, (telemetry.step, images)))
+
+        # The parent already fitted the steps to the deadline; here it only
+        # stops a chunk that overruns
+        preview_every, preview_budget = previews or (0, 0.0)
+        telemetry = GenerationTelemetry(
+            listeners=[on_step], preview_listeners=[on_preview] if previews else None,
+            preview_every=preview_every, preview_budget=preview_budget,
+            should_cancel=lambda job_id=job_id: job_id in cancelled[:], deadline=deadline
+        )
+        telemetry.fit_to_deadline = False
+        try:
+            images = generator.generate_batch(telemetry=telemetry, **kwargs)
+            results.put(("done", job_id, chunk, (images, telemetry.to_dict())))
+        except GenerationCancelled as e:
+            results.put(("cancelled", job_id, chunk, e))
+        except Exception as e:
+            results.put(("error", job_id, chunk, repr(e)))
+
+
+class _Job:
+    def __init__(self, sizes: list, telemetry: GenerationTelemetry):
+        num_chunks = len(sizes)
+        self.telemetry = telemetry
+        self.sizes = sizes
+        self.steps = [0] * num_chunks
+        self.previews = [None] * num_chunks
+        self.images = [None] * num_chunks
+        self.stats = [None] * num_chunks
+        self.error = None
+        self.cancelled = None
+        self.remaining = num_chunks
+        self.done = threading.Event()
+
+
+class ProcessPoolGenerator:
+    # Same generate_batch() interface as Text2ImageGenerator, backed by worker
+    # processes. The weights are loaded once here, moved to shared memory and
+    # mapped read-only by every worker; each worker runs its own torch thread
+    # pool. The images of a batch are split into one chunk per worker, so both
+    # num_images > 1 and batches of several requests use every worker.
+    # Seeds are per image, so results don't depend on how the batch is split.
+
+    def __init__(
+        self,
+        model_name: str = "runwayml/stable-diffusion-v1-5",
+        workers: int = 2,
+        threads_per_worker: int = None,
+        metrics: MetricsRegistry = None,
+        components: dict = None,
+        embedding_cache=None,
+        cpu_profile: dict = None,
+        **generator_kwargs
+    ):
+        import torch.multiprocessing as mp
+        from model import Text2ImageGenerator
+
+        self.workers = max(1, workers)
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+
+        # Weight layout changes (channels_last, attention processors) happen
+        # here, before sharing; compilation, autocast and threads are per worker
+        profile = dict(cpu_profile or {})
+        local_profile = dict(profile, torch_compile=False, bf16_autocast=False,
+                             intra_op_threads=None, inter_op_threads=None)
+        worker_profile = dict(profile, channels_last=False, intra_op_threads=self.threads_per_worker)
+
+        self.local = Text2ImageGenerator(
+            model_name=model_name, embedding_cache=embedding_cache, metrics=metrics,
+            components=components, cpu_profile=local_profile, **generator_kwargs
+        )
+        self.pipe = self.local.pipe
+        self.device = self.local.device
+        self.model_name = model_name
+        self.default_scheduler = self.local.default_scheduler
+        self.metrics = self.local.metrics
+        self.embedding_cache = self.local.embedding_cache
+        # What the workers run with (for the result cache key): the shared
+        # modules as prepared here, plus their own autocast and compilation
+        self.cpu_options = dict(self.local.cpu_options, **{
+            name: True for name in ("bf16_autocast", "torch_compile") if profile.get("enabled") and profile.get(name)
+        })
+
+        self.shared_bytes = sum(share_module_weights(getattr(self.pipe, name)) for name in SHARED_MODULES)
+        shared = {name: getattr(self.pipe, name) for name in SHARED_MODULES + ("tokenizer",)}
+
+        context = mp.get_context("spawn")
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._cancelled = context.Array("q", [-1] * CANCEL_SLOTS, lock=False)
+        self._cancel_slot = 0
+        worker_kwargs = dict(generator_kwargs, cpu_profile=worker_profile, scheduler=self.default_scheduler)
+        self._processes = [
+            context.Process(
+                target=_worker_main,
+                args=(i, model_name, shared, worker_kwargs, self.threads_per_worker, self._tasks, self._results,
+                      self._cancelled),
+                name=f"t2i-worker-{i}",
+                daemon=True
+            )
+            for i in range(self.workers)
+        ]
+        start = time.perf_counter()
+        try:
+            for process in self._processes:
+                process.start()
+            self._wait_ready()
+        except BaseException:
+            # A worker failed or died during startup: stop the others too
+            self.close()
+            raise
+        print(f"{self.workers} workers x {self.threads_per_worker} threads ready in "
+              f"{time.perf_counter() - start:.1f}s, sharing {self.shared_bytes / 1024 ** 2:.0f} MB of weights")
+
+        self._jobs = {}
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._collector = threading.Thread(target=self._collect, name="process-pool-results", daemon=True)
+        self._collector.start()
+
+    @property
+    def scheduler_name(self) -> str:
+        return self.default_scheduler
+
+    def _wait_ready(self):
+        ready = 0
+        while ready < self.workers:
+            try:
+                kind, _, index, payload = self._results.get(timeout=1.0)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            if kind == "failed":
+                raise RuntimeError(f"Worker {index} failed to start: {payload}")
+            ready += 1
+
+    def _check_workers(self):
+        dead = [p.name for p in self._processes if not p.is_alive()]
+        if dead:
+            raise RuntimeError(f"Worker process(es) died: {', '.join(dead)}")
+
+    def _collect(self):
+        # Routes worker messages to the job they belong to
+        while not self._closed:
+            try:
+                kind, job_id, chunk, payload = self._results.get(timeout=0.5)
+            except (queue.Empty, OSError, EOFError):
+                continue
+            with self._lock:
+                job = self._jobs.get(job_id)
+            if job is None:
+                continue
+            if kind == "step":
+                previous = min(job.steps)
+                job.steps[chunk], total = payload
+                job.telemetry.total_steps = total
+                # The batch has made a step once its slowest chunk has
+                for _ in range(min(job.steps) - previous):
+                    job.telemetry.record_step()
+            elif kind == "preview":
+                job.previews[chunk] = payload[1]
+                job.telemetry.preview(lambda job=job: self._job_previews(job))
+            elif kind in ("done", "error", "cancelled"):
+                if kind == "done":
+                    job.images[chunk], job.stats[chunk] = payload
+                elif kind == "cancelled":
+                    job.cancelled = payload
+                else:
+                    job.error = payload
+                job.remaining -= 1
+                if job.remaining == 0 or job.error or job.cancelled:
+                    job.done.set()
+
+    def _job_previews(self, job: _Job) -> list:
+        # Every chunk's latest preview, in batch order; chunks that haven't
+        # sent one yet are blank
+        size = next(images[0].size for images in job.previews if images)
+        blank = Image.new("RGB", size, (64, 64, 64))
+        return [image for images, n in zip(job.previews, job.sizes) for image in (images or [blank] * n)]
+
+    def _cancel(self, job_id: int):
+        # Workers poll the shared slots at every step; chunks still queued
+        # stop at their first one
+        with self._lock:
+            self._cancelled[self._cancel_slot] = job_id
+            self._cancel_slot = (self._cancel_slot + 1) % CANCEL_SLOTS
+
+    def generate(
+        self,
+        prompt: str,
+        negative_prompt: str = "",
+        num_images: int = 1,
+        guidance_scale: float = 7.5,
+        num_inference_steps: int = 30,
+        height: int = 512,
+        width: int = 512,
+        seeds: list = None,
+        scheduler: str = None,
+        telemetry: GenerationTelemetry = None,
+        memory_budget: int = None
+    ):
+        return self.generate_batch(
+            prompts=[prompt] * num_images,
+            negative_prompts=[negative_prompt] * num_images,
+            guidance_scales=[guidance_scale] * num_images,
+            num_inference_steps=num_inference_steps,
+            height=height,
+            width=width,
+            seeds=seeds,
+            scheduler=scheduler,
+            telemetry=telemetry,
+            memory_budget=memory_budget
+        )
+
+    def generate_batch(
+        self,
+        prompts: list,
+        negative_prompts: list,
+        guidance_scales: list,
+        num_inference_steps: int = 30,
+        height: int = 512,
+        width: int = 512,
+        seeds: list = None,
+        scheduler: str = None,
+        telemetry: GenerationTelemetry = None,
+        memory_budget: int = None
+    ):
+        if telemetry is None:
+            telemetry = GenerationTelemetry()
+        telemetry.batch_size = len(prompts)
+        telemetry.height = height
+        telemetry.width = width
+        telemetry.check()
+        # One step count for every chunk, fitted here from the pool's measured cost
+        num_inference_steps = self.local.step_costs.fit(telemetry, num_inference_steps)
+        telemetry.total_steps = num_inference_steps
+        telemetry.expected_decode_s = self.metrics.mean_decode_s()
+        # Seeds are fixed here so that the split doesn't change any image
+        seeds = list(seeds) if seeds is not None else make_seeds(None, len(prompts))
+
+        size, extra = divmod(len(prompts), self.workers)
+        bounds, start = [], 0
+        for i in range(min(self.workers, len(prompts))):
+            end = start + size + (1 if i < extra else 0)
+            bounds.append((start, end))
+            start = end
+
+        job_id = next(self._job_ids)
+        job = _Job([end - start for start, end in bounds], telemetry)
+        with self._lock:
+            self._jobs[job_id] = job
+        # Workers render the previews and send them back when anyone listens
+        previews = (telemetry.preview_every, telemetry.preview_budget) if telemetry.preview_listeners else None
+        telemetry.mark()
+        for chunk, (start, end) in enumerate(bounds):
+            self._tasks.put((job_id, chunk, telemetry.deadline, previews, {
+                "prompts": prompts[start:end],
+                "negative_prompts": negative_prompts[start:end],
+                "guidance_scales": guidance_scales[start:end],
+                "num_inference_steps": num_inference_steps,
+                "height": height,
+                "width": width,
+                "seeds": seeds[start:end],
+                "scheduler": scheduler,
+                "memory_budget": memory_budget
+            }))
+
+        try:
+            while not job.done.wait(0.1):
+                self._check_workers()
+                telemetry.check()
+        except GenerationCancelled:
+            self._cancel(job_id)
+            raise
+        finally:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+        if job.cancelled is not None:
+            self._cancel(job_id)
+            raise job.cancelled
+        if job.error:
+            # The other chunks' images are no use without this one
+            self._cancel(job_id)
+            raise RuntimeError(f"Generation failed in a worker: {job.error}")
+
+        # Chunks run side by side, so the batch takes as long as the slowest;
+        # memory adds up across processes
+        telemetry.text_encode_s = max(s["text_encode_s"] for s in job.stats)
+        telemetry.decode_s = max(s["decode_s"] for s in job.stats)
+        telemetry.peak_delta_bytes = sum(s["peak_delta_bytes"] for s in job.stats)
+        telemetry.peak_bytes = sum(s["peak_bytes"] for s in job.stats)
+        telemetry.finish()
+        self.local.step_costs.observe(telemetry)
+        self.metrics.record(
+            telemetry, model=self.model_name, scheduler=scheduler or self.default_scheduler,
+            workers=len(bounds)
+        )
+        return [image for images in job.images for image in images]
+
+    def warm_up(self, num_inference_steps: int = 1, height: int = 256, width: int = 256) -> float:
+        # One image per worker, kept out of the metrics
+        start = time.perf_counter()
+        metrics, self.metrics = self.metrics, MetricsRegistry()
+        step_costs, self.local.step_costs = self.local.step_costs, StepCostModel()
+        try:
+            self.generate("warm up", num_images=self.workers, num_inference_steps=num_inference_steps,
+                          height=height, width=width, seeds=list(range(self.workers)))
+        finally:
+            self.metrics = metrics
+            self.local.step_costs = step_costs
+        return time.perf_counter() - start
+
+    def close(self):
+        self._closed = True
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            if process.pid is None:
+                # Never started (startup failed before reaching it)
+                continue
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
@@ -0,0 +1,67 @@
+# prompt_cache.py
+import threading
+from collections import OrderedDict
+
+
+class PromptEmbeddingCache:
+    # Bounded LRU of text-encoder outputs keyed on the exact prompt string.
+    # Limited both by entry count and by the bytes held in the cached tensors,
+    # so long-running servers don't grow without bound.
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(tensor) -> int:
+        return tensor.numel() * tensor.element_size()
+
+    def get(self, text: str):
+        with self._lock:
+            tensor = self._entries.get(text)
+            if tensor is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(text)
+            self.hits += 1
+            return tensor
+
+    def put(self, text: str, tensor):
+        size = self._size(tensor)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(text, None)
+            if old is not None:
+                self._bytes -= self._size(old)
+            self._entries[text] = tensor
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self._size(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
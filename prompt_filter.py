@@ -0,0 +1,170 @@
+# prompt_filter.py
+import os
+import re
+import bisect
+import unicodedata
+
+TERMS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "banned_terms.txt")
+
+# Look-alike characters from other scripts that survive NFKC
+CONFUSABLES = str.maketrans({
+    "а": "a", "е": "e", "о": "o", "р": "p", "с": "c", "у": "y", "х": "x", "і": "i",
+    "ј": "j", "ѕ": "s", "ԁ": "d", "һ": "h", "к": "k", "м": "m", "т": "t", "в": "b",
+    "н": "h", "ո": "n", "α": "a", "β": "b", "ε": "e", "ι": "i", "κ": "k", "ν": "v",
+    "ο": "o", "ρ": "p", "τ": "t", "υ": "u", "χ": "x", "ɡ": "g", "ı": "i", "ℓ": "l"
+})
+
+# Leetspeak is matched inside the compiled pattern ("s3x" hits "sex") rather
+# than translated up front, so "4K" or "nude!" in ordinary text stay as they are
+LEETSPEAK = {
+    "a": "4@", "b": "8", "e": "3", "g": "9", "i": "1!|", "l": "1|",
+    "o": "0", "s": "5$", "t": "7+", "z": "2"
+}
+
+INVISIBLE = dict.fromkeys(map(ord, "\u00ad\u200b\u200c\u200d\u2060\ufeff"), None)
+
+# A term is matched either written out or with the same separator between
+# every pair of letters, so "n.u.d.e" and "s e x" are caught but words that
+# merely run into each other are not ("go re-run", "pen is"); a letter or
+# digit on either side of the match means it is part of a longer, different
+# word ("Essex", "sextant")
+_SEP = r"[^a-z0-9\n]"
+_END = r"(?![a-z0-9])"
+
+
+def normalize(text: str) -> str:
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize("NFKC", text).translate(INVISIBLE)
+    # Strip accents: "nüde" -> "nude"
+    text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return text.casefold().translate(CONFUSABLES)
+
+
+def _char_pattern(char: str) -> str:
+    aliases = LEETSPEAK.get(char)
+    if not aliases:
+        return re.escape(char)
+    return "[" + re.escape(char + aliases) + "]"
+
+
+def load_terms(path: str = TERMS_PATH) -> list:
+    # One term per line; "#" starts a comment; a trailing "*" matches any
+    # word that starts with the term
+    terms = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            term = line.split("#", 1)[0].strip()
+            if term:
+                terms.append(term)
+    return terms
+
+
+def _trie_pattern(words: list, sep: str = "") -> str:
+    # Alternation arranged as a character trie, so the regex engine branches on
+    # the next character instead of retrying every term at each position; sep
+    # goes between the letters
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def emit(node, first):
+        branches = []
+        terminal = "" in node
+        for char in sorted(c for c in node if c):
+            prefix = _char_pattern(char) if first else sep + _char_pattern(char)
+            branches.append(prefix + emit(node[char], False))
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if terminal:
+            body = "(?:" + body + ")?"
+        return body
+
+    return emit(trie, True)
+
+
+def _spellings_pattern(words: list, group: str) -> str:
+    # Written out, or split: the lookahead captures the separator after the
+    # first letter and every later gap must repeat it
+    split = rf"(?=.(?P<{group}>{_SEP}))" + _trie_pattern(words, f"(?P={group})")
+    return "(?:" + _trie_pattern(words) + "|" + split + ")"
+
+
+class PromptFilter:
+    # All terms compiled into one regex over normalised text, so checking a
+    # prompt is a single scan no matter how long the term list is
+
+    def __init__(self, terms: list):
+        words, prefixes = set(), set()
+        for term in terms:
+            norm = normalize(term.strip())
+            letters = re.sub(r"[^a-z0-9]", "", norm)
+            if not letters:
+                continue
+            if norm.endswith("*"):
+                prefixes.add(letters)
+            else:
+                words.add(letters)
+        self.terms = sorted(words) + [p + "*" for p in sorted(prefixes)]
+
+        alternatives = []
+        if words:
+            # Optional plural ending on whole-word terms
+            alternatives.append(_spellings_pattern(sorted(words), "word_sep") + "(?:e?s)?" + _END)
+        if prefixes:
+            alternatives.append(_spellings_pattern(sorted(prefixes), "prefix_sep"))
+        # A leading \b (ASCII mode) lets the regex engine skip positions inside
+        # words cheaply, which is most of the text
+        pattern = r"\b(?:" + "|".join(alternatives) + ")" if alternatives else r"(?!x)x"
+        self._regex = re.compile(pattern, re.ASCII)
+
+    @classmethod
+    def from_file(cls, path: str = TERMS_PATH) -> "PromptFilter":
+        return cls(load_terms(path))
+
+    def find(self, prompt: str) -> list:
+        # Matched fragments of the normalised prompt (empty if allowed)
+        return [m.group(0) for m in self._regex.finditer(normalize(prompt))]
+
+    def is_allowed(self, prompt: str) -> bool:
+        return self._regex.search(normalize(prompt)) is None
+
+    def check_many(self, prompts: list) -> list:
+        # Screens a whole batch in one regex pass over the joined text; the
+        # newline separator can't be part of a match
+        normalized = [normalize(p).replace("\n", " ") for p in prompts]
+        starts, offset = [], 0
+        for text in normalized:
+            starts.append(offset)
+            offset += len(text) + 1
+
+        allowed = [True] * len(prompts)
+        for match in self._regex.finditer("\n".join(normalized)):
+            allowed[bisect.bisect_right(starts, match.start()) - 1] = False
+        return allowed
+
+    def screen_manifest(self, entries: list, fields=("prompt",)) -> list:
+        # For manifest-style lists of dicts: [(entry, [matched fragments])]
+        # for every entry that fails
+        flagged = []
+        for entry in entries:
+            matches = []
+            for field in fields:
+                matches += self.find(entry.get(field) or "")
+            if matches:
+                flagged.append((entry, matches))
+        return flagged
+
+
+_filters = {}
+
+
+def get_prompt_filter(path: str = TERMS_PATH) -> PromptFilter:
+    # Compiled once per term list and shared
+    if path not in _filters:
+        _filters[path] = PromptFilter.from_file(path)
+    return _filters[path]
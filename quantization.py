@@ -0,0 +1,184 @@
+# quantization.py
+import os
+import re
+import json
+import time
+import hashlib
+import importlib
+import warnings
+import torch
+
+# Modules whose nn.Linear layers are quantized: in the UNet these are the
+# attention projections (to_q/to_k/to_v/to_out), the feed-forward layers and
+# the time/text projections; the CLIP text encoder is Linear throughout.
+# Convolutions and the VAE stay float32.
+QUANTIZABLE_MODULES = ("unet", "text_encoder")
+
+
+def _quantize_dynamic():
+    try:
+        from torch.ao.quantization import quantize_dynamic
+    except ImportError:
+        return None
+    return quantize_dynamic
+
+
+def _int8_linear():
+    # The quantized replacement of nn.Linear (printed as DynamicQuantizedLinear)
+    try:
+        from torch.ao.nn.quantized.dynamic import Linear
+    except ImportError:
+        return ()
+    return Linear
+
+
+def int8_supported() -> bool:
+    # Dynamic int8 needs a quantized CPU engine (fbgemm on x86, qnnpack on ARM)
+    engines = [e for e in torch.backends.quantized.supported_engines if e != "none"]
+    return _quantize_dynamic() is not None and bool(engines)
+
+
+def is_quantized(module) -> bool:
+    return any(isinstance(m, _int8_linear()) for m in module.modules())
+
+
+def weight_bytes(module) -> int:
+    # Parameters and buffers, plus the packed weights of quantized Linear
+    # layers, which are neither
+    total = sum(t.numel() * t.element_size() for t in list(module.parameters()) + list(module.buffers()))
+    for m in module.modules():
+        if isinstance(m, _int8_linear()):
+            weight = m.weight()
+            total += weight.numel() * weight.element_size()
+    return total
+
+
+def quantize_module(module):
+    # Linear weights become per-tensor int8; activations are quantized on the
+    # fly per call, so no calibration data is needed. In place.
+    with warnings.catch_warnings():
+        # torch.ao.quantization is deprecated in favour of torchao but still ships
+        warnings.simplefilter("ignore")
+        return _quantize_dynamic()(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def _source_dir(model_name: str):
+    # The pipeline directory on disk: model_name itself, or for a hub id its
+    # locally cached snapshot (named after the commit). None if not cached.
+    if os.path.isdir(model_name):
+        return model_name
+    try:
+        from huggingface_hub import snapshot_download
+        return snapshot_download(model_name, local_files_only=True)
+    except Exception:
+        return None
+
+
+def _source_fingerprint(model_name: str, name: str):
+    # Pipelines are identified by their weight files, which for hub ids live
+    # in the snapshot of the revision in use, so a new revision gets new int8
+    # weights. The torch/diffusers versions are part of it because the packed
+    # int8 weight layout may change between them. None if the source isn't
+    # on disk yet.
+    import diffusers
+
+    source_dir = _source_dir(model_name)
+    if source_dir is None:
+        return None
+    parts = [model_name, name, torch.__version__, diffusers.__version__]
+    if source_dir != model_name:
+        parts.append(os.path.basename(os.path.normpath(source_dir)))
+    module_dir = os.path.join(source_dir, name)
+    if os.path.isdir(module_dir):
+        for entry in sorted(os.scandir(module_dir), key=lambda e: e.name):
+            if entry.is_file():
+                stat = entry.stat()
+                parts += [entry.name, str(stat.st_size), str(stat.st_mtime_ns)]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def cache_path(cache_dir: str, model_name: str, name: str):
+    # None while a hub model isn't downloaded; it is cached after its first load
+    fingerprint = _source_fingerprint(model_name, name)
+    if fingerprint is None:
+        return None
+    safe_name = re.sub(r"[^A-Za-z0-9._-]+", "--", model_name.strip("/"))
+    return os.path.join(cache_dir, safe_name, f"{name}-int8-{fingerprint}.pt")
+
+
+def _empty_module(model_name: str, name: str):
+    # The pipeline's module `name` built from its config alone, on
+    # uninitialised memory: no weights read and no random init
+    from diffusers import DiffusionPipeline
+
+    library, class_name = DiffusionPipeline.load_config(model_name)[name]
+    cls = getattr(importlib.import_module(library), class_name)
+    with torch.device("meta"):
+        if library == "transformers":
+            module = cls(cls.config_class.from_pretrained(model_name, subfolder=name))
+        else:
+            module = cls.from_config(cls.load_config(model_name, subfolder=name))
+    return module.to_empty(device="cpu").eval()
+
+
+def load_quantized(model_name: str, names: list, cache_dir: str) -> dict:
+    # {name: module} for every module with a cached quantized copy. Passed
+    # to from_pretrained as components, so their float32 weights are never
+    # loaded at all. The cache holds tensors only (weights_only=True): the
+    # module is rebuilt from its config and quantized empty, then filled.
+    modules = {}
+    for name in names:
+        path = cache_path(cache_dir, model_name, name)
+        if path is None or not os.path.exists(path):
+            continue
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                saved = torch.load(path, map_location="cpu", weights_only=True)
+                module = quantize_module(_empty_module(model_name, name))
+                module.load_state_dict(saved["state_dict"])
+                # Non-persistent buffers (e.g. CLIP's position ids) aren't in
+                # the state dict but were left uninitialised too
+                for key, value in saved["buffers"].items():
+                    owner, _, buffer_name = key.rpartition(".")
+                    module.get_submodule(owner).get_buffer(buffer_name).copy_(value)
+            modules[name] = module
+        except Exception as e:
+            print(f"Ignoring unreadable quantized cache {path}: {e}")
+    return modules
+
+
+def save_quantized(module, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        torch.save({
+            "state_dict": module.state_dict(),
+            "buffers": dict(module.named_buffers())
+        }, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def quantize_pipeline(pipe, model_name: str, names: list = QUANTIZABLE_MODULES, cache_dir: str = None) -> dict:
+    # Quantizes the named modules of a loaded pipeline that aren't quantized
+    # yet and caches them under cache_dir. Returns {name: how}, how being
+    # "cached" (loaded quantized), "converted" (with seconds taken) or
+    # "skipped".
+    applied = {}
+    for name in names:
+        module = getattr(pipe, name, None)
+        if module is None:
+            applied[name] = "skipped"
+        elif is_quantized(module):
+            applied[name] = "cached"
+        else:
+            start = time.perf_counter()
+            quantize_module(module)
+            applied[name] = f"converted in {time.perf_counter() - start:.1f}s"
+            path = cache_path(cache_dir, model_name, name) if cache_dir else None
+            if path:
+                try:
+                    save_quantized(module, path)
+                except OSError as e:
+                    print(f"Could not cache quantized {name}: {e}")
+    return applied
@@ -0,0 +1,159 @@
+# result_cache.py
+import os
+import json
+import time
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+from storage import get_output_store, output_exists, read_metadata
+
+# cpu_profile options that change the generated pixels (thread counts don't)
+PIXEL_OPTIONS = ("fused_attention", "channels_last", "bf16_autocast", "torch_compile", "int8_dynamic")
+
+
+def precision_key(generator) -> dict:
+    # What a generator's images depend on besides the request: the device
+    # (float16 on CUDA) and the applied CPU options that change the pixels,
+    # so that fp32 and int8/bf16 images never answer for each other
+    options = getattr(generator, "cpu_options", None) or {}
+    key = {"device": generator.device}
+    for name in PIXEL_OPTIONS:
+        value = options.get(name)
+        if name == "int8_dynamic" and value:
+            # {module: how it was quantized}; only which modules matters
+            value = sorted(module for module, how in value.items() if how != "skipped")
+        if value:
+            key[name] = value
+    return key
+
+
+def generation_key(
+    model_name: str,
+    scheduler: str,
+    prompt: str,
+    negative_prompt: str,
+    guidance_scale: float,
+    num_inference_steps: int,
+    height: int,
+    width: int,
+    seed: int,
+    precision: dict = None
+) -> str:
+    # Everything that determines the pixels of one image. Only meaningful with
+    # an explicit seed; unseeded requests draw a fresh random seed and miss.
+    # precision: precision_key() of the generator that runs it.
+    payload = {
+        "model": model_name,
+        "scheduler": scheduler,
+        "prompt": prompt,
+        "negative_prompt": negative_prompt or "",
+        "guidance_scale": float(guidance_scale),
+        "steps": int(num_inference_steps),
+        "height": int(height),
+        "width": int(width),
+        "seed": int(seed),
+        "precision": precision or {}
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResultCache:
+    # Content-addressed index over images already saved by
+    # save_image_with_metadata. The key -> metadata path mapping lives in a
+    # single JSON file next to the outputs, so a lookup never lists the
+    # directory. Entries are kept in least-recently-used order and the oldest
+    # dropped beyond max_entries; that only forgets the key, the files stay
+    # until the storage budget (storage.py) removes them. Lookups only change
+    # the order in memory; it is written with the next put() or at most every
+    # SAVE_INTERVAL_S, so a crash loses a little recency at worst.
+
+    INDEX_FILE = ".result_cache.json"
+    SAVE_INTERVAL_S = 30
+
+    def __init__(self, base_dir: str = "outputs", max_entries: int = 10000):
+        self.base_dir = base_dir
+        self.max_entries = max_entries
+        self.index_path = os.path.join(base_dir, self.INDEX_FILE)
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    self._entries = OrderedDict(json.load(f))
+            except (OSError, ValueError):
+                self._entries = OrderedDict()
+        atexit.register(self.flush)
+
+    def _save(self):
+        os.makedirs(self.base_dir, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def _save_later(self):
+        self._dirty = True
+        if time.monotonic() - self._saved_at >= self.SAVE_INTERVAL_S:
+            self._save()
+
+    def flush(self):
+        # Writes lookups' recency and dropped entries not saved yet
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def get(self, key: str):
+        # Returns the saved metadata dict for key, or None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not all(output_exists(p) for p in entry["paths"]):
+                # Files were removed behind our back
+                del self._entries[key]
+                self._save_later()
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._save_later()
+            self.hits += 1
+            metadata_path = entry["metadata"]
+
+        store = get_output_store()
+        if store is not None:
+            # A cache hit counts as a use for the storage retention too
+            store.touch(metadata_path)
+        return read_metadata(metadata_path)
+
+    def put(self, key: str, png_path: str, jpg_path: str, metadata_path: str):
+        # png_path/jpg_path are None for formats the output policy defers
+        paths = [p for p in (png_path, jpg_path, metadata_path) if p and os.path.exists(p)]
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = {"metadata": metadata_path, "paths": paths}
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,69 @@
+# schedulers.py
+
+# Samplers that can be swapped into a loaded pipeline. Only the scheduler
+# object changes; UNet/VAE weights stay where they are. "steps" is the step
+# count we recommend as a starting point for each sampler.
+SCHEDULERS = {
+    "default": {
+        "label": "Pipeline default (PNDM)",
+        "class": None,
+        "config": {},
+        "steps": 30
+    },
+    "dpmpp_2m": {
+        "label": "DPM-Solver++ 2M",
+        "class": "DPMSolverMultistepScheduler",
+        "config": {"algorithm_type": "dpmsolver++", "solver_order": 2},
+        "steps": 15
+    },
+    "dpmpp_2m_karras": {
+        "label": "DPM-Solver++ 2M Karras",
+        "class": "DPMSolverMultistepScheduler",
+        "config": {"algorithm_type": "dpmsolver++", "solver_order": 2, "use_karras_sigmas": True},
+        "steps": 12
+    },
+    "euler": {
+        "label": "Euler",
+        "class": "EulerDiscreteScheduler",
+        "config": {},
+        "steps": 25
+    },
+    "euler_a": {
+        "label": "Euler Ancestral",
+        "class": "EulerAncestralDiscreteScheduler",
+        "config": {},
+        "steps": 25
+    },
+    "unipc": {
+        "label": "UniPC",
+        "class": "UniPCMultistepScheduler",
+        "config": {},
+        "steps": 12
+    },
+    "lcm": {
+        # Only gives good images with LCM-distilled weights or an LCM-LoRA
+        "label": "LCM (needs LCM weights)",
+        "class": "LCMScheduler",
+        "config": {},
+        "steps": 4
+    }
+}
+
+
+def recommended_steps(name: str) -> int:
+    return SCHEDULERS.get(name, SCHEDULERS["default"])["steps"]
+
+
+def build_scheduler(name: str, base_config):
+    # New scheduler instance from the pipeline's own scheduler config, so beta
+    # schedule and training timesteps match the loaded model
+    if name not in SCHEDULERS:
+        raise ValueError(f"Unknown scheduler '{name}'. Available: {', '.join(SCHEDULERS)}")
+    spec = SCHEDULERS[name]
+    if spec["class"] is None:
+        raise ValueError("The default scheduler comes from the loaded pipeline")
+
+    import diffusers
+
+    scheduler_cls = getattr(diffusers, spec["class"])
+    return scheduler_cls.from_config(base_config, **spec["config"])
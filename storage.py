@@ -0,0 +1,579 @@
+# storage.py
+import os
+import re
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from datetime import datetime
+from output_formats import FORMATS, format_path
+
+MB = 1024 ** 2
+DAY_S = 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    metadata_path TEXT PRIMARY KEY,
+    id TEXT,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    bytes INTEGER NOT NULL,
+    files TEXT NOT NULL DEFAULT '[]',
+    -- Where the metadata lives once the compactor packed it
+    segment TEXT,
+    seg_offset INTEGER,
+    seg_length INTEGER
+);
+CREATE INDEX IF NOT EXISTS objects_accessed ON objects (accessed_at);
+CREATE INDEX IF NOT EXISTS objects_segment ON objects (segment, created_at);
+"""
+
+# .../YYYY/MM/DD/xx, xx being the first two hex digits of the image id
+SHARD_DIR_RE = re.compile(r"(^|[\\/])\d{4}[\\/]\d{2}[\\/]\d{2}[\\/][0-9a-f]{2}$")
+
+DEFAULT_STORAGE = {
+    "enabled": True,
+    "base_dir": "outputs",
+    # "sharded" or "flat" (everything in the output directory, as before)
+    "layout": "sharded",
+    # Budgets; null = unlimited. Outputs not accessed for max_age_days go,
+    # then the least recently accessed until the total fits max_gb. These are
+    # the only limits that delete outputs: the result cache only forgets keys
+    "max_gb": None,
+    "max_age_days": None,
+    "compact_after_days": 7,
+    "segment_max_mb": 64,
+    "maintenance_interval_s": 600,
+    # Move outputs from older flat directories into shards in the background
+    "migrate": True
+}
+
+
+_config = None
+# The process's OutputStore, False once found disabled
+_store = None
+_store_lock = threading.Lock()
+
+
+def storage_config() -> dict:
+    # The "storage" config section with defaults, read once per process
+    global _config
+    if _config is None:
+        from utils import load_config
+        config = dict(DEFAULT_STORAGE, **(load_config().get("storage") or {}))
+        with _store_lock:
+            if _config is None:
+                _config = config
+    return _config
+
+
+def migration_enabled() -> bool:
+    # Flat outputs are only moved into shards when new ones go there too
+    config = storage_config()
+    return bool(config["migrate"]) and config["layout"] == "sharded"
+
+
+def shard_dir(base_dir: str, image_id: str, when: datetime) -> str:
+    # Date shards keep one day's outputs together (cheap to back up or
+    # delete); the id shard caps a busy day at 1/256 of it per directory
+    return os.path.join(base_dir, when.strftime("%Y"), when.strftime("%m"), when.strftime("%d"), image_id[:2])
+
+
+def output_dir(base_dir: str, image_id: str, when: datetime) -> str:
+    # Directory a new output goes to under the configured layout
+    if storage_config()["layout"] == "sharded":
+        return shard_dir(base_dir, image_id, when)
+    return base_dir
+
+
+def _created(metadata: dict, metadata_path: str) -> datetime:
+    try:
+        if metadata.get("created_at"):
+            return datetime.fromisoformat(metadata["created_at"])
+        return datetime.strptime(metadata["timestamp"], "%Y%m%d_%H%M%S")
+    except (KeyError, TypeError, ValueError):
+        return datetime.fromtimestamp(os.path.getmtime(metadata_path))
+
+
+def _is_output_metadata(metadata) -> bool:
+    # Same test as the catalog's scan
+    return isinstance(metadata, dict) and "prompt" in metadata and "files" in metadata
+
+
+class OutputStore:
+    # Bookkeeping for everything saved under base_dir, kept in a small
+    # SQLite index next to the outputs: size, creation and last access of
+    # every output, for retention, and where its metadata went once
+    # compacted. Metadata JSONs older than compact_after_days are packed into
+    # append-only segment files (.segments/) and read back through
+    # read_metadata(); a JSON file on disk always wins over its packed copy.
+    # maintain() runs one pass of compaction and retention; start() runs it
+    # on a background thread after indexing (and migrating) what is already
+    # on disk.
+
+    INDEX_FILE = ".storage.sqlite3"
+    SEGMENT_DIR = ".segments"
+    # Segments this old or older may be rewritten; younger ones may still be
+    # being written by another process
+    SEGMENT_SETTLE_S = 600
+
+    def __init__(self, base_dir: str = "outputs", max_bytes: int = None, max_age_days: float = None,
+                 compact_after_days: float = 7, segment_max_bytes: int = 64 * MB, catalog=None):
+        self.base_dir = base_dir
+        # Paths are kept as given (as the catalog and metadata files have
+        # them) but indexed absolute
+        self._root = os.path.abspath(base_dir)
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.compact_after_days = compact_after_days
+        self.segment_max_bytes = segment_max_bytes
+        self.catalog = catalog
+        self.segment_dir = os.path.join(self._root, self.SEGMENT_DIR)
+        self.db_path = os.path.join(self._root, self.INDEX_FILE)
+        os.makedirs(self.base_dir, exist_ok=True)
+        self._local = threading.local()
+        self._maintenance_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    @classmethod
+    def from_config(cls, config: dict = None, catalog=None):
+        config = dict(DEFAULT_STORAGE, **(config or {}))
+        return cls(
+            base_dir=config["base_dir"],
+            max_bytes=int(config["max_gb"] * 1024 ** 3) if config["max_gb"] else None,
+            max_age_days=config["max_age_days"],
+            compact_after_days=config["compact_after_days"],
+            segment_max_bytes=int(config["segment_max_mb"] * MB),
+            catalog=catalog
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def covers(self, path: str) -> bool:
+        return os.path.abspath(path).startswith(os.path.join(self._root, ""))
+
+    # ---------- bookkeeping ----------
+
+    def add(self, metadata: dict, metadata_path: str):
+        # Called after an output's files were (re)written; a rewritten
+        # metadata file supersedes its packed copy
+        if not self.covers(metadata_path):
+            return
+        files = [p for p in (metadata.get("files") or {}).values() if p]
+        size = 0
+        for path in files + [metadata_path]:
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO objects (metadata_path, id, created_at, accessed_at, bytes, files) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (metadata_path) DO UPDATE SET "
+                "id = excluded.id, accessed_at = excluded.accessed_at, bytes = excluded.bytes, "
+                "files = excluded.files, segment = NULL, seg_offset = NULL, seg_length = NULL",
+                (os.path.abspath(metadata_path), metadata.get("id"),
+                 _created(metadata, metadata_path).timestamp(), now, size, json.dumps(files))
+            )
+
+    def touch(self, *metadata_paths):
+        # Marks outputs as used (viewed, downloaded, served from the result
+        # cache), which keeps them from being evicted first
+        paths = [(os.path.abspath(p),) for p in metadata_paths if p and self.covers(p)]
+        if not paths:
+            return
+        conn = self._conn()
+        with conn:
+            conn.executemany(f"UPDATE objects SET accessed_at = {time.time()} WHERE metadata_path = ?", paths)
+
+    def forget(self, metadata_path: str):
+        # For outputs whose files were moved or deleted outside enforce_retention
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM objects WHERE metadata_path = ?", (os.path.abspath(metadata_path),))
+
+    def contains(self, metadata_path: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM objects WHERE metadata_path = ?", (os.path.abspath(metadata_path),)
+        ).fetchone()
+        return row is not None
+
+    def read_metadata(self, metadata_path: str) -> dict:
+        try:
+            with open(metadata_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        row = self._conn().execute(
+            "SELECT segment, seg_offset, seg_length FROM objects WHERE metadata_path = ?",
+            (os.path.abspath(metadata_path),)
+        ).fetchone()
+        if row is None or row[0] is None:
+            raise FileNotFoundError(metadata_path)
+        segment, offset, length = row
+        with open(os.path.join(self.segment_dir, segment), "rb") as f:
+            f.seek(offset)
+            return json.loads(f.read(length))["metadata"]
+
+    def compacted(self, base_dir: str):
+        # (metadata_path, metadata) of every packed output under base_dir,
+        # for the catalog's rescans; paths are relative to base_dir like the
+        # ones os.walk(base_dir) yields
+        prefix = os.path.join(os.path.abspath(base_dir), "")
+        rows = self._conn().execute(
+            "SELECT metadata_path FROM objects WHERE segment IS NOT NULL AND metadata_path LIKE ? ESCAPE '\\'",
+            (prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%",)
+        ).fetchall()
+        for (path,) in rows:
+            try:
+                yield os.path.join(base_dir, os.path.relpath(path, prefix)), self.read_metadata(path)
+            except (OSError, ValueError):
+                continue
+
+    def usage(self) -> dict:
+        conn = self._conn()
+        objects, total, packed = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0), COUNT(segment) FROM objects"
+        ).fetchone()
+        segments = [e for e in os.scandir(self.segment_dir)] if os.path.isdir(self.segment_dir) else []
+        return {
+            "objects": objects,
+            "bytes": total,
+            "compacted": packed,
+            "segments": len(segments),
+            "segment_bytes": sum(e.stat().st_size for e in segments)
+        }
+
+    # ---------- retention ----------
+
+    def _evict(self, conn, metadata_path: str, image_id: str, files: str):
+        for path in json.loads(files) + [metadata_path]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        conn.execute("DELETE FROM objects WHERE metadata_path = ?", (metadata_path,))
+        if self.catalog is not None and image_id:
+            self.catalog.remove(image_id)
+
+    def enforce_retention(self, now: float = None) -> int:
+        # Evicts outputs idle for longer than max_age_days, then the least
+        # recently accessed until the total is back under 90% of max_bytes
+        # (so that not every save evicts one). Returns the number evicted.
+        now = now or time.time()
+        conn = self._conn()
+        evicted = 0
+        with conn:
+            if self.max_age_days:
+                rows = conn.execute(
+                    "SELECT metadata_path, id, files FROM objects WHERE accessed_at < ?",
+                    (now - self.max_age_days * DAY_S,)
+                ).fetchall()
+                for row in rows:
+                    self._evict(conn, *row)
+                evicted += len(rows)
+            if self.max_bytes:
+                total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM objects").fetchone()[0]
+                if total > self.max_bytes:
+                    target = self.max_bytes * 0.9
+                    for path, image_id, files, size in conn.execute(
+                        "SELECT metadata_path, id, files, bytes FROM objects ORDER BY accessed_at"
+                    ).fetchall():
+                        if total <= target:
+                            break
+                        self._evict(conn, path, image_id, files)
+                        total -= size
+                        evicted += 1
+        return evicted
+
+    # ---------- compaction ----------
+
+    def _new_segment(self):
+        os.makedirs(self.segment_dir, exist_ok=True)
+        name = f"seg-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.jsonl"
+        return name, open(os.path.join(self.segment_dir, name), "ab")
+
+    def _append(self, entries: list) -> list:
+        # Appends (metadata_path, metadata) entries to new segment files,
+        # rolling over at segment_max_bytes; returns (path, segment, offset,
+        # length) once the data is on disk
+        placed, segment, f = [], None, None
+        try:
+            for path, metadata in entries:
+                if f is None or f.tell() >= self.segment_max_bytes:
+                    if f is not None:
+                        f.flush()
+                        os.fsync(f.fileno())
+                        f.close()
+                    segment, f = self._new_segment()
+                line = json.dumps({"metadata_path": path, "metadata": metadata}, ensure_ascii=False)
+                data = line.encode("utf-8") + b"\n"
+                offset = f.tell()
+                f.write(data)
+                placed.append((path, segment, offset, len(data)))
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            if f is not None:
+                f.close()
+        return placed
+
+    def compact(self, now: float = None, limit: int = 5000) -> int:
+        # Packs metadata JSONs older than compact_after_days into a segment
+        # and deletes the files. Returns the number packed.
+        now = now or time.time()
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT metadata_path FROM objects WHERE segment IS NULL AND created_at < ? "
+            "ORDER BY created_at LIMIT ?",
+            (now - self.compact_after_days * DAY_S, limit)
+        ).fetchall()
+        entries, mtimes = [], {}
+        for (path,) in rows:
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+                with open(path, "r", encoding="utf-8") as f:
+                    entries.append((path, json.load(f)))
+            except (OSError, ValueError):
+                continue
+        if not entries:
+            return 0
+
+        placed = self._append(entries)
+        packed = []
+        with conn:
+            for path, segment, offset, length in placed:
+                cursor = conn.execute(
+                    "UPDATE objects SET segment = ?, seg_offset = ?, seg_length = ? "
+                    "WHERE metadata_path = ? AND segment IS NULL",
+                    (segment, offset, length, path)
+                )
+                if cursor.rowcount:
+                    packed.append(path)
+        for path in packed:
+            # A file rewritten meanwhile (a deferred format was added) stays
+            # and is packed again next time
+            try:
+                if os.stat(path).st_mtime_ns == mtimes[path]:
+                    os.remove(path)
+                    continue
+            except OSError:
+                continue
+            self.add(self.read_metadata(path), path)
+        return len(packed)
+
+    def collect_segments(self, now: float = None) -> int:
+        # Rewrites settled segments that are mostly dead (their outputs were
+        # evicted or rewritten) and deletes empty ones. Returns the number of
+        # segments removed.
+        if not os.path.isdir(self.segment_dir):
+            return 0
+        now = now or time.time()
+        conn = self._conn()
+        removed = 0
+        for entry in os.scandir(self.segment_dir):
+            stat = entry.stat()
+            if now - stat.st_mtime < self.SEGMENT_SETTLE_S:
+                continue
+            rows = conn.execute(
+                "SELECT metadata_path, seg_offset, seg_length FROM objects WHERE segment = ?", (entry.name,)
+            ).fetchall()
+            live = sum(length for _, _, length in rows)
+            if live * 2 > stat.st_size:
+                continue
+            if rows:
+                with open(entry.path, "rb") as f:
+                    entries = []
+                    for path, offset, length in rows:
+                        f.seek(offset)
+                        entries.append((path, json.loads(f.read(length))["metadata"]))
+                placed = self._append(entries)
+                with conn:
+                    for (path, segment, offset, length), (_, old_offset, _) in zip(placed, rows):
+                        conn.execute(
+                            "UPDATE objects SET segment = ?, seg_offset = ?, seg_length = ? "
+                            "WHERE metadata_path = ? AND segment = ? AND seg_offset = ?",
+                            (segment, offset, length, path, entry.name, old_offset)
+                        )
+            if conn.execute("SELECT 1 FROM objects WHERE segment = ? LIMIT 1", (entry.name,)).fetchone() is None:
+                os.remove(entry.path)
+                removed += 1
+        return removed
+
+    # ---------- indexing and migration ----------
+
+    def migrate(self, metadata_path: str, metadata: dict) -> str:
+        # Moves an output from a flat directory into the shard for its date
+        # and id, image files first and metadata last, and returns the new
+        # metadata path. Readers that still hold the old path find the files
+        # gone and fall back like they do for evicted outputs.
+        image_id = metadata.get("id") or uuid.uuid5(uuid.NAMESPACE_URL, os.path.abspath(metadata_path)).hex
+        # The same id the catalog derived from the old path, so its row moves
+        metadata["id"] = image_id
+        target_dir = shard_dir(os.path.dirname(metadata_path), image_id, _created(metadata, metadata_path))
+        new_path = os.path.join(target_dir, os.path.basename(metadata_path))
+        os.makedirs(target_dir, exist_ok=True)
+
+        files = metadata.setdefault("files", {})
+        for fmt in FORMATS:
+            source = format_path(metadata_path, fmt)
+            if os.path.exists(source):
+                os.replace(source, format_path(new_path, fmt))
+                files[fmt] = format_path(new_path, fmt)
+            elif fmt in files:
+                files[fmt] = None
+        with open(new_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=4)
+        os.replace(new_path + ".tmp", new_path)
+        os.remove(metadata_path)
+
+        self.forget(metadata_path)
+        self.add(metadata, new_path)
+        if self.catalog is not None:
+            self.catalog.add(metadata, new_path)
+        return new_path
+
+    def index(self, migrate: bool = True, pause_every: int = 100, pause_s: float = 0.05) -> dict:
+        # Walks base_dir once: outputs the index doesn't know yet are added,
+        # and with migrate those outside a shard directory are moved into
+        # one. Pauses every few files so that a big migration never hogs the
+        # disk or the GIL while the app is generating.
+        indexed = migrated = failed = 0
+        for root, dirs, names in os.walk(self.base_dir):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            sharded = bool(SHARD_DIR_RE.search(root))
+            for name in names:
+                if not name.endswith(".json") or name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                # Checked live: the walk also reaches shards filled meanwhile
+                if self.contains(path) and (sharded or not migrate):
+                    continue
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        metadata = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if not _is_output_metadata(metadata):
+                    continue
+                try:
+                    if migrate and not sharded:
+                        self.migrate(path, metadata)
+                        migrated += 1
+                    else:
+                        self.add(metadata, path)
+                        indexed += 1
+                except OSError as e:
+                    print(f"Could not index {path}: {e}")
+                    failed += 1
+                if (indexed + migrated) % pause_every == 0:
+                    time.sleep(pause_s)
+        return {"indexed": indexed, "migrated": migrated, "failed": failed}
+
+    # ---------- background maintenance ----------
+
+    def maintain(self) -> dict:
+        with self._maintenance_lock:
+            return {
+                "compacted": self.compact(),
+                "evicted": self.enforce_retention(),
+                "segments_removed": self.collect_segments()
+            }
+
+    def start(self, interval_s: float = 600, migrate: bool = True):
+        # Indexes (and migrates) existing outputs, rescans the catalog for
+        # files written elsewhere, then maintains every interval_s, all on a
+        # daemon thread. The catalog scan comes after the migration so it
+        # never sees a file halfway through a move.
+        if self._thread is not None:
+            return
+        if self.catalog is not None:
+            self.catalog.scanning = True
+
+        def run():
+            try:
+                print(f"Output storage index of {self.base_dir}: {self.index(migrate=migrate)}")
+            except Exception as e:
+                print(f"Output storage indexing failed: {e}")
+            if self.catalog is not None:
+                try:
+                    print(f"Catalog scan of {self.base_dir}: {self.catalog.scan(self.base_dir)}")
+                except Exception as e:
+                    self.catalog.scanning = False
+                    print(f"Catalog scan failed: {e}")
+            while not self._stop.is_set():
+                try:
+                    result = self.maintain()
+                    if any(result.values()):
+                        print(f"Output storage maintenance: {result}")
+                except Exception as e:
+                    print(f"Output storage maintenance failed: {e}")
+                self._stop.wait(interval_s)
+
+        self._thread = threading.Thread(target=run, name="output-storage", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def get_output_store():
+    # The configured store, one per process; None if disabled
+    global _store
+    if _store is None:
+        config = storage_config()
+        with _store_lock:
+            if _store is None:
+                _store = OutputStore.from_config(config) if config["enabled"] else False
+    return _store or None
+
+
+def read_metadata(metadata_path: str) -> dict:
+    # An output's metadata, from its JSON file or, once compacted, its segment
+    store = get_output_store()
+    if store is not None and store.covers(metadata_path):
+        return store.read_metadata(metadata_path)
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def output_exists(path: str) -> bool:
+    # True for files on disk and for compacted metadata files
+    if os.path.exists(path):
+        return True
+    store = get_output_store()
+    return store is not None and store.covers(path) and store.contains(path)
+
+
+if __name__ == "__main__":
+    # python storage.py  -- index/migrate outputs/ and run one maintenance pass
+    store = get_output_store()
+    if store is None:
+        raise SystemExit("Output storage is disabled (storage.enabled in config/model_config.json)")
+    print("index:", store.index(migrate=migration_enabled(), pause_s=0))
+    print("maintenance:", store.maintain())
+    print("usage:", store.usage())
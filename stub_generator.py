@@ -0,0 +1,112 @@
+# stub_generator.py
+import time
+import hashlib
+from PIL import Image
+from deadlines import StepCostModel
+from sweeps import run_sweep
+from telemetry import GenerationTelemetry, MetricsRegistry
+from utils import make_seeds
+
+
+class StubGenerator:
+    # Stands in for Text2ImageGenerator where the real pipeline is too slow or
+    # not installed: the API server (python api_server.py --stub) and load
+    # tests. Same generate()/generate_batch() interface and telemetry; every
+    # "step" sleeps step_s, plus image_step_s per image of the batch (a CPU
+    # takes about n times as long for n images, a GPU barely longer), and the
+    # images are flat colours derived from prompt and seed, so results are
+    # reproducible. No torch or diffusers needed.
+
+    def __init__(self, step_s: float = 0.01, decode_s: float = 0.0, metrics: MetricsRegistry = None,
+                 model_name: str = "stub", scheduler: str = "default", image_step_s: float = 0.0):
+        self.step_s = step_s
+        self.image_step_s = image_step_s
+        self.decode_s = decode_s
+        self.metrics = metrics or MetricsRegistry()
+        self.step_costs = StepCostModel()
+        self.model_name = model_name
+        self.default_scheduler = scheduler
+        self.device = "cpu"
+        self.calls = 0
+
+    @property
+    def scheduler_name(self) -> str:
+        return self.default_scheduler
+
+    @staticmethod
+    def _image(prompt: str, seed: int, height: int, width: int) -> Image.Image:
+        digest = hashlib.sha256(f"{prompt}|{seed}".encode("utf-8")).digest()
+        return Image.new("RGB", (width, height), tuple(digest[:3]))
+
+    def generate(
+        self,
+        prompt: str,
+        negative_prompt: str = "",
+        num_images: int = 1,
+        guidance_scale: float = 7.5,
+        num_inference_steps: int = 30,
+        height: int = 512,
+        width: int = 512,
+        seeds: list = None,
+        scheduler: str = None,
+        telemetry: GenerationTelemetry = None,
+        memory_budget: int = None
+    ):
+        return self.generate_batch(
+            prompts=[prompt] * num_images,
+            negative_prompts=[negative_prompt] * num_images,
+            guidance_scales=[guidance_scale] * num_images,
+            num_inference_steps=num_inference_steps,
+            height=height,
+            width=width,
+            seeds=seeds,
+            scheduler=scheduler,
+            telemetry=telemetry,
+            memory_budget=memory_budget
+        )
+
+    def generate_sweep(self, prompt: str, seeds: list, guidance_scales: list, negative_prompts: list = ("",),
+                       **kwargs) -> dict:
+        return run_sweep(self, prompt, seeds, guidance_scales, negative_prompts, **kwargs)
+
+    def generate_batch(
+        self,
+        prompts: list,
+        negative_prompts: list,
+        guidance_scales: list,
+        num_inference_steps: int = 30,
+        height: int = 512,
+        width: int = 512,
+        seeds: list = None,
+        scheduler: str = None,
+        telemetry: GenerationTelemetry = None,
+        memory_budget: int = None
+    ):
+        if telemetry is None:
+            telemetry = GenerationTelemetry()
+        seeds = list(seeds) if seeds is not None else make_seeds(None, len(prompts))
+        telemetry.batch_size = len(prompts)
+        telemetry.height = height
+        telemetry.width = width
+        telemetry.check()
+        num_inference_steps = self.step_costs.fit(telemetry, num_inference_steps)
+        telemetry.total_steps = num_inference_steps
+        self.calls += 1
+
+        telemetry.mark()
+        for _ in range(num_inference_steps):
+            time.sleep(self.step_s + self.image_step_s * len(prompts))
+            telemetry.record_step()
+            telemetry.check()
+
+        start = time.perf_counter()
+        time.sleep(self.decode_s)
+        images = [self._image(p, s, height, width) for p, s in zip(prompts, seeds)]
+        telemetry.decode_s = time.perf_counter() - start
+        telemetry.finish()
+        self.step_costs.observe(telemetry)
+        self.metrics.record(telemetry, model=self.model_name, scheduler=scheduler or self.default_scheduler)
+        return images
+
+    def warm_up(self, num_inference_steps: int = 1, height: int = 256, width: int = 256) -> float:
+        return 0.0
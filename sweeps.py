@@ -0,0 +1,256 @@
+# sweeps.py
+# Parameter sweeps of one prompt: every combination of seeds x guidance
+# scales x negative prompts, generated as a single generate_batch() call
+# (the text encoder runs once per distinct prompt and every image gets its
+# own guidance scale), plus a labelled contact sheet of the grid.
+#
+#   python sweeps.py "a lighthouse on a cliff" --seeds 1,2,3 --guidance 7,8,8.5,9
+#   python sweeps.py "a lighthouse on a cliff" --seeds 7 --guidance 6,9 --negative "" --negative "blurry, dark"
+import os
+import uuid
+import argparse
+from PIL import Image, ImageDraw, ImageFont
+from telemetry import GenerationTelemetry
+
+# Images per sweep; the memory planner still splits the batch into
+# sub-batches if it doesn't fit, this only bounds the request
+MAX_SWEEP_IMAGES = 32
+LABEL_BACKGROUND = (24, 24, 24)
+LABEL_COLOR = (235, 235, 235)
+# Pixels between the contact sheet's cells
+GUTTER = 4
+
+
+def sweep_variants(seeds: list, guidance_scales: list, negative_prompts: list = ("",)) -> list:
+    # One dict per image, in contact sheet order: rows are (negative prompt,
+    # seed), columns are guidance scales
+    variants = []
+    for n, negative_prompt in enumerate(negative_prompts):
+        for s, seed in enumerate(seeds):
+            for guidance_index, guidance_scale in enumerate(guidance_scales):
+                variants.append({
+                    "sweep_index": len(variants),
+                    "row": n * len(seeds) + s,
+                    "column": guidance_index,
+                    "seed": int(seed),
+                    "guidance_scale": float(guidance_scale),
+                    "negative_prompt": negative_prompt or ""
+                })
+    return variants
+
+
+def run_sweep(
+    generator,
+    prompt: str,
+    seeds: list,
+    guidance_scales: list,
+    negative_prompts: list = ("",),
+    num_inference_steps: int = 30,
+    height: int = 512,
+    width: int = 512,
+    scheduler: str = None,
+    telemetry: GenerationTelemetry = None,
+    memory_budget: int = None,
+    max_images: int = MAX_SWEEP_IMAGES,
+    thumb_px: int = 256
+) -> dict:
+    # Works with any generator that has generate_batch() (the model and the
+    # stub). Returns the images, their variants (seed, guidance scale,
+    # negative prompt and place in the grid) and the contact sheet.
+    variants = sweep_variants(seeds, guidance_scales, negative_prompts)
+    if not variants:
+        raise ValueError("A sweep needs at least one seed, guidance scale and negative prompt")
+    if len(variants) > max_images:
+        raise ValueError(f"A sweep of {len(variants)} images is more than the {max_images} allowed")
+
+    telemetry = telemetry or GenerationTelemetry()
+    images = generator.generate_batch(
+        prompts=[prompt] * len(variants),
+        negative_prompts=[v["negative_prompt"] for v in variants],
+        guidance_scales=[v["guidance_scale"] for v in variants],
+        num_inference_steps=num_inference_steps,
+        height=height,
+        width=width,
+        seeds=[v["seed"] for v in variants],
+        scheduler=scheduler,
+        telemetry=telemetry,
+        memory_budget=memory_budget
+    )
+    return {
+        "id": uuid.uuid4().hex,
+        "prompt": prompt,
+        "seeds": [int(s) for s in seeds],
+        "guidance_scales": [float(g) for g in guidance_scales],
+        "negative_prompts": [n or "" for n in negative_prompts],
+        "steps_used": telemetry.steps_used,
+        "variants": variants,
+        "images": images,
+        "sheet": contact_sheet(images, variants, thumb_px),
+        "telemetry": telemetry
+    }
+
+
+def _label_font(size: int):
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # Pillow < 10.1 has a single fixed-size default font
+        return ImageFont.load_default()
+
+
+def _fit(draw: ImageDraw.ImageDraw, text: str, font, max_width: int) -> str:
+    # Shortens text with an ellipsis until it fits max_width pixels
+    if draw.textlength(text, font=font) <= max_width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > max_width:
+        text = text[:-1]
+    return text + "…"
+
+
+def contact_sheet(images: list, variants: list, thumb_px: int = 256) -> Image.Image:
+    # The grid as one image: a header with each column's guidance scale, a
+    # label per row with its seed (and negative prompt when several are
+    # swept), and thumbnails no larger than thumb_px on their long side
+    rows = max(v["row"] for v in variants) + 1
+    columns = max(v["column"] for v in variants) + 1
+    scale = min(1.0, thumb_px / max(images[0].size))
+    thumb_w, thumb_h = max(1, round(images[0].width * scale)), max(1, round(images[0].height * scale))
+
+    font_size = max(10, thumb_h // 14)
+    font = _label_font(font_size)
+    several_negatives = len({v["negative_prompt"] for v in variants}) > 1
+    label_w = max(80, thumb_w // 2)
+    header_h = font_size * 2
+    cell_w, cell_h = thumb_w + GUTTER, thumb_h + GUTTER
+    sheet = Image.new("RGB", (label_w + columns * cell_w, header_h + rows * cell_h), LABEL_BACKGROUND)
+    draw = ImageDraw.Draw(sheet)
+    pad = font_size // 2
+
+    for v in variants:
+        x = label_w + v["column"] * cell_w
+        y = header_h + v["row"] * cell_h
+        if v["row"] == 0:
+            draw.text((x + pad, pad), f"cfg {v['guidance_scale']:g}", fill=LABEL_COLOR, font=font)
+        if v["column"] == 0:
+            draw.text((pad, y + pad), f"seed {v['seed']}", fill=LABEL_COLOR, font=font)
+            if several_negatives:
+                negative = _fit(draw, v["negative_prompt"] or "(none)", font, label_w - 2 * pad)
+                draw.text((pad, y + pad + font_size * 3 // 2), negative, fill=LABEL_COLOR, font=font)
+        image = images[v["sweep_index"]]
+        sheet.paste(image if scale == 1.0 else image.resize((thumb_w, thumb_h), Image.LANCZOS), (x, y))
+    return sheet
+
+
+def save_sweep(sweep: dict, output, base_dir: str, params: dict, watermark: bool = True) -> dict:
+    # Saves every image of a run_sweep() result through an OutputPipeline as
+    # an ordinary output (its metadata has the seed, guidance scale, negative
+    # prompt, sweep id and index), then the contact sheet as an output of its
+    # own that lists them. Returns the ProcessedImages.
+    pending = [
+        output.submit(
+            image,
+            base_dir=base_dir,
+            prompt=sweep["prompt"],
+            negative_prompt=v["negative_prompt"],
+            params=dict(params, seed=v["seed"], guidance_scale=v["guidance_scale"],
+                        sweep_id=sweep["id"], sweep_index=v["sweep_index"]),
+            index=v["sweep_index"],
+            watermark=watermark
+        )
+        for image, v in zip(sweep["images"], sweep["variants"])
+    ]
+    images = [p.result() for p in pending]
+    sheet_params = dict(
+        params,
+        kind="contact_sheet",
+        sweep_id=sweep["id"],
+        seeds=sweep["seeds"],
+        guidance_scales=sweep["guidance_scales"],
+        negative_prompts=sweep["negative_prompts"],
+        variants=[dict(v, metadata_path=p.metadata_path) for v, p in zip(sweep["variants"], images)]
+    )
+    sheet = output.submit(
+        sweep["sheet"], base_dir=base_dir, prompt=sweep["prompt"], negative_prompt="",
+        params=sheet_params, watermark=watermark
+    ).result()
+    return {"images": images, "sheet": sheet}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a seed x guidance x negative prompt sweep of one prompt")
+    parser.add_argument("prompt")
+    parser.add_argument("--seeds", default="0,1,2", help="Comma-separated seeds")
+    parser.add_argument("--guidance", default="6,7.5,9,10.5", help="Comma-separated guidance scales")
+    parser.add_argument("--negative", action="append",
+                        help="Negative prompt; repeat to sweep several (default: none)")
+    parser.add_argument("--steps", type=int, help="Default: num_inference_steps from config/model_config.json")
+    parser.add_argument("--size", default="512x512", help="WIDTHxHEIGHT")
+    parser.add_argument("--scheduler", help="Default: scheduler from config/model_config.json")
+    parser.add_argument("--model", help="Default: model_name from config/model_config.json")
+    parser.add_argument("--output-dir", default=os.path.join("outputs", "sweeps"))
+    parser.add_argument("--thumb-px", type=int, default=256, help="Long side of the contact sheet's thumbnails")
+    parser.add_argument("--stub", action="store_true", help="Use the StubGenerator (no model needed)")
+    parser.add_argument("--no-watermark", action="store_true")
+    args = parser.parse_args()
+
+    from catalog import get_catalog
+    from output_formats import OutputPolicy
+    from postprocess import OutputPipeline
+    from utils import is_prompt_allowed, load_config
+
+    if not is_prompt_allowed(args.prompt):
+        raise SystemExit("The prompt violates the content guidelines")
+    config = load_config()
+    width, height = (int(x) for x in args.size.lower().split("x"))
+    steps = args.steps or config.get("default_generation_params", {}).get("num_inference_steps", 30)
+    negative_prompts = args.negative or [""]
+
+    if args.stub:
+        from stub_generator import StubGenerator
+        generator = StubGenerator()
+    else:
+        from model import Text2ImageGenerator
+        generator = Text2ImageGenerator(
+            model_name=args.model or config.get("model_name", "runwayml/stable-diffusion-v1-5"),
+            scheduler=args.scheduler or config.get("scheduler", "default"),
+            cpu_profile=config.get("cpu_profile"),
+            use_safetensors=config.get("startup", {}).get("use_safetensors"),
+            memory_budget_mb=config.get("memory", {}).get("budget_mb")
+        )
+
+    sweep = generator.generate_sweep(
+        args.prompt,
+        seeds=[int(s) for s in args.seeds.split(",")],
+        guidance_scales=[float(g) for g in args.guidance.split(",")],
+        negative_prompts=negative_prompts,
+        num_inference_steps=steps,
+        height=height,
+        width=width,
+        scheduler=args.scheduler,
+        thumb_px=args.thumb_px
+    )
+    telemetry = sweep["telemetry"]
+    print(f"{len(sweep['images'])} images in {telemetry.total_s:.1f}s "
+          f"(text encode {telemetry.text_encode_s:.2f}s, denoise {telemetry.denoise_s:.1f}s)")
+
+    output = OutputPipeline(
+        max_workers=config.get("output_pipeline", {}).get("workers", 4),
+        catalog=get_catalog(),
+        policy=OutputPolicy.from_config(config.get("output_formats"))
+    )
+    params = {
+        "steps": steps,
+        "steps_used": sweep["steps_used"],
+        "height": height,
+        "width": width,
+        "device": generator.device,
+        "model": generator.model_name,
+        "scheduler": args.scheduler or generator.default_scheduler
+    }
+    saved = save_sweep(sweep, output, args.output_dir, params, watermark=not args.no_watermark)
+    output.shutdown()
+    print(f"Contact sheet: {saved['sheet'].metadata['files'][saved['sheet'].policy.primary]}")
+
+
+if __name__ == "__main__":
+    main()
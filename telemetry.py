@@ -0,0 +1,319 @@
+# telemetry.py
+import json
+import os
+import threading
+import time
+from deadlines import DeadlineExceeded, GenerationCancelled
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+MEMORY_BUCKETS = tuple(2 ** n * 1024 ** 2 for n in range(6, 16))  # 64 MB .. 32 GB
+
+
+class GenerationTelemetry:
+    # Timings for one generate_batch() call. The generator fills it in as the
+    # diffusion loop runs and calls every listener after each step, so UIs can
+    # show real progress and an estimate of the time left. Preview listeners
+    # get cheap intermediate images every `preview_every` steps, as long as
+    # previews have cost less than `preview_budget` of the denoising time.
+    # should_cancel() is polled at every step and `deadline` (a time.time()
+    # value) bounds the call; the generator raises out of the loop when either
+    # trips, and trims the step count up front to fit the deadline.
+
+    def __init__(self, total_steps: int = 0, listeners: list = None, preview_listeners: list = None,
+                 preview_every: int = 0, preview_budget: float = 0.02, should_cancel=None,
+                 deadline: float = None, measure_memory: bool = False):
+        self.total_steps = total_steps
+        self.should_cancel = should_cancel
+        self.deadline = deadline
+        # False where the caller already fitted the steps (process pool workers)
+        self.fit_to_deadline = True
+        self.steps_requested = None
+        self.steps_used = None
+        self.listeners = list(listeners or [])
+        self.preview_listeners = list(preview_listeners or [])
+        self.preview_every = preview_every
+        self.preview_budget = preview_budget
+        self.preview_s = 0.0
+        self.previews = 0
+        self.skipped_previews = 0
+        self.batch_size = 0
+        self.height = 0
+        self.width = 0
+        self.text_encode_s = 0.0
+        self.step_s = []
+        self.decode_s = 0.0
+        self.expected_decode_s = 0.0
+        # Peak memory of the call (absolute, and above what was in use before);
+        # measured when measure_memory is set or a memory budget applies
+        self.measure_memory = measure_memory
+        self.peak_bytes = 0
+        self.peak_delta_bytes = 0
+        self.memory_plan = None
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self._last_mark = self.started_at
+
+    @property
+    def step(self) -> int:
+        return len(self.step_s)
+
+    @property
+    def denoise_s(self) -> float:
+        return sum(self.step_s)
+
+    @property
+    def total_s(self) -> float:
+        end = self.finished_at or time.perf_counter()
+        return end - self.started_at
+
+    @property
+    def eta_s(self) -> float:
+        # Recent steps predict the rest best (the first step pays warm-up costs)
+        remaining = max(self.total_steps - self.step, 0)
+        if self.finished_at is not None:
+            return 0.0
+        recent = self.step_s[-5:]
+        per_step = sum(recent) / len(recent) if recent else 0.0
+        return remaining * per_step + (self.decode_s or self.expected_decode_s)
+
+    @property
+    def remaining_s(self) -> float:
+        return None if self.deadline is None else self.deadline - time.time()
+
+    def check(self):
+        # Called by the generator between steps; raising there abandons the
+        # rest of the loop and the decode
+        if self.should_cancel is not None and self.should_cancel():
+            raise GenerationCancelled("Generation cancelled")
+        if self.deadline is None:
+            return
+        if time.time() > self.deadline:
+            raise DeadlineExceeded(f"Deadline exceeded after {self.step} steps")
+        # Steps planned without measurements can't be trusted to fit: once a
+        # few steps show they won't, stop now rather than at the deadline
+        if self.step >= 3 and time.time() + self.eta_s > self.deadline:
+            raise DeadlineExceeded(
+                f"Would finish ~{time.time() + self.eta_s - self.deadline:.1f}s past the deadline "
+                f"after {self.step}/{self.total_steps} steps"
+            )
+
+    def mark(self):
+        # Restarts the clock that the next step is measured from
+        self._last_mark = time.perf_counter()
+
+    def record_step(self):
+        now = time.perf_counter()
+        self.step_s.append(now - self._last_mark)
+        self._last_mark = now
+        self._notify()
+
+    def wants_preview(self) -> bool:
+        if not self.preview_listeners or self.preview_every <= 0 or self.step % self.preview_every:
+            return False
+        if self.preview_s > self.preview_budget * self.denoise_s:
+            self.skipped_previews += 1
+            return False
+        return True
+
+    def preview(self, render):
+        # render() returns one image per sample. Its cost and the listeners'
+        # count as preview time and are kept out of the next step's time.
+        start = time.perf_counter()
+        images = render()
+        if images:
+            for listener in self.preview_listeners:
+                try:
+                    listener(self, images)
+                except Exception as e:
+                    print(f"Preview listener failed: {e}")
+        self.previews += 1
+        self.preview_s += time.perf_counter() - start
+        self.mark()
+
+    def finish(self):
+        self.finished_at = time.perf_counter()
+        self._notify()
+
+    def _notify(self):
+        for listener in self.listeners:
+            try:
+                listener(self)
+            except Exception as e:
+                # A broken progress hook must not kill the generation
+                print(f"Telemetry listener failed: {e}")
+
+    def to_dict(self) -> dict:
+        return {
+            "batch_size": self.batch_size,
+            "height": self.height,
+            "width": self.width,
+            "step": self.step,
+            "total_steps": self.total_steps,
+            "steps_requested": self.steps_requested,
+            "steps_used": self.steps_used,
+            "text_encode_s": self.text_encode_s,
+            "denoise_s": self.denoise_s,
+            "decode_s": self.decode_s,
+            "preview_s": self.preview_s,
+            "previews": self.previews,
+            "total_s": self.total_s,
+            "eta_s": self.eta_s,
+            "peak_bytes": self.peak_bytes,
+            "peak_delta_bytes": self.peak_delta_bytes,
+            "memory_plan": self.memory_plan,
+            "step_s": list(self.step_s)
+        }
+
+
+class _Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class MetricsRegistry:
+    # Aggregates finished GenerationTelemetry records. Exported in Prometheus
+    # text format and, optionally, appended as one JSON line per generation.
+
+    def __init__(self, jsonl_path: str = None, prefix: str = "t2i"):
+        self.jsonl_path = jsonl_path
+        self.prefix = prefix
+        self.generations = 0
+        self.images = 0
+        self.steps = 0
+        self.trimmed_steps = 0
+        self.cancelled = 0
+        self.deadline_exceeded = 0
+        self._stages = {
+            "text_encode": _Histogram(), "denoise": _Histogram(), "decode": _Histogram(), "preview": _Histogram()
+        }
+        self._step = _Histogram()
+        self._total = _Histogram()
+        self._peak = _Histogram(MEMORY_BUCKETS)
+        self.gauges = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, telemetry: GenerationTelemetry, **labels):
+        with self._lock:
+            self.generations += 1
+            self.images += telemetry.batch_size
+            self.steps += telemetry.step
+            if telemetry.steps_requested and telemetry.steps_used:
+                self.trimmed_steps += telemetry.steps_requested - telemetry.steps_used
+            self._stages["text_encode"].observe(telemetry.text_encode_s)
+            self._stages["denoise"].observe(telemetry.denoise_s)
+            self._stages["decode"].observe(telemetry.decode_s)
+            self._stages["preview"].observe(telemetry.preview_s)
+            for step_s in telemetry.step_s:
+                self._step.observe(step_s)
+            self._total.observe(telemetry.total_s)
+            if telemetry.peak_bytes:
+                self._peak.observe(telemetry.peak_delta_bytes)
+
+        if self.jsonl_path:
+            record = dict(telemetry.to_dict(), time=time.time(), **labels)
+            os.makedirs(os.path.dirname(self.jsonl_path) or ".", exist_ok=True)
+            with self._lock, open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def record_cancelled(self, error: GenerationCancelled):
+        with self._lock:
+            if isinstance(error, DeadlineExceeded):
+                self.deadline_exceeded += 1
+            else:
+                self.cancelled += 1
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+
+    def set_counter(self, name: str, value: float):
+        # For totals counted elsewhere (name ends in _total); only ever grows
+        with self._lock:
+            self.counters[name] = value
+
+    def mean_step_s(self) -> float:
+        with self._lock:
+            return self._step.sum / self._step.count if self._step.count else 0.0
+
+    def mean_decode_s(self) -> float:
+        with self._lock:
+            decode = self._stages["decode"]
+            return decode.sum / decode.count if decode.count else 0.0
+
+    def _histogram_lines(self, name: str, histogram: _Histogram, labels: str = "") -> list:
+        sep = "," if labels else ""
+        lines = []
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {histogram.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {histogram.sum}")
+        lines.append(f"{name}_count{suffix} {histogram.count}")
+        return lines
+
+    def to_prometheus(self) -> str:
+        p = self.prefix
+        with self._lock:
+            lines = [
+                f"# HELP {p}_generations_total Pipeline calls completed.",
+                f"# TYPE {p}_generations_total counter",
+                f"{p}_generations_total {self.generations}",
+                f"# HELP {p}_images_total Images generated.",
+                f"# TYPE {p}_images_total counter",
+                f"{p}_images_total {self.images}",
+                f"# HELP {p}_steps_total Denoising steps run.",
+                f"# TYPE {p}_steps_total counter",
+                f"{p}_steps_total {self.steps}",
+                f"# HELP {p}_trimmed_steps_total Steps dropped to meet request deadlines.",
+                f"# TYPE {p}_trimmed_steps_total counter",
+                f"{p}_trimmed_steps_total {self.trimmed_steps}",
+                f"# HELP {p}_cancelled_total Pipeline calls stopped because every request was cancelled.",
+                f"# TYPE {p}_cancelled_total counter",
+                f"{p}_cancelled_total {self.cancelled}",
+                f"# HELP {p}_deadline_exceeded_total Pipeline calls stopped or refused for missing their deadline.",
+                f"# TYPE {p}_deadline_exceeded_total counter",
+                f"{p}_deadline_exceeded_total {self.deadline_exceeded}",
+                f"# HELP {p}_stage_seconds Time per generation stage.",
+                f"# TYPE {p}_stage_seconds histogram"
+            ]
+            for stage, histogram in self._stages.items():
+                lines += self._histogram_lines(f"{p}_stage_seconds", histogram, f'stage="{stage}"')
+            lines += [
+                f"# HELP {p}_step_seconds Latency of one denoising step for the whole batch.",
+                f"# TYPE {p}_step_seconds histogram"
+            ]
+            lines += self._histogram_lines(f"{p}_step_seconds", self._step)
+            lines += [
+                f"# HELP {p}_generation_seconds End-to-end latency of one pipeline call.",
+                f"# TYPE {p}_generation_seconds histogram"
+            ]
+            lines += self._histogram_lines(f"{p}_generation_seconds", self._total)
+            lines += [
+                f"# HELP {p}_peak_memory_bytes Peak working memory of one pipeline call, above the resident weights.",
+                f"# TYPE {p}_peak_memory_bytes histogram"
+            ]
+            lines += self._histogram_lines(f"{p}_peak_memory_bytes", self._peak)
+            for name, value in sorted(self.gauges.items()):
+                lines += [f"# TYPE {p}_{name} gauge", f"{p}_{name} {value}"]
+            for name, value in sorted(self.counters.items()):
+                lines += [f"# TYPE {p}_{name} counter", f"{p}_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        # For the node-exporter textfile collector; written atomically
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
@@ -1,86 +1,122 @@
 # utils.py
 import os
 import json
+import uuid
+import random
 from datetime import datetime
-from PIL import Image, ImageDraw, ImageFont
-
-# Simple banned words list for content filtering
-BANNED_KEYWORDS = [
-    "nude", "naked", "nsfw", "gore", "bloody", "violence", "sex"
-]
+from PIL import Image
+from prompt_filter import get_prompt_filter
+from watermark import get_watermark_renderer
+from output_formats import format_path, get_output_policy
+from storage import get_output_store, output_dir
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "model_config.json")
+
+def load_config(path: str = CONFIG_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def make_seeds(seed: int = None, count: int = 1) -> list:
+    # An explicit seed gives consecutive seeds per image; otherwise draw random
+    # ones so every saved image can still be reproduced from its metadata
+    if seed is None:
+        return [random.randrange(2 ** 32) for _ in range(count)]
+    return [int(seed) + i for i in range(count)]
 
 def is_prompt_allowed(prompt: str) -> bool:
-    lowered = prompt.lower()
-    for word in BANNED_KEYWORDS:
-        if word in lowered:
-            return False
-    return True
-
-def add_watermark(image: Image.Image, text: str = "AI GENERATED"):
-    img = image.copy()
-    draw = ImageDraw.Draw(img)
+    # Term list lives in config/banned_terms.txt; see prompt_filter.py
+    return get_prompt_filter().is_allowed(prompt)
 
-    width, height = img.size
-    font_size = int(width * 0.03)
+# Keywords each "Artistic style" choice of the app adds to the prompt
+STYLE_PROMPTS = {
+    "Photorealistic": "ultra realistic, 8k, professional photography, sharp focus, high dynamic range",
+    "Artistic / Painting": "oil painting, brush strokes, rich texture, artstation, highly detailed",
+    "Cartoon / Anime": "anime style, clean lines, cell shading, vibrant colors",
+    "Concept Art": "concept art, matte painting, dramatic lighting, highly detailed, cinematic"
+}
 
-    try:
-        font = ImageFont.truetype("arial.ttf", font_size)
-    except:
-        font = ImageFont.load_default()
+def apply_style(prompt_text: str, style_choice: str) -> str:
+    return f"{prompt_text}, {STYLE_PROMPTS.get(style_choice, '')}"
 
-    # NEW: use textbbox instead of textsize
-    bbox = draw.textbbox((0, 0), text, font=font)
-    text_width = bbox[2] - bbox[0]
-    text_height = bbox[3] - bbox[1]
-
-    padding = 10
-    x = width - text_width - padding
-    y = height - text_height - padding
-
-    # Semi-transparent rectangle
-    rect_x0 = x - 5
-    rect_y0 = y - 5
-    rect_x1 = x + text_width + 5
-    rect_y1 = y + text_height + 5
+def add_watermark(image: Image.Image, text: str = "AI GENERATED"):
+    # Overlay is rendered once per size and composited onto the corner only;
+    # see watermark.py (also has a NumPy batch version)
+    return get_watermark_renderer(text).apply(image)
 
-    draw.rectangle((rect_x0, rect_y0, rect_x1, rect_y1), fill=(0, 0, 0, 128))
-    draw.text((x, y), text, font=font, fill=(255, 255, 255))
 
-    return img
+def encode_image(image: Image.Image, policy=None) -> dict:
+    # {format: bytes} for the formats the output policy writes up front
+    # (PNG and quality-95 JPEG unless configured otherwise), encoded in memory
+    return (policy or get_output_policy()).encode_all(image)
 
 
-def save_image_with_metadata(
-    image: Image.Image,
+def prepare_output(
     base_dir: str,
     prompt: str,
     negative_prompt: str,
     params: dict,
-    index: int = 0
-):
-    os.makedirs(base_dir, exist_ok=True)
-
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename_base = f"img_{timestamp}_{index}"
-
-    png_path = os.path.join(base_dir, filename_base + ".png")
-    jpg_path = os.path.join(base_dir, filename_base + ".jpg")
-
-    image.save(png_path, format="PNG")
-    image.convert("RGB").save(jpg_path, format="JPEG", quality=95)
+    index: int = 0,
+    formats: list = ("png", "jpg")
+) -> tuple:
+    # Picks the output file names and builds the metadata, without touching disk.
+    # The random id keeps names unique when two requests save in the same second
+    # and picks the shard directory under base_dir (storage.output_dir).
+    # `formats` are the files written now, the first one being the primary.
+    now = datetime.now()
+    timestamp = now.strftime("%Y%m%d_%H%M%S")
+    image_id = uuid.uuid4().hex
+    filename_base = f"img_{timestamp}_{index}_{image_id[:12]}"
+    metadata_path = os.path.join(output_dir(base_dir, image_id, now), filename_base + ".json")
 
     metadata = {
+        "id": image_id,
         "prompt": prompt,
         "negative_prompt": negative_prompt,
         "timestamp": timestamp,
+        "created_at": now.isoformat(timespec="seconds"),
         "parameters": params,
-        "files": {
-            "png": png_path,
-            "jpg": jpg_path
-        }
+        "primary_format": formats[0],
+        "files": {fmt: format_path(metadata_path, fmt) for fmt in formats}
     }
+    return metadata, metadata_path
+
+
+def write_outputs(metadata: dict, metadata_path: str, encoded: dict, catalog=None):
+    # encoded: {format: bytes}, one per entry of metadata["files"].
+    # catalog: a catalog.Catalog to index the image in once its files exist
+    os.makedirs(os.path.dirname(metadata_path) or ".", exist_ok=True)
+
+    for fmt, data in encoded.items():
+        with open(metadata["files"][fmt], "wb") as f:
+            f.write(data)
 
-    metadata_path = os.path.join(base_dir, filename_base + ".json")
     with open(metadata_path, "w", encoding="utf-8") as f:
         json.dump(metadata, f, indent=4)
 
-    return png_path, jpg_path, metadata_path
+    store = get_output_store()
+    if store is not None:
+        store.add(metadata, metadata_path)
+    if catalog is not None:
+        catalog.add(metadata, metadata_path)
+
+
+def save_image_with_metadata(
+    image: Image.Image,
+    base_dir: str,
+    prompt: str,
+    negative_prompt: str,
+    params: dict,
+    index: int = 0,
+    catalog=None,
+    policy=None
+):
+    # Returns the PNG and JPEG paths (None for a format the policy doesn't
+    # write up front) and the metadata path
+    policy = policy or get_output_policy()
+    encoded = encode_image(image, policy)
+    metadata, metadata_path = prepare_output(base_dir, prompt, negative_prompt, params, index, list(encoded))
+    write_outputs(metadata, metadata_path, encoded, catalog=catalog)
+
+    return metadata["files"].get("png"), metadata["files"].get("jpg"), metadata_path
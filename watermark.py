@@ -0,0 +1,92 @@
+# watermark.py
+import functools
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+
+@functools.lru_cache(maxsize=32)
+def _load_font(font_path: str, size: int):
+    try:
+        return ImageFont.truetype(font_path, size)
+    except OSError:
+        try:
+            return ImageFont.load_default(size)
+        except TypeError:
+            # Pillow < 10.1 has a single fixed-size default font
+            return ImageFont.load_default()
+
+
+class WatermarkRenderer:
+    # Renders the translucent label once per image size and reuses it. Only
+    # the bottom-right box is touched when applying, and a whole batch of
+    # same-size images can be stamped as one NumPy array.
+
+    def __init__(self, text: str = "AI GENERATED", font_path: str = "arial.ttf",
+                 padding: int = 10, box_alpha: int = 128):
+        self.text = text
+        self.font_path = font_path
+        self.padding = padding
+        self.box_alpha = box_alpha
+        self._overlay = functools.lru_cache(maxsize=16)(self._render)
+
+    def _render(self, size: tuple):
+        # Returns (RGBA overlay, (x0, y0) in image coordinates, alpha, premultiplied rgb)
+        width, height = size
+        font = _load_font(self.font_path, max(int(width * 0.03), 1))
+
+        measure = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+        bbox = measure.textbbox((0, 0), self.text, font=font)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+
+        # Same placement as the original label: text inset by `padding` from
+        # the corner, on a box 5px larger on every side
+        x = width - text_width - self.padding
+        y = height - text_height - self.padding
+        box = (x - 5, y - 5, x + text_width + 5, y + text_height + 5)
+
+        overlay = Image.new("RGBA", (box[2] - box[0] + 1, box[3] - box[1] + 1), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(overlay)
+        draw.rectangle((0, 0, overlay.width - 1, overlay.height - 1), fill=(0, 0, 0, self.box_alpha))
+        draw.text((5, 5), self.text, font=font, fill=(255, 255, 255, 255))
+
+        # Clip to the image for very small sizes
+        x0, y0 = max(box[0], 0), max(box[1], 0)
+        overlay = overlay.crop((x0 - box[0], y0 - box[1], min(overlay.width, width - box[0]),
+                                min(overlay.height, height - box[1])))
+
+        rgba = np.asarray(overlay, dtype=np.float32) / 255.0
+        alpha = rgba[..., 3:4]
+        premultiplied = rgba[..., :3] * alpha * 255.0
+        return overlay, (x0, y0), alpha, premultiplied
+
+    def apply(self, image: Image.Image) -> Image.Image:
+        overlay, (x0, y0), _, _ = self._overlay(image.size)
+        box = (x0, y0, x0 + overlay.width, y0 + overlay.height)
+
+        img = image.copy()
+        region = img.crop(box)
+        if region.mode != "RGBA":
+            region = region.convert("RGBA")
+        region = Image.alpha_composite(region, overlay)
+        img.paste(region.convert(img.mode), box)
+        return img
+
+    def apply_batch(self, images: np.ndarray) -> np.ndarray:
+        # images: (N, H, W, 3) uint8; returns a new array of the same shape
+        if images.ndim != 4 or images.shape[-1] != 3:
+            raise ValueError(f"Expected an (N, H, W, 3) array, got shape {images.shape}")
+        height, width = images.shape[1:3]
+        overlay, (x0, y0), alpha, premultiplied = self._overlay((width, height))
+        y1, x1 = y0 + overlay.height, x0 + overlay.width
+
+        out = images.copy()
+        region = out[:, y0:y1, x0:x1, :].astype(np.float32)
+        blended = region * (1.0 - alpha) + premultiplied
+        out[:, y0:y1, x0:x1, :] = np.clip(blended + 0.5, 0, 255).astype(np.uint8)
+        return out
+
+
+@functools.lru_cache(maxsize=8)
+def get_watermark_renderer(text: str = "AI GENERATED") -> WatermarkRenderer:
+    return WatermarkRenderer(text)